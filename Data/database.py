@@ -14,8 +14,12 @@ Recommended GSI:
 
 from __future__ import annotations
 
+import logging
+import os
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from typing import Any
 
@@ -23,12 +27,34 @@ import boto3
 from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 
+from Data.event_sink import EventSink
 
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+
+logger = logging.getLogger(__name__)
+
+# DYNAMODB_ENDPOINT_URL points everything at DynamoDB Local / a stand-in
+DYNAMODB_ENDPOINT_URL = os.getenv("DYNAMODB_ENDPOINT_URL") or None
+
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1", endpoint_url=DYNAMODB_ENDPOINT_URL)
 users_table = dynamodb.Table("Users")
 sessions_table = dynamodb.Table("Sessions")
 behavioral_events_table = dynamodb.Table("BehavioralEvents")
 
+# BehavioralEvents rows get an expiresAt (epoch seconds) attribute so a
+# DynamoDB TTL on that attribute ages them out; 0 disables it.
+EVENTS_TTL_DAYS = int(os.getenv("EVENTS_TTL_DAYS", "90"))
+
+# BehavioralEvents writes from all requests share 25-item batches (Data/event_sink.py)
+EVENT_SINK_ENABLED = os.getenv("EVENT_SINK_ENABLED", "true").lower() == "true"
+event_sink = EventSink(
+    dynamodb,
+    "BehavioralEvents",
+    # boto3 resources aren't thread-safe: each flusher thread builds its own
+    resource_factory=lambda: boto3.session.Session().resource(
+        "dynamodb", region_name="us-east-1", endpoint_url=DYNAMODB_ENDPOINT_URL
+    ),
+) if EVENT_SINK_ENABLED else None
+
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 def _clean(obj: Any) -> Any:
@@ -54,6 +80,43 @@ def _to_dynamo(obj: Any) -> Any:
     return obj
 
 
+def _expires_at(now_ms: int) -> int | None:
+    if EVENTS_TTL_DAYS <= 0:
+        return None
+    return now_ms // 1000 + EVENTS_TTL_DAYS * 86400
+
+
+def _projection(fields: list[str] | None) -> dict:
+    """ProjectionExpression kwargs; every name goes through a placeholder
+    because `timestamp` is a DynamoDB reserved word."""
+    if not fields:
+        return {}
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+class _RateLimiter:
+    """Shared pacing across threads: at most `rate` acquisitions per second."""
+
+    def __init__(self, rate: float | None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
 # ── Users ─────────────────────────────────────────────────────────────────────
 def create_user(username: str, password_hash: str) -> dict | None:
     user_id = str(uuid.uuid4())
@@ -67,10 +130,10 @@ def create_user(username: str, password_hash: str) -> dict | None:
     }
     try:
         users_table.put_item(Item=item)
-        print(f"[DB] User created: {user_id}")
+        logger.info("User created: %s", user_id)
         return item
     except ClientError as e:
-        print(f"[DB ERROR] create_user: {e.response['Error']['Message']}")
+        logger.error("create_user: %s", e.response["Error"]["Message"])
         return None
 
 
@@ -80,7 +143,7 @@ def get_user(user_id: str) -> dict | None:
         response = users_table.get_item(Key={"userId": user_id})
         return _clean(response.get("Item"))
     except ClientError as e:
-        print(f"[DB ERROR] get_user: {e.response['Error']['Message']}")
+        logger.error("get_user: %s", e.response["Error"]["Message"])
         return None
 
 
@@ -97,24 +160,46 @@ def get_user_by_username(username: str) -> dict | None:
         items = response.get("Items", [])
         return _clean(items[0]) if items else None
     except ClientError as e:
-        print(f"[DB ERROR] get_user_by_username: {e.response['Error']['Message']}")
+        logger.error("get_user_by_username: %s", e.response["Error"]["Message"])
         return None
 
 
 
-def update_behavior_profile(user_id: str, profile_data: dict) -> bool:
+def update_behavior_profile(user_id: str, profile_data: dict, expected_count: int | None = None) -> bool:
+    """Replace Users.behaviorProfile.
+
+    expected_count makes the write conditional on the stored profile count,
+    so two concurrent sessions can't silently overwrite each other's update
+    (the loser returns False and its sample is dropped).
+    """
+    kwargs: dict[str, Any] = {}
+    if expected_count is not None:
+        kwargs["ExpressionAttributeNames"] = {"#c": "count"}
+        if expected_count == 0:
+            kwargs["ConditionExpression"] = "attribute_not_exists(behaviorProfile.#c) OR behaviorProfile.#c = :prev"
+        else:
+            kwargs["ConditionExpression"] = "behaviorProfile.#c = :prev"
+
+    expr_values = {
+        ":profile": _to_dynamo(profile_data),
+        ":ts": int(time.time() * 1000),
+    }
+    if expected_count is not None:
+        expr_values[":prev"] = expected_count
+
     try:
         users_table.update_item(
             Key={"userId": user_id},
             UpdateExpression="SET behaviorProfile = :profile, updatedAt = :ts",
-            ExpressionAttributeValues={
-                ":profile": _to_dynamo(profile_data),
-                ":ts": int(time.time() * 1000),
-            },
+            ExpressionAttributeValues=expr_values,
+            **kwargs,
         )
         return True
     except ClientError as e:
-        print(f"[DB ERROR] update_behavior_profile: {e.response['Error']['Message']}")
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            logger.info("update_behavior_profile: concurrent update for %s, sample dropped", user_id)
+            return False
+        logger.error("update_behavior_profile: %s", e.response["Error"]["Message"])
         return False
 
 
@@ -130,10 +215,10 @@ def create_session(user_id: str) -> dict | None:
     }
     try:
         sessions_table.put_item(Item=item)
-        print(f"[DB] Session created: {session_id}")
+        logger.debug("Session created: %s", session_id)
         return item
     except ClientError as e:
-        print(f"[DB ERROR] create_session: {e.response['Error']['Message']}")
+        logger.error("create_session: %s", e.response["Error"]["Message"])
         return None
 
 
@@ -152,7 +237,7 @@ def get_session(session_id: str, user_id: str | None = None) -> dict | None:
         items = response.get("Items", [])
         return _clean(items[0]) if items else None
     except ClientError as e:
-        print(f"[DB ERROR] get_session: {e.response['Error']['Message']}")
+        logger.error("get_session: %s", e.response["Error"]["Message"])
         return None
 
 
@@ -165,6 +250,7 @@ def update_session_result(
     is_owner: bool | None = None,
     model_name: str | None = None,
     threshold: float | None = None,
+    attribution: dict | None = None,
 ) -> bool:
     try:
         update_expr = "SET mlScore = :score, isBot = :bot, #s = :status, completedAt = :ts"
@@ -187,6 +273,11 @@ def update_session_result(
             update_expr += ", threshold = :threshold"
             expr_values[":threshold"] = Decimal(str(threshold))
 
+        if attribution:
+            # Top features per model, a few dozen bytes: {model: {method, features}}
+            update_expr += ", attribution = :attribution"
+            expr_values[":attribution"] = _to_dynamo(attribution)
+
         sessions_table.update_item(
             Key={"sessionId": session_id, "userId": user_id},
             UpdateExpression=update_expr,
@@ -195,7 +286,7 @@ def update_session_result(
         )
         return True
     except ClientError as e:
-        print(f"[DB ERROR] update_session_result: {e.response['Error']['Message']}")
+        logger.error("update_session_result: %s", e.response["Error"]["Message"])
         return False
 
 
@@ -211,7 +302,7 @@ def get_recent_sessions(limit: int = 20) -> list:
         )
         return _clean(response.get("Items", []))
     except ClientError as e:
-        print(f"[DB ERROR] get_recent_sessions: {e.response['Error']['Message']}")
+        logger.error("get_recent_sessions: %s", e.response["Error"]["Message"])
 
     try:
         response = sessions_table.scan()
@@ -231,7 +322,7 @@ def get_user_sessions(user_id: str) -> list:
         )
         return _clean(response.get("Items", []))
     except ClientError as e:
-        print(f"[DB ERROR] get_user_sessions: {e.response['Error']['Message']}")
+        logger.error("get_user_sessions: %s", e.response["Error"]["Message"])
         return []
 
 
@@ -246,7 +337,7 @@ def save_behavior_payload(session_id: str, user_id: str, behavior: dict) -> bool
         )
         return True
     except ClientError as e:
-        print(f"[DB ERROR] save_behavior_payload: {e.response['Error']['Message']}")
+        logger.error("save_behavior_payload: %s", e.response["Error"]["Message"])
         return False
 
 
@@ -269,12 +360,18 @@ def log_behavioral_event(
     }
     if user_id is not None:
         item["userId"] = user_id
+    expires_at = _expires_at(event_ts)
+    if expires_at is not None:
+        item["expiresAt"] = expires_at
+
+    if event_sink is not None:
+        return event_sink.submit([item])
 
     try:
         behavioral_events_table.put_item(Item=item)
         return True
     except ClientError as e:
-        print(f"[DB ERROR] log_behavioral_event: {e.response['Error']['Message']}")
+        logger.error("log_behavioral_event: %s", e.response["Error"]["Message"])
         return False
 
 
@@ -298,6 +395,9 @@ def save_behavior_events(
 
     Timestamps are offset by +1 ms per event to guarantee unique composite keys
     for the same sessionId even when all writes happen in one request.
+
+    With the event sink enabled the items are queued and written in shared
+    25-item batches shortly after; True then means "accepted".
     """
     try:
         base_ts = int(time.time() * 1000)
@@ -331,35 +431,88 @@ def save_behavior_events(
         if not items:
             return True
 
+        expires_at = _expires_at(base_ts)
+        if expires_at is not None:
+            for item in items:
+                item["expiresAt"] = expires_at
+
+        if event_sink is not None:
+            return event_sink.submit(items)
+
         with behavioral_events_table.batch_writer() as batch:
             for item in items:
                 batch.put_item(Item=item)
 
         return True
     except ClientError as e:
-        print(f"[DB ERROR] save_behavior_events: {e.response['Error']['Message']}")
+        logger.error("save_behavior_events: %s", e.response["Error"]["Message"])
         return False
 
 
 
-def get_session_events(session_id: str) -> list:
+def event_sink_snapshot() -> dict | None:
+    """Batch size / latency / failure metrics of the BehavioralEvents sink."""
+    return event_sink.snapshot() if event_sink is not None else None
+
+
+
+def iter_session_events(
+    session_id: str,
+    fields: list[str] | None = None,
+    limit: int | None = None,
+    page_size: int | None = None,
+):
+    """Yield a session's events in timestamp order, following pagination.
+
+    fields:    attributes to project (default: whole item)
+    limit:     stop after this many events (None: all)
+    page_size: items per query page
+
+    A ClientError is logged and re-raised, also mid-iteration, so callers
+    can tell a truncated stream from a complete one.
+    """
+    kwargs: dict[str, Any] = {
+        "KeyConditionExpression": Key("sessionId").eq(session_id),
+        "ScanIndexForward": True,
+        **_projection(fields),
+    }
+    yielded = 0
+    if limit is not None and limit <= 0:
+        return
     try:
-        response = behavioral_events_table.query(
-            KeyConditionExpression=Key("sessionId").eq(session_id),
-            ScanIndexForward=True,
-        )
-        return _clean(response.get("Items", []))
+        while True:
+            remaining = limit - yielded if limit is not None else None
+            page = min(filter(None, (page_size, remaining)), default=None)
+            if page:
+                kwargs["Limit"] = page
+            response = behavioral_events_table.query(**kwargs)
+            for item in response.get("Items", []):
+                yield _clean(item)
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return
+            kwargs["ExclusiveStartKey"] = last_key
     except ClientError as e:
-        print(f"[DB ERROR] get_session_events: {e.response['Error']['Message']}")
+        logger.error("iter_session_events: %s", e.response["Error"]["Message"])
+        raise
+
+
+
+def get_session_events(session_id: str, limit: int | None = None) -> list:
+    try:
+        return list(iter_session_events(session_id, limit=limit))
+    except ClientError:
         return []
 
 
 
 def delete_session_events(session_id: str) -> bool:
     try:
-        events = get_session_events(session_id)
         with behavioral_events_table.batch_writer() as batch:
-            for event in events:
+            for event in iter_session_events(session_id, fields=["sessionId", "timestamp"]):
                 batch.delete_item(
                     Key={
                         "sessionId": event["sessionId"],
@@ -368,5 +521,76 @@ def delete_session_events(session_id: str) -> bool:
                 )
         return True
     except ClientError as e:
-        print(f"[DB ERROR] delete_session_events: {e.response['Error']['Message']}")
+        logger.error("delete_session_events: %s", e.response["Error"]["Message"])
         return False
+
+
+
+class PurgeIncomplete(Exception):
+    """Some scan segments of purge_events_older_than failed."""
+
+    def __init__(self, count: int, failed: dict):
+        self.count = count          # rows deleted (or matched) before and around the failures
+        self.failed = failed        # segment -> error message
+        super().__init__(f"{len(failed)} segment(s) failed after {count} rows: "
+                         + "; ".join(f"{k}: {v}" for k, v in sorted(failed.items())))
+
+
+def purge_events_older_than(
+    days: float,
+    segments: int = 4,
+    max_deletes_per_s: float | None = None,
+    dry_run: bool = False,
+) -> int:
+    """Delete BehavioralEvents rows older than `days` across all sessions.
+
+    Parallel segmented scan (one thread per segment) projecting only the
+    key, with batched deletes. max_deletes_per_s is shared by all threads
+    to keep write capacity for live traffic. Returns the number of rows
+    deleted (or matched, with dry_run).
+
+    A segment that hits a ClientError stops there; the others finish. Then
+    PurgeIncomplete is raised with the partial total and the failed segments.
+    """
+    cutoff = int((time.time() - days * 86400) * 1000)
+    limiter = _RateLimiter(max_deletes_per_s)
+
+    failed = {}
+
+    def purge_segment(segment: int) -> int:
+        kwargs: dict[str, Any] = {
+            "FilterExpression": Attr("timestamp").lt(cutoff),
+            "Segment": segment,
+            "TotalSegments": segments,
+            **_projection(["sessionId", "timestamp"]),
+        }
+        # boto3 resources aren't thread-safe: one per segment thread
+        table = boto3.session.Session().resource(
+            "dynamodb", region_name="us-east-1", endpoint_url=DYNAMODB_ENDPOINT_URL
+        ).Table("BehavioralEvents")
+        count = 0
+        try:
+            with table.batch_writer() as batch:
+                while True:
+                    response = table.scan(**kwargs)
+                    for item in response.get("Items", []):
+                        if not dry_run:
+                            limiter.acquire()
+                            batch.delete_item(Key={"sessionId": item["sessionId"], "timestamp": item["timestamp"]})
+                        count += 1
+                    last_key = response.get("LastEvaluatedKey")
+                    if not last_key:
+                        return count
+                    kwargs["ExclusiveStartKey"] = last_key
+        except ClientError as e:
+            # count includes rows still queued in the batch, so it's an upper bound
+            failed[segment] = e.response["Error"]["Message"]
+            logger.error("purge_events_older_than: segment %d/%d failed after %d rows: %s",
+                         segment, segments, count, failed[segment])
+            return count
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        total = sum(pool.map(purge_segment, range(segments)))
+    if failed:
+        raise PurgeIncomplete(total, failed)
+    return total
@@ -0,0 +1,226 @@
+"""
+event_sink.py
+CacheMeOutside - process-wide batched writer for BehavioralEvents
+
+save_behavior_events() used to open a batch_writer per request and send
+about six items in a request that can carry 25. This sink takes event
+items from every request in the process and flushes them as full 25-item
+BatchWriteItem calls. A partial batch is sent once its oldest item has
+waited EVENT_SINK_FLUSH_MS.
+
+  - UnprocessedItems and throttling errors are retried with exponential
+    backoff and full jitter, up to EVENT_SINK_MAX_RETRIES times. Items
+    still unwritten after that are counted as failed and logged.
+  - A batch never holds two items with the same key (DynamoDB rejects
+    such a batch); the later item wins.
+  - When the queue is full, submit() writes the caller's items itself, as
+    before, so a slow table backs up into request latency and nothing is
+    dropped.
+  - boto3 resources aren't thread-safe, so each flusher thread writes
+    through its own resource from resource_factory. Inline writes use the
+    shared one, like every other request-path call.
+  - Queued items are lost if the process dies before flushing. stop() (also
+    run at exit) drains the queue first.
+
+snapshot() reports flush sizes, flush latency percentiles, retries and
+failures.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 25        # DynamoDB BatchWriteItem maximum
+FLUSH_S = float(os.getenv("EVENT_SINK_FLUSH_MS", "50")) / 1000
+QUEUE_SIZE = int(os.getenv("EVENT_SINK_QUEUE_SIZE", "10000"))
+WORKERS = int(os.getenv("EVENT_SINK_WORKERS", "2"))
+MAX_RETRIES = int(os.getenv("EVENT_SINK_MAX_RETRIES", "8"))
+BACKOFF_BASE_S = 0.05
+BACKOFF_MAX_S = 2.0
+
+_RETRYABLE = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError",
+}
+
+
+def _percentile(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(p * len(values)), len(values) - 1)]
+
+
+class EventSink:
+    def __init__(self, dynamodb, table_name: str, key_names: tuple = ("sessionId", "timestamp"),
+                 flush_s: float = FLUSH_S, queue_size: int = QUEUE_SIZE, workers: int = WORKERS,
+                 max_retries: int = MAX_RETRIES, resource_factory=None):
+        self.dynamodb = dynamodb        # boto3 service resource (plain Python types in and out)
+        self.resource_factory = resource_factory    # builds one resource per flusher thread
+        self.table_name = table_name
+        self.key_names = key_names
+        self.flush_s = flush_s
+        self.workers = workers
+        self.max_retries = max_retries
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads: list = []
+        self._start_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.retries = 0
+        self.unprocessed = 0
+        self.inline_writes = 0          # queue was full, caller wrote its own items
+        self._sizes = deque(maxlen=1000)
+        self._latencies_ms = deque(maxlen=1000)
+
+    # ── Request side ──────────────────────────────────────────────────────
+    def submit(self, items: list) -> bool:
+        """Queue items for the next batch. Never waits on DynamoDB unless the queue is full."""
+        if not items:
+            return True
+        self.start()
+        for i, item in enumerate(items):
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._lock:
+                    self.submitted += i
+                    self.inline_writes += 1
+                return self.write(items[i:])
+        with self._lock:
+            self.submitted += len(items)
+        return True
+
+    # ── Flushing ──────────────────────────────────────────────────────────
+    def _dedupe(self, items: list) -> list:
+        by_key = {}
+        for item in items:
+            by_key[tuple(item[k] for k in self.key_names)] = item
+        return list(by_key.values())
+
+    def write(self, items: list, dynamodb=None) -> bool:
+        """BatchWriteItem in chunks of 25 with UnprocessedItems retries. True if all landed."""
+        ok = True
+        items = self._dedupe(items)
+        for start in range(0, len(items), BATCH_LIMIT):
+            ok &= self._write_batch(items[start:start + BATCH_LIMIT], dynamodb or self.dynamodb)
+        return ok
+
+    def _write_batch(self, batch: list, dynamodb) -> bool:
+        started = time.perf_counter()
+        pending = [{"PutRequest": {"Item": item}} for item in batch]
+        attempt = 0
+        while pending:
+            try:
+                response = dynamodb.batch_write_item(RequestItems={self.table_name: pending})
+                pending = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                if pending:
+                    with self._lock:
+                        self.unprocessed += len(pending)
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code not in _RETRYABLE:
+                    logger.error("event sink: batch of %d failed: %s", len(pending), e.response["Error"]["Message"])
+                    break
+            if not pending:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                break
+            with self._lock:
+                self.retries += 1
+            # Full jitter: sleep uniformly in [0, min(cap, base * 2^attempt)]
+            time.sleep(random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)))
+
+        with self._lock:
+            self.batches += 1
+            self.written += len(batch) - len(pending)
+            self.failed += len(pending)
+            self._sizes.append(len(batch))
+            self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        if pending:
+            logger.error("event sink: gave up on %d BehavioralEvents items after %d attempts",
+                         len(pending), attempt)
+        return not pending
+
+    def _next_batch(self) -> list:
+        """Blocks for a first item, then fills up to 25 until the flush deadline."""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_s
+        while len(batch) < BATCH_LIMIT:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        dynamodb = self.resource_factory() if self.resource_factory else self.dynamodb
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self.write(batch, dynamodb)
+                except Exception as e:
+                    with self._lock:
+                        self.failed += len(batch)
+                    logger.error("event sink: flush failed: %s", e)
+
+    def start(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(max(self.workers, 1)):
+                thread = threading.Thread(target=self._run, name=f"event-sink-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is queued, then stop the workers."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            sizes = list(self._sizes)
+            latencies = list(self._latencies_ms)
+            return {
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "retries": self.retries,
+                "unprocessed_items": self.unprocessed,
+                "inline_writes": self.inline_writes,
+                "mean_batch_size": sum(sizes) / len(sizes) if sizes else None,
+                "flush_p50_ms": _percentile(latencies, 0.50),
+                "flush_p99_ms": _percentile(latencies, 0.99),
+            }
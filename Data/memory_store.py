@@ -0,0 +1,264 @@
+"""
+memory_store.py
+CacheMeOutside - in-process stand-in for the DynamoDB interface layer
+
+Same functions and return shapes as database.py, backed by dicts guarded
+by one lock. Selected with STORAGE_BACKEND=memory. It lets the API and the
+load tester (Model/login_auth/benchmarks/load_test.py) run on a laptop with
+no AWS credentials and no network. Data lives only as long as the process.
+
+MEMORY_STORE_LATENCY_MS adds a sleep to every call, which approximates
+DynamoDB round trips when capacity planning.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import threading
+import time
+import uuid
+from typing import Any
+
+LATENCY_S = float(os.getenv("MEMORY_STORE_LATENCY_MS", "0")) / 1000
+EVENTS_TTL_DAYS = int(os.getenv("EVENTS_TTL_DAYS", "90"))
+
+_lock = threading.Lock()
+_users: dict[str, dict] = {}
+_user_ids_by_name: dict[str, str] = {}
+_sessions: dict[str, dict] = {}
+_events: dict[str, dict[int, dict]] = {}   # sessionId -> timestamp -> item
+
+
+def _io():
+    if LATENCY_S:
+        time.sleep(LATENCY_S)
+
+
+def _expires_at(now_ms: int) -> int | None:
+    if EVENTS_TTL_DAYS <= 0:
+        return None
+    return now_ms // 1000 + EVENTS_TTL_DAYS * 86400
+
+
+# ── Users ─────────────────────────────────────────────────────────────────────
+def create_user(username: str, password_hash: str) -> dict | None:
+    _io()
+    item = {
+        "userId": str(uuid.uuid4()),
+        "username": username,
+        "passwordHash": password_hash,
+        "createdAt": int(time.time() * 1000),
+        "behaviorProfile": {},
+    }
+    with _lock:
+        _users[item["userId"]] = item
+        _user_ids_by_name[username] = item["userId"]
+    return copy.deepcopy(item)
+
+
+def get_user(user_id: str) -> dict | None:
+    _io()
+    with _lock:
+        return copy.deepcopy(_users.get(user_id))
+
+
+def get_user_by_username(username: str) -> dict | None:
+    _io()
+    with _lock:
+        user_id = _user_ids_by_name.get(username)
+        return copy.deepcopy(_users[user_id]) if user_id else None
+
+
+def update_behavior_profile(user_id: str, profile_data: dict, expected_count: int | None = None) -> bool:
+    _io()
+    with _lock:
+        user = _users.get(user_id)
+        if user is None:
+            return False
+        if expected_count is not None and user["behaviorProfile"].get("count", 0) != expected_count:
+            return False
+        user["behaviorProfile"] = copy.deepcopy(profile_data)
+        user["updatedAt"] = int(time.time() * 1000)
+        return True
+
+
+# ── Sessions ──────────────────────────────────────────────────────────────────
+def create_session(user_id: str) -> dict | None:
+    _io()
+    item = {
+        "sessionId": str(uuid.uuid4()),
+        "userId": user_id,
+        "createdAt": int(time.time() * 1000),
+        "status": "in_progress",
+    }
+    with _lock:
+        _sessions[item["sessionId"]] = item
+    return dict(item)
+
+
+def get_session(session_id: str, user_id: str | None = None) -> dict | None:
+    _io()
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is None or (user_id and session["userId"] != user_id):
+            return None
+        return copy.deepcopy(session)
+
+
+def update_session_result(
+    session_id: str,
+    user_id: str,
+    ml_score: float,
+    is_bot: bool,
+    is_owner: bool | None = None,
+    model_name: str | None = None,
+    threshold: float | None = None,
+    attribution: dict | None = None,
+) -> bool:
+    _io()
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is None or session["userId"] != user_id:
+            return False
+        session.update({
+            "mlScore": ml_score,
+            "isBot": is_bot,
+            "status": "completed",
+            "completedAt": int(time.time() * 1000),
+        })
+        if is_owner is not None:
+            session["isOwner"] = is_owner
+        if model_name is not None:
+            session["model"] = model_name
+        if threshold is not None:
+            session["threshold"] = threshold
+        if attribution:
+            session["attribution"] = copy.deepcopy(attribution)
+        return True
+
+
+def get_recent_sessions(limit: int = 20) -> list:
+    _io()
+    with _lock:
+        completed = [s for s in _sessions.values() if s["status"] == "completed"]
+        completed.sort(key=lambda s: s["createdAt"], reverse=True)
+        return copy.deepcopy(completed[:limit])
+
+
+def get_user_sessions(user_id: str) -> list:
+    _io()
+    with _lock:
+        return copy.deepcopy([s for s in _sessions.values() if s["userId"] == user_id])
+
+
+def save_behavior_payload(session_id: str, user_id: str, behavior: dict) -> bool:
+    _io()
+    with _lock:
+        session = _sessions.get(session_id)
+        if session is None or session["userId"] != user_id:
+            return False
+        session["behaviorPayload"] = copy.deepcopy(behavior)
+        return True
+
+
+# ── Behavioral Events ─────────────────────────────────────────────────────────
+def _put_event(item: dict):
+    expires_at = _expires_at(item["timestamp"])
+    if expires_at is not None:
+        item["expiresAt"] = expires_at
+    with _lock:
+        _events.setdefault(item["sessionId"], {})[item["timestamp"]] = item
+
+
+def log_behavioral_event(
+    session_id: str,
+    event_type: str,
+    event_data: dict,
+    *,
+    user_id: str | None = None,
+    timestamp: int | None = None,
+) -> bool:
+    _io()
+    item = {
+        "sessionId": session_id,
+        "timestamp": int(time.time() * 1000) if timestamp is None else int(timestamp),
+        "eventType": event_type,
+        "eventData": copy.deepcopy(event_data),
+    }
+    if user_id is not None:
+        item["userId"] = user_id
+    _put_event(item)
+    return True
+
+
+def save_behavior_events(
+    session_id: str,
+    user_id: str,
+    behavior: dict,
+    inference: dict | None = None,
+) -> bool:
+    """Same rows as database.save_behavior_events: one per group + inference."""
+    _io()
+    base_ts = int(time.time() * 1000)
+    items: list[dict[str, Any]] = []
+    for idx, group in enumerate(["mouse", "keyboard", "interaction", "timing", "environment"]):
+        group_data = behavior.get(group)
+        if isinstance(group_data, dict) and group_data:
+            items.append({"sessionId": session_id, "timestamp": base_ts + idx, "userId": user_id,
+                          "eventType": group, "eventData": copy.deepcopy(group_data)})
+    if inference:
+        items.append({"sessionId": session_id, "timestamp": base_ts + len(items), "userId": user_id,
+                      "eventType": "inference_result", "eventData": dict(inference)})
+    for item in items:
+        _put_event(item)
+    return True
+
+
+def iter_session_events(
+    session_id: str,
+    fields: list[str] | None = None,
+    limit: int | None = None,
+    page_size: int | None = None,
+):
+    _io()
+    with _lock:
+        events = [copy.deepcopy(e) for _, e in sorted(_events.get(session_id, {}).items())]
+    if limit is not None:
+        events = events[:max(limit, 0)]
+    for event in events:
+        yield {k: v for k, v in event.items() if k in fields} if fields else event
+
+
+def get_session_events(session_id: str, limit: int | None = None) -> list:
+    return list(iter_session_events(session_id, limit=limit))
+
+
+def delete_session_events(session_id: str) -> bool:
+    _io()
+    with _lock:
+        _events.pop(session_id, None)
+    return True
+
+
+def event_sink_snapshot() -> dict | None:
+    """Writes are synchronous dict inserts here; there is no sink."""
+    return None
+
+
+def purge_events_older_than(
+    days: float,
+    segments: int = 4,
+    max_deletes_per_s: float | None = None,
+    dry_run: bool = False,
+) -> int:
+    cutoff = int((time.time() - days * 86400) * 1000)
+    count = 0
+    with _lock:
+        for session_events in _events.values():
+            old = [ts for ts in session_events if ts < cutoff]
+            count += len(old)
+            if not dry_run:
+                for ts in old:
+                    del session_events[ts]
+    return count
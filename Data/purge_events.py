@@ -0,0 +1,52 @@
+"""
+purge_events.py
+CacheMeOutside - BehavioralEvents retention job
+
+Deletes events older than --days across every session with a parallel
+segmented scan and batched deletes, paced by --rate (deletes per second,
+shared by all segments) so live traffic keeps its write capacity.
+
+New rows also carry an expiresAt attribute (EVENTS_TTL_DAYS). With TTL
+enabled on that attribute the table ages out on its own, and this job only
+has to clean up rows written before TTL existed:
+
+    aws dynamodb update-time-to-live --table-name BehavioralEvents \\
+        --time-to-live-specification "Enabled=true, AttributeName=expiresAt"
+
+Usage (from the repo root):
+    python Data/purge_events.py --days 90 --segments 8 --rate 200
+    python Data/purge_events.py --days 90 --dry-run
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Data.database import PurgeIncomplete, purge_events_older_than
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, required=True, help="delete events older than this")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments / threads")
+    parser.add_argument("--rate", type=float, default=None, help="max deletes per second (default: unpaced)")
+    parser.add_argument("--dry-run", action="store_true", help="count matching events, delete nothing")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    verb = "Matched" if args.dry_run else "Deleted"
+    try:
+        count = purge_events_older_than(
+            args.days,
+            segments=args.segments,
+            max_deletes_per_s=args.rate,
+            dry_run=args.dry_run,
+        )
+    except PurgeIncomplete as e:
+        print(f"{verb} {e.count} events older than {args.days} days in {time.perf_counter() - start:.1f}s, "
+              f"incomplete: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"{verb} {count} events older than {args.days} days in {time.perf_counter() - start:.1f}s")
@@ -45,6 +45,9 @@ export default function LoginForm({ onLogin }) {
     validateBehavior(behaviorData);
     setBehavior(behaviorData);
 
+    // One key per submission: a retried request gets the first response back
+    const idempotencyKey = crypto.randomUUID();
+
     const payload = {
       username,
       password,
@@ -63,6 +66,7 @@ export default function LoginForm({ onLogin }) {
         headers: {
           "Content-Type": "application/json",
           "ngrok-skip-browser-warning": "true",
+          "Idempotency-Key": idempotencyKey,
         },
         body: JSON.stringify(payload),
       });
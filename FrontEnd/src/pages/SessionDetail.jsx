@@ -102,6 +102,13 @@ export default function SessionDetail() {
   const timing = behavior?.timing || {};
   const inter = behavior?.interaction || {};
 
+  // Top features per model, stored with the session at scoring time
+  const attribution = session.attribution || {};
+  const methodLabel = {
+    reconstruction_error: "share of reconstruction error",
+    scaled_deviation: "std devs from the user's training mean",
+  };
+
   function timeAgo(ts) {
     if (!ts) return "—";
     const diff = Date.now() - ts;
@@ -138,6 +145,22 @@ export default function SessionDetail() {
       <div>{risk.toFixed(4)}</div>
       <div>risk score</div>
 
+      {Object.entries(attribution).map(([model, attr]) => (
+        <div key={model}>
+          <h3>Top features · {model} ({methodLabel[attr.method] ?? attr.method})</h3>
+          <ul>
+            {Object.entries(attr.features || {})
+              .sort((a, b) => Math.abs(b[1]) - Math.abs(a[1]))
+              .map(([feature, value]) => (
+                <li key={feature}>
+                  {feature}{" "}
+                  {attr.method === "reconstruction_error" ? `${(value * 100).toFixed(1)}%` : fmt(value, 2)}
+                </li>
+              ))}
+          </ul>
+        </div>
+      ))}
+
       <h3>Mouse Behavior</h3>
       <ul>
         <li>Total moves {fmt(mouse.total_moves, 0)}</li>
@@ -177,7 +200,7 @@ export default function SessionDetail() {
         <li>Verdict {status}</li>
         <li>Created {session.createdAt ? new Date(session.createdAt).toLocaleString() : "—"}</li>
         <li>Completed {session.completedAt ? new Date(session.completedAt).toLocaleString() : "—"}</li>
-        <li>Behavior events {Array.isArray(session.behaviorEvents) ? session.behaviorEvents.length : 0}</li>
+        <li>Behavior events {session.behaviorEventCount ?? (Array.isArray(session.behaviorEvents) ? session.behaviorEvents.length : 0)}</li>
       </ul>
     </div>
   );
@@ -7,7 +7,112 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 AUTOENCODER_DIR = os.path.join(BASE_DIR, 'saved_models', 'autoencoder')
 USERS_MODEL_DIR = os.path.join(BASE_DIR, 'saved_models', 'user')
 
+# Versioned model registry (hot reload). Falls back to the dirs above when empty.
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(BASE_DIR, 'saved_models', 'registry'))
+REGISTRY_POLL_S = float(os.getenv("REGISTRY_POLL_S", "30"))
+# Scratch space for training runs; artifacts are published from here, never from the dirs above
+MODEL_STAGING_DIR = os.getenv("MODEL_STAGING_DIR", os.path.join(BASE_DIR, 'saved_models', 'staging'))
+
 # Enviornment
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 DEBUG = ENVIRONMENT == "development"
 
+# Persistence: "dynamodb" (Data/database.py) or "memory" (Data/memory_store.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "dynamodb")
+
+# Streaming session accumulators (raw events posted during a session)
+STREAM_SESSION_TTL_S = float(os.getenv("STREAM_SESSION_TTL_S", "900"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "50000"))
+
+# Serve weights / scalers from memory-mapped .npy artifacts shared across workers
+USE_MMAP_ARTIFACTS = os.getenv("USE_MMAP_ARTIFACTS", "false").lower() == "true"
+
+# Autoencoder inference backend: "torch" or "onnx" (needs autoencoder.onnx)
+AUTOENCODER_BACKEND = os.getenv("AUTOENCODER_BACKEND", "torch")
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "1"))
+
+# Autoencoder weights: "float" or "int8" (dynamic quantization, CPU only)
+AUTOENCODER_VARIANT = os.getenv("AUTOENCODER_VARIANT", "float")
+
+# Torch backend graph: "eager", "trace" or "script" (TorchScript, frozen and
+# optimized for inference), warmed up at these batch sizes before serving
+AUTOENCODER_JIT = os.getenv("AUTOENCODER_JIT", "eager")
+AUTOENCODER_WARMUP_BATCHES = [int(b) for b in os.getenv("AUTOENCODER_WARMUP_BATCHES", "1,8,32").split(",") if b]
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))   # 0 = torch default
+
+# Live score sketches (threshold / drift monitoring)
+SCORE_SKETCH_DIR = os.getenv("SCORE_SKETCH_DIR", os.path.join(BASE_DIR, 'saved_models', 'monitoring'))
+SCORE_SKETCH_PERSIST_S = float(os.getenv("SCORE_SKETCH_PERSIST_S", "60"))
+SCORE_SKETCH_MAX_USERS = int(os.getenv("SCORE_SKETCH_MAX_USERS", "10000"))
+
+# Admission control for /analyze (in-flight requests / EWMA latency in ms).
+# Counted in middleware before the anyio threadpool (40 threads by default),
+# so in-flight includes requests waiting for a thread. Keep the degrade level
+# below the thread count; the shed and hard caps above it bound that queue.
+ADMISSION_DEGRADE_INFLIGHT = int(os.getenv("ADMISSION_DEGRADE_INFLIGHT", "16"))
+ADMISSION_SHED_INFLIGHT = int(os.getenv("ADMISSION_SHED_INFLIGHT", "32"))
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))   # 0 = no hard cap
+ADMISSION_DEGRADE_LATENCY_MS = float(os.getenv("ADMISSION_DEGRADE_LATENCY_MS", "250"))
+ADMISSION_SHED_LATENCY_MS = float(os.getenv("ADMISSION_SHED_LATENCY_MS", "1000"))
+ADMISSION_EWMA_ALPHA = float(os.getenv("ADMISSION_EWMA_ALPHA", "0.2"))
+DEFERRED_QUEUE_SIZE = int(os.getenv("DEFERRED_QUEUE_SIZE", "1000"))
+
+# Rule prefilter ahead of model inference (rules JSON overrides the defaults;
+# check custom rules with training/calibrate_prefilter.py first)
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_RULES_PATH = os.getenv("PREFILTER_RULES_PATH", "")
+PREFILTER_MIN_SESSION_MS = float(os.getenv("PREFILTER_MIN_SESSION_MS", "300"))
+PREFILTER_SCRIPTED_SESSION_MS = float(os.getenv("PREFILTER_SCRIPTED_SESSION_MS", "3000"))
+
+# Per-user behavior profile verifier (Users.behaviorProfile z-scores)
+PROFILE_MIN_SESSIONS = int(os.getenv("PROFILE_MIN_SESSIONS", "5"))
+PROFILE_Z_THRESHOLD = float(os.getenv("PROFILE_Z_THRESHOLD", "3.0"))
+PROFILE_REJECT_Z = float(os.getenv("PROFILE_REJECT_Z", "6.0"))   # pre-check: skip OCSVM above this
+PROFILE_Z_CLIP = float(os.getenv("PROFILE_Z_CLIP", "10.0"))
+
+# Registered-user verifier: "ocsvm" (registry, retrained offline) or "knn"
+# (saved_models/user/user_<id>/knn, grows as accepted sessions are appended)
+USER_VERIFIER = os.getenv("USER_VERIFIER", "ocsvm")
+KNN_K = int(os.getenv("KNN_K", "5"))
+KNN_TREE_MIN_ROWS = int(os.getenv("KNN_TREE_MIN_ROWS", "2048"))   # below this, exact vectorized scan
+KNN_RECALIBRATE_EVERY = int(os.getenv("KNN_RECALIBRATE_EVERY", "200"))   # appends between threshold refits, 0 = never
+
+# Logging (queue-backed, see app/core/log.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")              # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "5"))     # identical messages per window; 0 = unlimited
+LOG_RATE_WINDOW_S = float(os.getenv("LOG_RATE_WINDOW_S", "60"))
+
+# Shadow scoring of registry "candidate" versions (0 disables)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", "1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1000"))
+SHADOW_LOG_SIZE = int(os.getenv("SHADOW_LOG_SIZE", "500"))
+
+# Ensemble of autoencoder + OCSVM for registered users:
+# "off" (OCSVM only), "any", "all" or "weighted"
+ENSEMBLE_POLICY = os.getenv("ENSEMBLE_POLICY", "off")
+ENSEMBLE_WEIGHTS = os.getenv("ENSEMBLE_WEIGHTS", "autoencoder=0.5,ocsvm=0.5")
+ENSEMBLE_THRESHOLD = float(os.getenv("ENSEMBLE_THRESHOLD", "1.0"))   # weighted risk, 1.0 = at threshold
+ENSEMBLE_WORKERS = int(os.getenv("ENSEMBLE_WORKERS", "4"))
+
+# Idempotency cache for retried /analyze requests (TTL 0 disables)
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "300"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WAIT_S = float(os.getenv("IDEMPOTENCY_WAIT_S", "30"))   # max wait on an in-flight duplicate
+
+# In-process ring buffer of recently scored sessions for /sessions reads (0 disables)
+RECENT_SESSIONS_CAPACITY = int(os.getenv("RECENT_SESSIONS_CAPACITY", "10000"))
+
+# Per-feature attribution stored with each session (top K features per model, 0 disables)
+ATTRIBUTION_TOP_K = int(os.getenv("ATTRIBUTION_TOP_K", "5"))
+
+# Feature drift monitor: live histograms vs. the training reference (DRIFT_WINDOWS 0 disables)
+DRIFT_BINS = int(os.getenv("DRIFT_BINS", "10"))
+DRIFT_WINDOW_S = float(os.getenv("DRIFT_WINDOW_S", "3600"))
+DRIFT_WINDOWS = int(os.getenv("DRIFT_WINDOWS", "24"))
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "100"))   # fewer sessions in a window report null
+DRIFT_PSI_WARN = float(os.getenv("DRIFT_PSI_WARN", "0.1"))
+DRIFT_PSI_ALERT = float(os.getenv("DRIFT_PSI_ALERT", "0.25"))
+DRIFT_CHECK_S = float(os.getenv("DRIFT_CHECK_S", "300"))   # background alert check, 0 disables
@@ -0,0 +1,146 @@
+"""
+log.py
+CacheMeOutside
+
+Logging setup for the API process.
+
+Request threads never write to stdout themselves. The root logger gets a
+QueueHandler that only enqueues the record, and a QueueListener thread
+formats and writes it. The queue is bounded, and when it is full records
+are dropped and counted instead of blocking a request.
+
+RateLimitFilter runs before enqueueing. It lets through at most
+LOG_RATE_LIMIT copies of the same message per LOG_RATE_WINDOW_S seconds.
+The next copy after the window reports how many were suppressed, so a
+repeated warning such as a missing feature on every request costs one line
+per window.
+
+Modules log through the standard library (logging.getLogger(__name__)),
+including the Data layer, which doesn't import app/. setup_logging() is
+called once from main.py.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from app.core.config import (
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    LOG_RATE_LIMIT,
+    LOG_RATE_WINDOW_S,
+)
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any extra= fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """At most `limit` identical messages per `window_s`; the rest are counted."""
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window_s: float = LOG_RATE_WINDOW_S, max_keys: int = 10_000):
+        super().__init__()
+        self.limit = limit
+        self.window_s = window_s
+        self.max_keys = max_keys
+        self._windows: dict = {}   # key -> [window_start, emitted, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_s:
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> logging.Logger:
+    """Route the root logger through the background queue. Idempotent."""
+    global _listener, _handler
+    root = logging.getLogger()
+    if _listener is not None:
+        return root
+
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(log_queue)
+    _handler.addFilter(RateLimitFilter())
+
+    root.handlers = [_handler]
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
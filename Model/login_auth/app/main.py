@@ -1,18 +1,39 @@
 import hashlib
+import json
+import logging
 import os
 import sys
 
-from fastapi import FastAPI, HTTPException
+import anyio
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, "/home/ubuntu/BotBoundary")
 
-from app.models.autoencoder import AutoencoderModel
-from app.models.ocsvm import OneClassSVMModel
-from app.schemas import RiskResponse, SessionRequest
+from app.core.config import ATTRIBUTION_TOP_K, PROFILE_REJECT_Z, STORAGE_BACKEND, USER_VERIFIER
+from app.core.log import setup_logging, shutdown_logging
+from app.models.knn import KNNStore
+from app.models.profile import BehaviorProfileModel
+from app.schemas import BehaviorPayload, EventChunk, RiskResponse, SessionRequest
+from app.services.admission import DEGRADED, SHED, AdmissionController, DeferredWork, Overloaded
+from app.services.drift import DriftMonitor
+from app.services.ensemble import EnsembleScorer
+from app.services.feature_extractor import FEATURE_ORDER_HASH, vector_from_payload
+from app.services.idempotency import IdempotencyCache, IdempotencyKeyReused, request_fingerprint, request_key
+from app.services.model_registry import ModelRegistry, list_versions, set_stage
+from app.services.prefilter import RulePrefilter, prefilter_output
+from app.services.recent_sessions import RecentSessionStore
 from app.services.score_service import ScoreService
+from app.services.score_sketch import ScoreMonitor
+from app.services.session_accumulator import SessionAccumulatorStore
+from app.services.shadow import ShadowScorer
+
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 class RegisterRequest(BaseModel):
@@ -23,40 +44,60 @@ class RegisterRequest(BaseModel):
 MOCK_MODE = False
 
 try:
-    from Data.database import (
-        create_session,
-        create_user,
-        get_recent_sessions,
-        get_session,
-        get_session_events,
-        get_user_by_username,
-        save_behavior_events,
-        save_behavior_payload,
-        update_session_result,
-    )
+    if STORAGE_BACKEND == "memory":
+        # In-process stand-in (local runs, load tests): same interface, no AWS
+        from Data.memory_store import (
+            create_session,
+            create_user,
+            event_sink_snapshot,
+            get_recent_sessions,
+            get_session,
+            get_session_events,
+            get_user_by_username,
+            iter_session_events,
+            save_behavior_events,
+            save_behavior_payload,
+            update_behavior_profile,
+            update_session_result,
+        )
+    else:
+        from Data.database import (
+            create_session,
+            create_user,
+            event_sink_snapshot,
+            get_recent_sessions,
+            get_session,
+            get_session_events,
+            get_user_by_username,
+            iter_session_events,
+            save_behavior_events,
+            save_behavior_payload,
+            update_behavior_profile,
+            update_session_result,
+        )
 
     DB_AVAILABLE = True
-    print("[STARTUP] Database connected successfully.")
+    logger.info("Database connected successfully (%s backend).", STORAGE_BACKEND)
 except Exception as e:
-    print(f"[WARN] Database unavailable ({e}). Running without persistence.")
+    logger.warning("Database unavailable (%s). Running without persistence.", e)
     DB_AVAILABLE = False
 
+# Live models are held by the registry and swapped in place when a new
+# version is published; always read them through `registry`.
+registry = ModelRegistry()
+
 try:
-    autoencoder = AutoencoderModel()
-    autoencoder.load()
-    print("[STARTUP] Autoencoder loaded successfully.")
+    registry.load_autoencoder()
+    logger.info("Autoencoder loaded successfully (%s).", registry.status()["autoencoder"]["version"])
 except Exception as e:
-    print(f"[WARN] Could not load autoencoder: {e}.")
-    autoencoder = None
+    logger.warning("Could not load autoencoder: %s.", e)
 
 try:
-
-    ocsvm = OneClassSVMModel()
-    ocsvm.load()
-    print("[STARTUP] OCSVM loaded successfully.")
+    if registry.get_ocsvm("nolanpark") is None:
+        raise FileNotFoundError("no trained model for nolanpark")
+    logger.info("OCSVM loaded successfully.")
 except Exception as e:
-    print(f"[WARN] Could not load OCSVM: {e}.")
-    ocsvm = None
+    logger.warning("Could not load OCSVM: %s.", e)
 
 
 app = FastAPI(title="CacheMeOutside - Behavioral Auth API")
@@ -69,6 +110,65 @@ app.add_middleware(
 )
 
 score_svc = ScoreService()
+stream_store = SessionAccumulatorStore()
+score_monitor = ScoreMonitor()
+admission_ctl = AdmissionController()
+deferred = DeferredWork()
+prefilter = RulePrefilter()
+shadow = ShadowScorer()
+ensemble = EnsembleScorer()
+idempotency = IdempotencyCache()
+recent_sessions = RecentSessionStore()
+knn_store = KNNStore()
+drift = DriftMonitor()
+
+
+@app.on_event("startup")
+def start_monitoring():
+    score_monitor.start()
+    registry.start()
+    deferred.start()
+    shadow.start()
+    drift.start()
+
+
+@app.on_event("startup")
+async def check_admission_limits():
+    admission_ctl.check_threadpool(anyio.to_thread.current_default_thread_limiter().total_tokens)
+
+
+@app.middleware("http")
+async def admit_analyze(request: Request, call_next):
+    """
+    Admission for /analyze runs here, on the event loop, before the sync
+    endpoint waits for a threadpool thread. That wait is part of the latency
+    the controller reacts to.
+    """
+    if request.url.path != "/analyze" or request.method != "POST":
+        return await call_next(request)
+    try:
+        with admission_ctl.admit() as (level, reason):
+            request.state.admission = (level, reason)
+            return await call_next(request)
+    except Overloaded as e:
+        return JSONResponse(status_code=503, content={"detail": f"Overloaded: {e}"},
+                            headers={"Retry-After": "1"})
+
+
+@app.on_event("shutdown")
+def stop_monitoring():
+    drift.stop()
+    shadow.stop()
+    ensemble.stop()
+    deferred.stop()
+    registry.stop()
+    score_monitor.stop()
+    shutdown_logging()
+
+
+def _model_ready() -> bool:
+    autoencoder = registry.autoencoder
+    return autoencoder is not None and getattr(autoencoder, "ready", True)
 
 
 @app.get("/health")
@@ -77,10 +177,21 @@ def health():
         "status": "ok",
         "mock_mode": MOCK_MODE,
         "db": DB_AVAILABLE,
-        "model": autoencoder is not None,
+        "model": registry.autoencoder is not None,
+        "ready": _model_ready(),
+        "feature_order_hash": FEATURE_ORDER_HASH,
     }
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until the autoencoder is loaded and warmed up."""
+    if not _model_ready():
+        raise HTTPException(status_code=503, detail="Model not ready")
+    autoencoder = registry.autoencoder
+    return {"status": "ready", "backend": autoencoder.backend, "jit": getattr(autoencoder, "jit", "eager")}
+
+
 @app.post("/register")
 def register_user(req: RegisterRequest):
     if not DB_AVAILABLE:
@@ -97,30 +208,78 @@ def register_user(req: RegisterRequest):
 
 
 @app.post("/analyze", response_model=RiskResponse)
-def analyze_session(request: SessionRequest):
+def analyze_session(request: SessionRequest, http_request: Request, response: Response, explain: bool = False,
+                    idempotency_key: str | None = Header(default=None)):
+    # Retries (same Idempotency-Key, or same username + password + payload)
+    # get the first response back instead of a second session and event set
+    behavior_json = request.behavior.model_dump_json()
+    key = request_key(request.username, request.password, behavior_json, idempotency_key)
+    fingerprint = request_fingerprint(request.username, request.password, behavior_json)
+    try:
+        level, reason = http_request.state.admission
+        result, replayed = idempotency.get_or_compute(key, lambda: _analyze(request, level, reason), fingerprint)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    # Attribution is always stored with the session; only returned on request
+    return result if explain else {**result, "attribution": None}
+
+
+def _analyze(request: SessionRequest, level: str, reason: str | None) -> dict:
+    # SHED: no DynamoDB round trips and no per-user model, score with the
+    # shared autoencoder only. DEGRADED: payload / event storage is deferred.
+    shed = level == SHED
     user_id = None
     session_id = None
+    created_at = None
+    profile = None
     registered = (
             request.username == "nolanpark" and
             request.password == "P@ssw0rd"
     )
 
-    if DB_AVAILABLE:
+    if DB_AVAILABLE and not shed:
         user = get_user_by_username(request.username)
         if not user:
             user = create_user(request.username, "placeholder")
 
         if user:
             user_id = user["userId"]
+            # Behavior profiles only for account owners (set via /register)
+            if user.get("passwordHash") == hashlib.sha256(request.password.encode()).hexdigest():
+                profile = BehaviorProfileModel(user_id).load(user.get("behaviorProfile"))
 
         if user_id:
             db_session = create_session(user_id)
             if db_session:
                 session_id = db_session["sessionId"]
+                created_at = db_session.get("createdAt")
+
+    # Snapshot live references once so a hot swap mid-request can't mix versions
+    autoencoder = registry.autoencoder
+    # Per-user verifier: the registry's OCSVM, or the incrementally grown KNN index
+    if not registered or shed:
+        verifier = None
+    elif USER_VERIFIER == "knn":
+        verifier = knn_store.get("nolanpark")
+    else:
+        verifier = registry.get_ocsvm("nolanpark")
+    verifier_name = "knn" if USER_VERIFIER == "knn" else "ocsvm"
 
-    behavior_dict = request.behavior.model_dump()
+    # Straight from the validated payload to the model input, no dicts
+    vector = vector_from_payload(request.behavior)
+    # Per-feature attribution comes out of the scoring pass itself
+    explain = ATTRIBUTION_TOP_K > 0
 
-    if MOCK_MODE or autoencoder is None:
+    # Clear-cut bots are decided by the rule stage; models only see the rest
+    reason_code = prefilter.check(vector)
+
+    if reason_code is not None:
+        model_output = prefilter_output(reason_code)
+    elif MOCK_MODE or autoencoder is None:
         model_output = {
             "model_name": "mock",
             "score": 0.01,
@@ -129,23 +288,62 @@ def analyze_session(request: SessionRequest):
         }
     else:
         try:
-            parsed = {}
-            for group in ["interaction", "keyboard", "mouse", "timing"]:
-                group_data = behavior_dict.get(group, {})
-                if isinstance(group_data, dict):
-                    parsed.update(group_data)
-            print("Checkup *********************")
-            if registered and ocsvm is not None:
-                model_output = ocsvm.predict(parsed)
-                model_output["model_name"] = "ocsvm"
+            logger.debug("Scoring session", extra={"session_id": session_id, "admission": level})
+            profile_output = profile.predict(vector) if profile is not None and profile.ready else None
+            # Profile pre-check: sessions far outside the owner's history skip the OCSVM
+            precheck_reject = profile_output is not None and profile_output["score"] > PROFILE_REJECT_Z
+            if registered and verifier is not None and not precheck_reject and ensemble.enabled:
+                # Both models concurrently on the same vector, fused by ENSEMBLE_POLICY
+                model_output = ensemble.predict(autoencoder, verifier, vector, verifier_name=verifier_name,
+                                                explain=explain)
+                monitor_user = verifier.user_id
+            elif registered and verifier is not None and not precheck_reject:
+                model_output = verifier.predict(vector, explain=explain)
+                model_output["model_name"] = verifier_name
+                monitor_user = verifier.user_id
+            elif profile_output is not None:
+                # Fallback for owners without an OCSVM, or the pre-check verdict
+                model_output = profile_output
+                monitor_user = user_id
             else:
-                model_output = autoencoder.predict(parsed)
+                model_output = autoencoder.predict(vector, explain=explain)
                 model_output["model_name"] = "autoencoder"
+                monitor_user = None
+            # Single models report their own attribution; key it by model like the ensemble does
+            if model_output.get("attribution") and "model_scores" not in model_output:
+                model_output["attribution"] = {model_output["model_name"]: model_output["attribution"]}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Model inference failed: {e}")
 
+        score_monitor.record(
+            model_output["model_name"],
+            model_output["score"],
+            model_output.get("threshold"),
+            model_output["is_anomaly"],
+            user_id=monitor_user,
+        )
+        # Live feature histograms vs. the live autoencoder's training reference
+        drift.record(vector, autoencoder.model_path)
+
+        # Candidate models see a sample of the same vectors off-thread
+        if model_output["model_name"] in ("autoencoder", "ocsvm"):
+            shadow.submit(model_output["model_name"], monitor_user, vector, model_output)
+        for name, component in (model_output.get("model_scores") or {}).items():
+            if name in ("autoencoder", "ocsvm"):
+                shadow.submit(name, monitor_user, vector, {"model_name": name, **component})
+
+    # Accepted owner sessions grow the KNN index; no retrain needed
+    if verifier_name == "knn" and not model_output["is_anomaly"] and (
+            model_output["model_name"] == "knn" or model_output["model_name"].startswith("ensemble:")):
+        try:
+            verifier.append(vector)
+        except Exception as e:
+            logger.warning("KNN append failed for %s: %s", verifier.user_id, e)
+
     result = score_svc.process(model_output)
     result["session_id"] = session_id
+    result["degraded"] = level in (DEGRADED, SHED)
+    result["degraded_reason"] = f"{level}:{reason}" if result["degraded"] else None
 
     if DB_AVAILABLE and session_id and user_id:
         update_session_result(
@@ -155,23 +353,48 @@ def analyze_session(request: SessionRequest):
             is_bot=result["is_bot"],
             model_name=result.get("model"),
             threshold=result.get("threshold"),
+            attribution=result.get("attribution"),
         )
 
-        save_behavior_payload(session_id, user_id, behavior_dict)
+        # Only the persistence path needs the nested dict
+        behavior_dict = request.behavior.model_dump()
 
-        # This is the missing persistence path that caused BehavioralEvents to
-        # stay empty in the current codebase.
-        save_behavior_events(
-            session_id=session_id,
-            user_id=user_id,
-            behavior=behavior_dict,
-            inference={
-                "model": result.get("model"),
-                "risk_score": result.get("risk_score"),
-                "threshold": result.get("threshold"),
-                "is_bot": result.get("is_bot"),
-            },
+        # Dashboard reads of this session are served from memory from now on;
+        # one BehavioralEvents row per non-empty group plus the inference row
+        event_count = 1 + sum(
+            1 for group in ("mouse", "keyboard", "interaction", "timing", "environment") if behavior_dict.get(group)
         )
+        recent_sessions.add(session_id, user_id, created_at, result, vector, event_count=event_count)
+        inference = {
+            "model": result.get("model"),
+            "risk_score": result.get("risk_score"),
+            "threshold": result.get("threshold"),
+            "is_bot": result.get("is_bot"),
+        }
+        # Only sessions accepted as the owner's feed their profile
+        if profile is not None and not result["is_bot"]:
+            expected_count = profile.stored_count
+            profile.update(vector)
+            if level == DEGRADED:
+                deferred.submit(update_behavior_profile, user_id, profile.to_dict(), expected_count)
+            else:
+                update_behavior_profile(user_id, profile.to_dict(), expected_count)
+
+        if level == DEGRADED:
+            deferred.submit(save_behavior_payload, session_id, user_id, behavior_dict)
+            deferred.submit(save_behavior_events, session_id=session_id, user_id=user_id,
+                            behavior=behavior_dict, inference=inference)
+        else:
+            save_behavior_payload(session_id, user_id, behavior_dict)
+
+            # This is the missing persistence path that caused BehavioralEvents to
+            # stay empty in the current codebase.
+            save_behavior_events(
+                session_id=session_id,
+                user_id=user_id,
+                behavior=behavior_dict,
+                inference=inference,
+            )
 
     return result
 
@@ -180,6 +403,7 @@ def analyze_session(request: SessionRequest):
 def get_sessions(limit: int = 20):
     if not DB_AVAILABLE:
         raise HTTPException(status_code=500, detail="Database unavailable")
+    # Always the database: a worker's buffer only holds the sessions it scored
     return {"sessions": get_recent_sessions(limit=limit)}
 
 
@@ -188,9 +412,160 @@ def get_session_detail(session_id: str):
     if not DB_AVAILABLE:
         raise HTTPException(status_code=500, detail="Database unavailable")
 
+    session = recent_sessions.get(session_id)
+    if session is not None:
+        return session
+
     session = get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     session["behaviorEvents"] = get_session_events(session_id)
     return session
+
+
+@app.get("/sessions/{session_id}/events")
+def stream_session_events(session_id: str, limit: int | None = None, fields: str | None = None):
+    """
+    Events of a session as NDJSON, streamed page by page from DynamoDB.
+    fields: comma-separated attributes to project, e.g. eventType,timestamp
+    A read failure after streaming has started ends the body with an
+    {"error": ...} line.
+    """
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Database unavailable")
+
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    events = iter_session_events(session_id, fields=projection, limit=limit)
+    # Pull the first page before answering, so an error there is a plain 500
+    try:
+        first = next(events, None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to read events: {e}")
+
+    def ndjson():
+        if first is None:
+            return
+        yield json.dumps(first) + "\n"
+        try:
+            for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # Status is already 200; a final error record marks the stream as truncated
+            logger.error("event stream for %s truncated: %s", session_id, e)
+            yield json.dumps({"error": f"stream truncated: {e}"}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/models")
+def get_models():
+    """Live / previous registry version per model."""
+    return registry.status()
+
+
+@app.post("/models/rollback")
+def rollback_model(kind: str = "autoencoder", user_id: str | None = None):
+    try:
+        return registry.rollback(kind, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/models/promote")
+def promote_model(version: str, kind: str = "autoencoder", user_id: str | None = None):
+    """Mark a shadowed candidate as production; the registry swaps it in on its next poll."""
+    # The registry only swaps in versions newer than the live one, so an older
+    # candidate would be marked production and never served
+    production = list_versions(kind, user_id if kind != "autoencoder" else None)
+    if production and production[-1]["version"] > version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"{version} is older than production version {production[-1]['version']}; "
+                   f"retrain or republish it as a new candidate",
+        )
+    try:
+        manifest = set_stage(kind, version, "production", user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"kind": kind, "user_id": user_id, "version": version, "stage": manifest["stage"]}
+
+
+@app.get("/monitoring/shadow")
+def get_shadow_status(limit: int = 50):
+    """Candidate vs production agreement, score deltas and recent disagreements."""
+    return shadow.snapshot(limit=limit)
+
+
+@app.get("/monitoring/admission")
+def get_admission_status():
+    """Current load level, in-flight count, latency EWMA and deferred queue."""
+    return {**admission_ctl.snapshot(), "deferred": deferred.snapshot()}
+
+
+@app.get("/monitoring/idempotency")
+def get_idempotency_status():
+    """Cached /analyze responses and how many retries were replayed or collapsed."""
+    return idempotency.snapshot()
+
+
+@app.get("/monitoring/recent-sessions")
+def get_recent_sessions_status():
+    """Ring buffer fill, hit rate and memory footprint."""
+    return recent_sessions.snapshot()
+
+
+@app.get("/monitoring/events")
+def get_event_sink_status():
+    """BehavioralEvents batching: flush sizes and latency, retries, failures."""
+    if not DB_AVAILABLE:
+        raise HTTPException(status_code=500, detail="Database unavailable")
+    return event_sink_snapshot() or {"enabled": False}
+
+
+@app.get("/monitoring/drift")
+def get_drift_status(windows: int | None = None):
+    """
+    Per-feature PSI and binned KS of recent model-scored sessions vs. the
+    autoencoder's training data, overall and per DRIFT_WINDOW_S window.
+    windows: only the last N windows (default all DRIFT_WINDOWS).
+    """
+    return drift.scores(windows=windows)
+
+
+@app.get("/monitoring/prefilter")
+def get_prefilter_status():
+    """Per-rule hit counts and how much traffic the rule stage short-circuited."""
+    return prefilter.snapshot()
+
+
+@app.get("/monitoring/scores")
+def get_score_monitoring(user_id: str | None = None, scope: str = "worker"):
+    """
+    Live score percentiles and flag rate per model vs. the training threshold.
+    scope=worker: this process, up to date.
+    scope=all:    merged persisted sketches of every worker.
+    """
+    if scope == "all":
+        return score_monitor.merged_snapshot(user_id=user_id)
+    return score_monitor.snapshot(user_id=user_id)
+
+
+@app.post("/stream/{stream_id}/events", response_model=BehaviorPayload)
+def push_stream_events(stream_id: str, chunk: EventChunk):
+    """Fold a chunk of raw events into the session's running features."""
+    acc = stream_store.update(
+        stream_id,
+        chunk.events,
+        start_time=chunk.start_time,
+        environment=chunk.environment.model_dump() if chunk.environment else None,
+    )
+    return acc.features()
+
+
+@app.get("/stream/{stream_id}/features", response_model=BehaviorPayload)
+def get_stream_features(stream_id: str, end_time: float | None = None):
+    features = stream_store.features(stream_id, end_time=end_time)
+    if features is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return features
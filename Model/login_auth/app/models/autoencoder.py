@@ -2,13 +2,69 @@ from app.models.base_model import Basemodel
 import torch
 import torch.nn as nn
 import numpy as np
-from app.core.config import AUTOENCODER_DIR
+from app.core.config import (
+    AUTOENCODER_BACKEND,
+    AUTOENCODER_DIR,
+    AUTOENCODER_JIT,
+    AUTOENCODER_VARIANT,
+    AUTOENCODER_WARMUP_BATCHES,
+    ORT_INTRA_OP_THREADS,
+    TORCH_NUM_THREADS,
+    USE_MMAP_ARTIFACTS,
+)
+from app.services import mmap_artifacts
+from app.services.attribution import explain as explain_features, reconstruction_shares
 from app.services.feature_extractor import FEATURE_DIM
 from app.services.feature_extractor import FEATURE_ORDER
-from app.services.feature_extractor import flatten_behavior
 
 import joblib
+import logging
 import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ONNX_FILENAME = "autoencoder.onnx"
+INT8_WEIGHTS_FILENAME = "best_autoencoder_int8.pt"
+INT8_THRESHOLD_FILENAME = "threshold_int8.npy"
+
+
+def configure_torch_threads(num_threads: int = TORCH_NUM_THREADS):
+    """
+    Fixed intra-op threads for the process (0 leaves torch's default). One
+    thread per uvicorn worker avoids oversubscription on single-row requests.
+    """
+    if num_threads <= 0:
+        return
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass    # only settable once, before any inter-op work
+
+
+def optimize_for_inference(model: nn.Module, input_dim: int, mode: str, device) -> torch.jit.ScriptModule:
+    """
+    TorchScript version of an eval-mode module, frozen (weights folded in as
+    constants) and run through torch.jit.optimize_for_inference.
+    mode: "trace" (records the forward pass) or "script" (compiles it)
+    """
+    with torch.no_grad():
+        if mode == "trace":
+            scripted = torch.jit.trace(model, torch.zeros(1, input_dim, device=device))
+        elif mode == "script":
+            scripted = torch.jit.script(model)
+        else:
+            raise ValueError(f"unknown jit mode {mode!r}, expected trace or script")
+        return torch.jit.optimize_for_inference(torch.jit.freeze(scripted.eval()))
+
+
+def quantize_dynamic_int8(model: nn.Module) -> nn.Module:
+    """
+    Post-training dynamic quantization: nn.Linear weights stored as int8,
+    activations quantized on the fly. CPU only.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
 
 
 class AutoencoderModel(Basemodel):
@@ -19,11 +75,16 @@ class AutoencoderModel(Basemodel):
     This class only loads trained weights and runs inference.
     """
 
-    def __init__(self, input_dim: int = FEATURE_DIM, latent_dim: int = 16):
+    def __init__(self, input_dim: int = FEATURE_DIM, latent_dim: int = 16, backend: str = AUTOENCODER_BACKEND,
+                 model_path: str = AUTOENCODER_DIR):
         self.model_name = "autoencoder"
+        # "torch" (eager nn.Sequential) or "onnx" (onnxruntime, CPU only)
+        self.backend = backend
+        self.session = None
         self.input_dim = input_dim
         self.latent_dim = latent_dim
-        self.model_path = AUTOENCODER_DIR
+        # Legacy saved_models/autoencoder or a registry version directory
+        self.model_path = model_path
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.feature_columns = FEATURE_ORDER
 
@@ -48,43 +109,119 @@ class AutoencoderModel(Basemodel):
         self.criterion = nn.MSELoss()
         self.scaler = None
         self.threshold = None
+        self.variant = "float"
+        self.jit = "eager"
+        # True once warm_up() has run; /ready reports it
+        self.ready = False
 
-    def load(self):
+    def load(self, use_mmap: bool = USE_MMAP_ARTIFACTS, variant: str = AUTOENCODER_VARIANT,
+             jit: str = AUTOENCODER_JIT):
         """
         Load trained model weights, scaler, and threshold from disk
         This doesn't re-train the model
+
+        use_mmap: map the exported .npy weights / scaler read-only instead of
+                  unpickling private copies (see services/mmap_artifacts.py)
+        variant:  "float" (best_autoencoder.pt) or "int8", the dynamically
+                  quantized artifact from training/quantize_autoencoder.py
+        jit:      "eager", or "trace" / "script" for a frozen TorchScript graph
+                  (torch backend only). Call warm_up() before serving either way.
         """
-        self.model.load_state_dict(torch.load(os.path.join(self.model_path, "best_autoencoder.pt"), map_location=self.device))
+        if variant == "int8" and self.backend == "onnx":
+            # The ONNX graph is the float model; int8 weights and threshold don't apply to it
+            raise ValueError("AUTOENCODER_VARIANT=int8 requires AUTOENCODER_BACKEND=torch")
+        configure_torch_threads()
+        mapped = False
+        if variant == "int8":
+            # Quantized kernels are CPU only
+            self.device = torch.device("cpu")
+            self.model = quantize_dynamic_int8(self.model.cpu())
+            self.model.load_state_dict(torch.load(os.path.join(self.model_path, INT8_WEIGHTS_FILENAME), map_location="cpu"))
+            self.scaler = joblib.load(os.path.join(self.model_path, "scaler.pkl"))
+        elif use_mmap and self.device.type == "cpu" and mmap_artifacts.has_mmap_artifacts(self.model_path):
+            # assign=True keeps the mapped tensors instead of copying them
+            self.model.load_state_dict(mmap_artifacts.load_state_dict(self.model_path), assign=True)
+            self.scaler = mmap_artifacts.MappedScaler(self.model_path)
+            mapped = True
+        else:
+            self.model.load_state_dict(torch.load(os.path.join(self.model_path, "best_autoencoder.pt"), map_location=self.device))
+            self.scaler = joblib.load(os.path.join(self.model_path, "scaler.pkl"))
 
-        self.scaler = joblib.load(os.path.join(self.model_path, "scaler.pkl"))
-        self.threshold = np.load(os.path.join(self.model_path, "threshold.npy"))
+        # The int8 model has its own recomputed 97th-percentile threshold
+        threshold_file = "threshold.npy"
+        if variant == "int8" and os.path.exists(os.path.join(self.model_path, INT8_THRESHOLD_FILENAME)):
+            threshold_file = INT8_THRESHOLD_FILENAME
+        self.threshold = np.load(os.path.join(self.model_path, threshold_file))
+        self.variant = variant
         self.model.eval()
 
+        if self.backend == "onnx":
+            self.session = self._onnx_session()
+        elif jit != "eager":
+            if mapped:
+                # Freezing copies the weights into the graph, which would undo the sharing
+                logger.info("AUTOENCODER_JIT=%s ignored: weights are memory-mapped", jit)
+            else:
+                try:
+                    self.model = optimize_for_inference(self.model, self.input_dim, jit, self.device)
+                    self.jit = jit
+                except Exception as e:
+                    logger.warning("TorchScript %s failed, serving eager: %s", jit, e)
 
-    def predict(self, parsed_features: dict):
+    def warm_up(self, batch_sizes=AUTOENCODER_WARMUP_BATCHES, rounds: int = 3) -> float:
+        """
+        Scores zero batches of the usual sizes, with and without attribution,
+        so allocator growth, kernel selection and TorchScript's profiling runs
+        happen here instead of on the first requests. Returns seconds spent.
+        """
+        start = time.perf_counter()
+        for batch_size in batch_sizes or [1]:
+            batch = np.zeros((batch_size, self.input_dim), dtype=np.float32)
+            for _ in range(rounds):
+                self._scores(batch)
+                self._scores(batch, per_feature=True)
+        self.ready = True
+        return time.perf_counter() - start
 
+    def _onnx_session(self):
         """
-        Runs a forward pass and computes reconstruction error
-        feature_vector: list of floats
-        Returns:
-        {
-            "model_name": str,
-            "score": float (reconstruction error)
-        }
+        onnxruntime CPU session for the exported graph (scaling included).
+        One intra-op thread is usually fastest for single-row requests; each
+        uvicorn worker gets its own session so threads don't oversubscribe.
         """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        return ort.InferenceSession(
+            os.path.join(self.model_path, ONNX_FILENAME),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
 
-        # Align prediction feature order with training order
-        feature_vector = [
-            float(
-                parsed_features.get(col, 0.0)
-                or parsed_features.get(col.split(".")[-1], 0.0)
-            )
-            for col in self.feature_columns
-        ]
+
+    def _scores(self, feature_matrix, scaled: bool = False, per_feature: bool = False):
+        """
+        Reconstruction error per row of an unscaled (N, input_dim) matrix
+        in FEATURE_ORDER (see feature_extractor.vector_from_payload).
+        scaled=True: rows already went through this model's scaler (torch only).
+        per_feature=True: also return the (N, input_dim) squared errors the
+        score is the mean of (torch only; the onnx graph outputs the score).
+        """
+        feature_matrix = np.asarray(feature_matrix, dtype=np.float32).reshape(-1, self.input_dim)
+        if self.backend == "onnx":
+            if scaled:
+                raise ValueError("the onnx graph scales its own input")
+            # Scaling is part of the exported graph
+            errors = self.session.run(["score"], {"features": feature_matrix})[0]
+            return (errors, None) if per_feature else errors
 
         # Scale features
-        scaled = self.scaler.transform([feature_vector])
-        # print("SCALED INPUT:", scaled)
+        scaled = feature_matrix if scaled else self.scaler.transform(feature_matrix)
 
         # Convert list to Pytorch tensor
         # Use standard dtype = float32 for neural networks
@@ -95,19 +232,71 @@ class AutoencoderModel(Basemodel):
             # Forward pass
             reconstruction = self.model(x)
 
-            # Compute reconstruction error
-            error = self.criterion(reconstruction, x)
-        error_value = error.item()
+            # Compute reconstruction error (same as MSELoss for a single row)
+            squared = (reconstruction - x) ** 2
+            errors = torch.mean(squared, dim=1)
+        if per_feature:
+            return errors.cpu().numpy(), squared.cpu().numpy()
+        return errors.cpu().numpy()
 
+    def _result(self, error_value: float) -> dict:
         # Compare error with threshold
         is_anomaly = error_value > self.threshold
 
-        # print("RAW FEATURE VECTOR:", feature_vector[:10])
-        # print("NON-ZERO COUNT:", sum(v != 0 for v in feature_vector))
-
         return {
             "model_name": self.model_name,
             "score": error_value,
             "threshold": float(self.threshold),
             "is_anomaly": bool(is_anomaly)
         }
+
+    def predict(self, feature_vector, scaled: bool = False, explain: bool = False):
+
+        """
+        Runs a forward pass and computes reconstruction error
+        feature_vector: FEATURE_ORDER float32 vector (or list of floats)
+        scaled: the vector is already standardized with this model's scaler
+        explain: add "attribution", each feature's share of the error, taken
+                 from the same forward pass (see services/attribution.py)
+        Returns:
+        {
+            "model_name": str,
+            "score": float (reconstruction error)
+        }
+        """
+        if not explain:
+            return self._result(float(self._scores(feature_vector, scaled=scaled)[0]))
+
+        errors, squared = self._scores(feature_vector, scaled=scaled, per_feature=True)
+        result = self._result(float(errors[0]))
+        if squared is not None:
+            result["attribution"] = explain_features(self.model_name, reconstruction_shares(squared[0]))
+        return result
+
+    def predict_batch(self, feature_matrix) -> list:
+        """
+        Scores an (N, FEATURE_DIM) matrix with one forward pass.
+        Returns one predict()-shaped dict per row, in order.
+        """
+        if len(feature_matrix) == 0:
+            return []
+        errors = self._scores(feature_matrix)
+        return [self._result(float(e)) for e in errors]
+
+
+class ScaledReconstructionError(nn.Module):
+    """
+    Export wrapper: raw feature matrix in, per-row reconstruction error out.
+    Folds the StandardScaler into the graph so onnxruntime needs nothing else.
+    """
+
+    def __init__(self, model: nn.Module, mean, scale):
+        super().__init__()
+        self.model = model
+        self.register_buffer("mean", torch.tensor(np.asarray(mean), dtype=torch.float32))
+        self.register_buffer("scale", torch.tensor(np.asarray(scale), dtype=torch.float32))
+
+    def forward(self, features):
+        x = (features - self.mean) / self.scale
+        reconstruction = self.model(x)
+        return torch.mean((reconstruction - x) ** 2, dim=1)
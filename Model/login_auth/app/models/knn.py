@@ -0,0 +1,272 @@
+from app.models.base_model import Basemodel
+import json
+import logging
+import os
+import threading
+
+import joblib
+import numpy as np
+
+from app.core.config import KNN_K, KNN_RECALIBRATE_EVERY, KNN_TREE_MIN_ROWS, USERS_MODEL_DIR
+from app.services.attribution import explain as explain_features
+from app.services.feature_extractor import FEATURE_DIM, FEATURE_ORDER, check_feature_order_hash, feature_order_hash
+
+VECTORS_FILENAME = "knn_vectors.npy"
+APPENDED_FILENAME = "knn_appended.f32"    # raw float32 rows appended while serving
+META_FILENAME = "knn.json"
+THRESHOLD_PERCENTILE = 97.0
+
+logger = logging.getLogger(__name__)
+
+
+class KNNModel(Basemodel):
+    """
+    Per-user nearest-neighbour verifier
+
+    Alternative to the One-Class SVM for registered users. Stores the user's
+    scaled FEATURE_ORDER vectors and scores a session by its mean Euclidean
+    distance to the k nearest past sessions. The threshold is the 97th
+    percentile of the same statistic over the training sessions (each row
+    against the others), computed by training/train_knn.py.
+
+    New sessions are appended without a retrain. Rows sit
+    in a float32 buffer that doubles in capacity and are also appended to
+    knn_appended.f32, so a restart keeps them. Search is exact:
+      - fewer than KNN_TREE_MIN_ROWS rows: one vectorized pass over the buffer
+      - more: a scipy cKDTree over the first rows plus a vectorized pass over
+        the rows appended since. The tree is rebuilt when that tail reaches
+        half the tree size, which keeps appends at amortized O(log n).
+    The scaler stays the one fitted at training time.
+
+    More rows mean shorter neighbour distances, so a fixed threshold would
+    accept more and more over time. Every KNN_RECALIBRATE_EVERY appends the
+    threshold is refitted the way training does it (leave-one-out, 97th
+    percentile) over all rows, on a background thread, and written to
+    knn.json.
+    """
+
+    def __init__(self, user_id: str = "nolanpark", model_dir: str | None = None, k: int = KNN_K,
+                 tree_min_rows: int = KNN_TREE_MIN_ROWS, recalibrate_every: int = KNN_RECALIBRATE_EVERY):
+        self.model_name = "knn"
+        self.user_id = user_id
+        self.model_dir = model_dir or os.path.join(USERS_MODEL_DIR, f"user_{user_id}", "knn")
+        self.k = k
+        self.tree_min_rows = tree_min_rows
+        self.recalibrate_every = recalibrate_every
+        self.feature_columns = FEATURE_ORDER
+
+        self.scaler = None
+        self.threshold = None
+        self._data = np.empty((0, FEATURE_DIM), dtype=np.float32)
+        self._n = 0
+        self._tree = None
+        self._tree_n = 0            # rows covered by the tree; the rest are scanned
+        self._since_calibration = 0
+        self._calibrating = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._n
+
+    # ── Index ─────────────────────────────────────────────────────────────
+    def _set_rows(self, rows: np.ndarray):
+        rows = np.ascontiguousarray(rows, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        self._data = np.empty((max(len(rows) * 2, 64), FEATURE_DIM), dtype=np.float32)
+        self._data[:len(rows)] = rows
+        self._n = len(rows)
+        self._tree, self._tree_n = None, 0
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        tail = self._n - self._tree_n
+        if self._n >= self.tree_min_rows and tail >= max(self._tree_n // 2, 1):
+            # scipy ships with scikit-learn; without it the scan covers all rows
+            try:
+                from scipy.spatial import cKDTree
+            except ImportError:
+                return
+            self._tree = cKDTree(self._data[:self._n].copy())
+            self._tree_n = self._n
+
+    def _kneighbors(self, queries: np.ndarray, k: int, chunk: int = 1024) -> np.ndarray:
+        """(m, k) ascending distances from each scaled query row to the stored rows."""
+        with self._lock:
+            data, n, tree, tree_n = self._data, self._n, self._tree, self._tree_n
+        k = min(k, n)
+        if k == 0:
+            raise ValueError(f"KNN index for {self.user_id} is empty")
+        out = np.empty((len(queries), k), dtype=np.float64)
+        tail = data[tree_n:n]
+
+        for start in range(0, len(queries), chunk):
+            q = queries[start:start + chunk]
+            parts = []
+            if tree is not None:
+                d, _ = tree.query(q, k=min(k, tree_n))
+                parts.append(d.reshape(len(q), -1))
+            if len(tail):
+                diff = q[:, None, :] - tail[None, :, :]
+                d = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+                if d.shape[1] > k:
+                    d = np.partition(d, k - 1, axis=1)[:, :k]
+                parts.append(d)
+            d = np.concatenate(parts, axis=1) if len(parts) > 1 else parts[0]
+            if d.shape[1] > k:
+                d = np.partition(d, k - 1, axis=1)[:, :k]
+            out[start:start + len(q)] = np.sort(d, axis=1)
+        return out
+
+    def _scale(self, feature_matrix) -> np.ndarray:
+        rows = np.asarray(feature_matrix, dtype=np.float32).reshape(-1, FEATURE_DIM)
+        return self.scaler.transform(rows).astype(np.float32)
+
+    # ── Training / persistence ────────────────────────────────────────────
+    def fit(self, X: np.ndarray, scaler, percentile: float = THRESHOLD_PERCENTILE):
+        """Index the training rows; threshold from each row's distance to the others."""
+        self.scaler = scaler
+        scaled = self._scale(X)
+        self._set_rows(scaled)
+        loo = self._leave_one_out(scaled)
+        self.threshold = float(np.percentile(loo, percentile))
+        return loo
+
+    def _leave_one_out(self, rows: np.ndarray) -> np.ndarray:
+        # k + 1 because every row's nearest neighbour is itself
+        return self._kneighbors(rows, self.k + 1)[:, 1:].mean(axis=1)
+
+    def _write_meta(self, rows: int):
+        with open(os.path.join(self.model_dir, META_FILENAME), "w") as f:
+            json.dump({"k": self.k, "threshold": self.threshold, "rows": rows}, f)
+
+    def recalibrate(self, percentile: float = THRESHOLD_PERCENTILE):
+        """Refit the threshold over every stored row, appended ones included."""
+        with self._lock:
+            rows = self._data[:self._n].copy()
+        threshold = float(np.percentile(self._leave_one_out(rows), percentile))
+        logger.info("KNN %s: threshold %.4f -> %.4f over %d rows", self.user_id, self.threshold, threshold, len(rows))
+        self.threshold = threshold
+        # Only the threshold changes; "rows" still describes knn_vectors.npy
+        with open(os.path.join(self.model_dir, META_FILENAME)) as f:
+            saved_rows = json.load(f).get("rows", len(rows))
+        self._write_meta(saved_rows)
+
+    def _recalibrate_in_background(self):
+        def run():
+            try:
+                self.recalibrate()
+            except Exception as e:
+                logger.warning("KNN %s: recalibration failed: %s", self.user_id, e)
+            finally:
+                self._calibrating = False
+
+        threading.Thread(target=run, name=f"knn-recalibrate-{self.user_id}", daemon=True).start()
+
+    def save(self):
+        """Writes the index (compacting appended rows) and its metadata."""
+        os.makedirs(self.model_dir, exist_ok=True)
+        with self._lock:
+            rows = self._data[:self._n].copy()
+        np.save(os.path.join(self.model_dir, VECTORS_FILENAME), rows)
+        self._write_meta(len(rows))
+        appended = os.path.join(self.model_dir, APPENDED_FILENAME)
+        if os.path.exists(appended):
+            os.remove(appended)
+
+    def load(self):
+        if not os.path.exists(self.model_dir):
+            raise FileNotFoundError(
+                f"Model directory {self.model_dir} does not exist"
+            )
+
+        order_path = os.path.join(self.model_dir, "feature_order.pkl")
+        if os.path.exists(order_path):
+            check_feature_order_hash(feature_order_hash(joblib.load(order_path)), order_path)
+
+        with open(os.path.join(self.model_dir, META_FILENAME)) as f:
+            meta = json.load(f)
+        self.k = meta["k"]
+        self.threshold = meta["threshold"]
+        self.scaler = joblib.load(os.path.join(self.model_dir, "scaler.pkl"))
+
+        rows = np.load(os.path.join(self.model_dir, VECTORS_FILENAME))
+        appended_path = os.path.join(self.model_dir, APPENDED_FILENAME)
+        if os.path.exists(appended_path):
+            appended = np.fromfile(appended_path, dtype=np.float32)
+            # A torn last write leaves a partial row; drop it
+            appended = appended[:len(appended) // FEATURE_DIM * FEATURE_DIM].reshape(-1, FEATURE_DIM)
+            rows = np.concatenate([rows, appended])
+        self._set_rows(rows)
+
+    # ── Serving ───────────────────────────────────────────────────────────
+    def append(self, feature_vector, persist: bool = True):
+        """Adds an accepted session to the index, amortized O(1)."""
+        row = self._scale(feature_vector)[0]
+        with self._lock:
+            if self._n == len(self._data):
+                grown = np.empty((len(self._data) * 2, FEATURE_DIM), dtype=np.float32)
+                grown[:self._n] = self._data[:self._n]
+                self._data = grown
+            self._data[self._n] = row
+            self._n += 1
+            self._maybe_rebuild()
+            self._since_calibration += 1
+            recalibrate = (self.recalibrate_every > 0 and self._since_calibration >= self.recalibrate_every
+                           and not self._calibrating)
+            if recalibrate:
+                self._since_calibration = 0
+                self._calibrating = True
+        if persist:
+            # One 96-byte O_APPEND write per session
+            with open(os.path.join(self.model_dir, APPENDED_FILENAME), "ab") as f:
+                f.write(row.tobytes())
+        if recalibrate:
+            self._recalibrate_in_background()
+
+    def predict(self, feature_vector, scaled: bool = False, explain: bool = False):
+        """
+        feature_vector: FEATURE_ORDER float32 vector from feature_extractor
+        scaled: the vector is already standardized with this model's scaler
+        explain: add "attribution", the most deviating standardized features
+
+        returns:
+            score = mean distance to the k nearest stored sessions
+            is_anomaly = true if the score is above the training threshold
+        """
+        row = np.asarray(feature_vector, dtype=np.float32).reshape(1, -1) if scaled else self._scale(feature_vector)
+        score = float(self._kneighbors(row, self.k)[0].mean())
+
+        result = {
+            "model_name": self.model_name,
+            "score": score,
+            "threshold": float(self.threshold),
+            "is_anomaly": bool(score > self.threshold),
+        }
+        if explain:
+            result["attribution"] = explain_features(self.model_name, row[0])
+        return result
+
+
+class KNNStore:
+    """Per-user KNN verifiers, loaded on first use and kept for the process."""
+
+    def __init__(self, root: str = USERS_MODEL_DIR):
+        self.root = root
+        self._models: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> KNNModel | None:
+        if user_id not in self._models:
+            with self._lock:
+                if user_id not in self._models:
+                    model = KNNModel(user_id, model_dir=os.path.join(self.root, f"user_{user_id}", "knn"))
+                    try:
+                        model.load()
+                    except FileNotFoundError:
+                        model = None
+                    except Exception as e:
+                        # Feature-order mismatch or corrupt artifacts: cache the
+                        # miss so requests don't retry the load and 500 every time
+                        logger.warning("KNN %s unusable, falling back: %s", user_id, e)
+                        model = None
+                    self._models[user_id] = model
+        return self._models[user_id]
@@ -1,8 +1,11 @@
 from app.models.base_model import Basemodel
 import os
 import joblib
-from app.core.config import USERS_MODEL_DIR
-from app.services.feature_extractor import FEATURE_ORDER
+import numpy as np
+from app.core.config import USERS_MODEL_DIR, USE_MMAP_ARTIFACTS
+from app.services import mmap_artifacts
+from app.services.attribution import explain as explain_features
+from app.services.feature_extractor import FEATURE_ORDER, check_feature_order_hash, feature_order_hash
 
 class OneClassSVMModel(Basemodel):
 
@@ -11,12 +14,12 @@ class OneClassSVMModel(Basemodel):
 
     Used for registered users as a form of 2fa with biometric data
     """
-    def __init__(self, user_id: str = "nolanpark"):
+    def __init__(self, user_id: str = "nolanpark", model_dir: str | None = None):
         self.model_name = "one_class_svm"
         self.user_id = user_id
 
-        # IMPORTANT: per-user model directory
-        self.model_dir = os.path.join(USERS_MODEL_DIR, f"user_{user_id}")
+        # IMPORTANT: per-user model directory (or a registry version directory)
+        self.model_dir = model_dir or os.path.join(USERS_MODEL_DIR, f"user_{user_id}")
 
         self.model = None
         self.scaler = None
@@ -24,36 +27,41 @@ class OneClassSVMModel(Basemodel):
         # Match training schema
         self.feature_columns = FEATURE_ORDER
 
-    def load(self):
+    def load(self, use_mmap: bool = USE_MMAP_ARTIFACTS):
         if not os.path.exists(self.model_dir):
             raise FileNotFoundError(
                 f"Model directory {self.model_dir} does not exist"
             )
 
+        # Train/serve skew: the column order this model was trained with
+        order_path = os.path.join(self.model_dir, "feature_order.pkl")
+        if os.path.exists(order_path):
+            check_feature_order_hash(feature_order_hash(joblib.load(order_path)), order_path)
+
+        if use_mmap and mmap_artifacts.has_mmap_artifacts(self.model_dir):
+            # Support vectors and scaler shared with other workers via page cache
+            self.model = mmap_artifacts.MappedOneClassSVM(self.model_dir)
+            self.scaler = mmap_artifacts.MappedScaler(self.model_dir)
+            return
+
         self.model = joblib.load(os.path.join(self.model_dir, "ocsvm.pkl"))
         self.scaler = joblib.load(os.path.join(self.model_dir, "scaler.pkl"))
 
 
-    def predict(self, parsed_features: dict):
+    def predict(self, feature_vector, scaled: bool = False, explain: bool = False):
         """
-        parsed_features: flattened dict from main.py
+        feature_vector: FEATURE_ORDER float32 vector from feature_extractor
+        scaled: the vector is already standardized with this model's scaler
+        explain: add "attribution", the most deviating standardized features
 
         returns:
             score = signed distance from decision boundary
             is_anomaly = true if outside the boundary
         """
 
-        # Align features exactly like training
-        feature_vector = [
-            float(
-                parsed_features.get(col, 0.0)
-                or parsed_features.get(col.split(".")[-1], 0.0)
-            )
-            for col in self.feature_columns
-        ]
-
         # Scale input
-        scaled = self.scaler.transform([feature_vector])
+        row = np.asarray(feature_vector, dtype=np.float32).reshape(1, -1)
+        scaled = row if scaled else self.scaler.transform(row)
 
         # Decision function (distance from boundary)
         score = self.model.decision_function(scaled)[0]
@@ -62,9 +70,13 @@ class OneClassSVMModel(Basemodel):
         prediction = self.model.predict(scaled)[0]
         is_anomaly = prediction == -1
 
-        return {
+        result = {
             "model_name": self.model_name,
             "score": float(score),
             "threshold": 0.0,  # optional, OCSVM doesn't use explicit threshold
             "is_anomaly": bool(is_anomaly),
-        }
\ No newline at end of file
+        }
+        if explain:
+            # The scaled row is already each feature's z-score vs. training
+            result["attribution"] = explain_features("ocsvm", scaled[0])
+        return result
\ No newline at end of file
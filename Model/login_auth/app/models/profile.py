@@ -0,0 +1,86 @@
+from app.models.base_model import Basemodel
+import time
+import numpy as np
+from app.core.config import PROFILE_MIN_SESSIONS, PROFILE_Z_CLIP, PROFILE_Z_THRESHOLD
+from app.services.feature_extractor import FEATURE_DIM, FEATURE_ORDER_HASH
+
+# Per-feature std floor: constant features (paste_detected, viewport-bound
+# values) would otherwise turn any change into an infinite z-score
+MIN_STD = 1e-3
+MIN_STD_FRACTION = 0.05
+
+
+class BehaviorProfileModel(Basemodel):
+
+    """
+    Per-user running feature statistics stored in Users.behaviorProfile
+
+    Mean and M2 are kept with Welford's update, so the profile is a fixed
+    size no matter how many sessions it has absorbed. Scoring is a handful
+    of vector ops (RMS of clipped per-feature z-scores), cheap enough to run
+    on every login as a fallback when a registered user has no OCSVM, or as
+    a pre-check in front of it.
+    """
+    def __init__(self, user_id: str | None = None):
+        self.model_name = "profile"
+        self.user_id = user_id
+
+        self.count = 0
+        self.mean = np.zeros(FEATURE_DIM, dtype=np.float64)
+        self.m2 = np.zeros(FEATURE_DIM, dtype=np.float64)
+        # Count currently in DynamoDB, used as the optimistic-write guard
+        self.stored_count = 0
+
+    def load(self, profile: dict | None = None):
+        """Restore from a behaviorProfile map; empty / stale profiles start fresh."""
+        self.stored_count = int((profile or {}).get("count", 0))
+        if not profile or profile.get("featureOrderHash") != FEATURE_ORDER_HASH:
+            return self
+        self.count = int(profile["count"])
+        self.mean = np.asarray(profile["mean"], dtype=np.float64)
+        self.m2 = np.asarray(profile["m2"], dtype=np.float64)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "featureOrderHash": FEATURE_ORDER_HASH,
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "updatedAt": int(time.time() * 1000),
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.count >= PROFILE_MIN_SESSIONS
+
+    def update(self, feature_vector):
+        x = np.asarray(feature_vector, dtype=np.float64)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def std(self) -> np.ndarray:
+        var = self.m2 / (self.count - 1) if self.count > 1 else np.zeros(FEATURE_DIM)
+        return np.maximum(np.sqrt(var), MIN_STD + MIN_STD_FRACTION * np.abs(self.mean))
+
+    def z_scores(self, feature_vector) -> np.ndarray:
+        x = np.asarray(feature_vector, dtype=np.float64)
+        return np.clip((x - self.mean) / self.std(), -PROFILE_Z_CLIP, PROFILE_Z_CLIP)
+
+    def predict(self, feature_vector, threshold: float = PROFILE_Z_THRESHOLD) -> dict:
+        """
+        feature_vector: flat FEATURE_ORDER vector
+
+        returns:
+            score = RMS of clipped per-feature z-scores against the profile
+            is_anomaly = score above threshold
+        """
+        score = float(np.sqrt(np.mean(self.z_scores(feature_vector) ** 2)))
+        return {
+            "model_name": self.model_name,
+            "score": score,
+            "threshold": threshold,
+            "is_anomaly": score > threshold,
+        }
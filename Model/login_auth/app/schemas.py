@@ -4,7 +4,7 @@ CacheMeOutside - Pydantic request / response models for the FastAPI backend.
 """
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Literal, Optional
 
 
 # ── Nested behavior structure matching behaviorTracker.js ──────────────────
@@ -70,6 +70,24 @@ class SessionRequest(BaseModel):
     # False → unknown / new user (Autoencoder anomaly detection)
 
 
+# ── Streamed raw events (server-side aggregation) ───────────────────────────
+
+class RawEvent(BaseModel):
+    # Same event types behaviorTracker.js listens for
+    type: Literal["mousemove", "keydown", "click", "scroll", "focus", "paste"]
+    t: float                        # performance.now() timestamp in ms
+    x: float = 0                    # mousemove only
+    y: float = 0                    # mousemove only
+    key: Optional[str] = None       # keydown only
+
+
+class EventChunk(BaseModel):
+    events: List[RawEvent] = []
+    # Sent with the first chunk of a session; later chunks may omit them
+    start_time: Optional[float] = None
+    environment: Optional[EnvironmentFeatures] = None
+
+
 # ── Outbound response ──────────────────────────────────────────────────────
 
 class RiskResponse(BaseModel):
@@ -77,4 +95,9 @@ class RiskResponse(BaseModel):
     risk_score: float
     threshold: Optional[float] = None
     is_bot: bool
-    session_id: Optional[str] = None   # echoed back so the frontend can reference it
\ No newline at end of file
+    session_id: Optional[str] = None   # echoed back so the frontend can reference it
+    reason_code: Optional[str] = None  # set when the rule prefilter decided
+    degraded: bool = False             # True when served under load shedding
+    degraded_reason: Optional[str] = None
+    model_scores: Optional[dict] = None  # per-model breakdown in ensemble mode
+    attribution: Optional[dict] = None   # top features per model, with ?explain=true
\ No newline at end of file
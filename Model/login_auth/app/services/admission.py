@@ -0,0 +1,203 @@
+"""
+admission.py
+CacheMeOutside
+
+Admission control for /analyze.
+
+AdmissionController counts in-flight requests and keeps an exponentially
+weighted moving average of request latency. Every request is admitted at
+one of three levels, chosen from those two signals:
+
+  NORMAL    full pipeline.
+  DEGRADED  scoring and the session result are written synchronously.
+            Payload and event storage go to a bounded background queue.
+  SHED      no DynamoDB work at all, and the shared autoencoder is used
+            for scoring, with no per-user model load.
+
+Past `max_in_flight` requests are rejected outright so queued work stays
+bounded.
+
+/analyze is a sync endpoint, so FastAPI runs it on the anyio threadpool
+(40 threads by default). Admission therefore happens in an HTTP middleware
+on the event loop, before the request waits for a thread. in_flight counts
+requests queued for a thread as well as running ones, and the latency
+average includes the time spent in that queue. Shed requests are cheap, so they pull the latency average back
+down, and the controller recovers without a timer.
+
+DeferredWork is the bounded queue used at DEGRADED. When it is full, the
+work is dropped and counted instead of blocking the request.
+"""
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core.config import (
+    ADMISSION_DEGRADE_INFLIGHT,
+    ADMISSION_DEGRADE_LATENCY_MS,
+    ADMISSION_EWMA_ALPHA,
+    ADMISSION_MAX_INFLIGHT,
+    ADMISSION_SHED_INFLIGHT,
+    ADMISSION_SHED_LATENCY_MS,
+    DEFERRED_QUEUE_SIZE,
+)
+
+NORMAL = "normal"
+DEGRADED = "degraded"
+SHED = "shed"
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionController.admit when the hard in-flight cap is hit."""
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        degrade_in_flight: int = ADMISSION_DEGRADE_INFLIGHT,
+        shed_in_flight: int = ADMISSION_SHED_INFLIGHT,
+        max_in_flight: int = ADMISSION_MAX_INFLIGHT,
+        degrade_latency_ms: float = ADMISSION_DEGRADE_LATENCY_MS,
+        shed_latency_ms: float = ADMISSION_SHED_LATENCY_MS,
+        alpha: float = ADMISSION_EWMA_ALPHA,
+    ):
+        self.degrade_in_flight = degrade_in_flight
+        self.shed_in_flight = shed_in_flight
+        self.max_in_flight = max_in_flight
+        self.degrade_latency_ms = degrade_latency_ms
+        self.shed_latency_ms = shed_latency_ms
+        self.alpha = alpha
+
+        self.in_flight = 0
+        self.latency_ewma_ms = 0.0
+        self.counts = {NORMAL: 0, DEGRADED: 0, SHED: 0, "rejected": 0}
+        self.threadpool_tokens = None
+        self._lock = threading.Lock()
+
+    def check_threadpool(self, tokens: int):
+        """Compare the limits with the worker thread count (run at startup on the event loop)."""
+        self.threadpool_tokens = tokens
+        if self.degrade_in_flight >= tokens:
+            logger.warning(
+                "ADMISSION_DEGRADE_INFLIGHT=%d is not below the %d threadpool threads; "
+                "requests queue for a thread before admission degrades",
+                self.degrade_in_flight, tokens,
+            )
+
+    def _level(self) -> tuple[str, str | None]:
+        # Called with the lock held; in_flight already includes this request
+        if self.in_flight > self.shed_in_flight:
+            return SHED, "in_flight"
+        if self.latency_ewma_ms > self.shed_latency_ms:
+            return SHED, "latency"
+        if self.in_flight > self.degrade_in_flight:
+            return DEGRADED, "in_flight"
+        if self.latency_ewma_ms > self.degrade_latency_ms:
+            return DEGRADED, "latency"
+        return NORMAL, None
+
+    @contextmanager
+    def admit(self):
+        """
+        Yields (level, reason) for one request and records its latency on
+        exit. Raises Overloaded without admitting when the cap is reached.
+        """
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.counts["rejected"] += 1
+                raise Overloaded(f"{self.in_flight} requests in flight")
+            self.in_flight += 1
+            level, reason = self._level()
+            self.counts[level] += 1
+
+        start = time.perf_counter()
+        try:
+            yield level, reason
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.in_flight -= 1
+                self.latency_ewma_ms += self.alpha * (elapsed_ms - self.latency_ewma_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            level, reason = self._level()
+            return {
+                "level": level,
+                "reason": reason,
+                "in_flight": self.in_flight,
+                "latency_ewma_ms": round(self.latency_ewma_ms, 3),
+                "admitted": dict(self.counts),
+                "threadpool_tokens": self.threadpool_tokens,
+                "limits": {
+                    "degrade_in_flight": self.degrade_in_flight,
+                    "shed_in_flight": self.shed_in_flight,
+                    "max_in_flight": self.max_in_flight,
+                    "degrade_latency_ms": self.degrade_latency_ms,
+                    "shed_latency_ms": self.shed_latency_ms,
+                },
+            }
+
+
+class DeferredWork:
+    """Bounded FIFO of optional work run by one daemon thread."""
+
+    def __init__(self, maxsize: int = DEFERRED_QUEUE_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = None
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            fn, args, kwargs = item
+            try:
+                fn(*args, **kwargs)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("deferred %s failed: %s", getattr(fn, "__name__", fn), e)
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="deferred-work", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 5.0):
+        """Drain what's queued (up to timeout_s), then stop the worker."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout_s)
+        except queue.Full:
+            return
+        self._thread.join(timeout_s)
+        self._thread = None
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,57 @@
+"""
+attribution.py
+CacheMeOutside
+
+Per-feature explanations built from arrays the models already computed
+while scoring. No extra forward pass is needed.
+
+  autoencoder  reconstruction_error: each feature's share of the squared
+               reconstruction error (non-negative, summing to 1 over all
+               features). The squared errors are the same tensor the
+               score is the mean of.
+  ocsvm, knn   scaled_deviation: the standardized input (x - mean) / scale,
+               already computed by the model's scaler. It is signed, and
+               +3 means three training standard deviations above the mean.
+
+Only the ATTRIBUTION_TOP_K largest (by magnitude) are kept, as
+{"method": ..., "features": {feature: value}}, largest first. That is a
+few dozen bytes per model, stored on the session (Sessions.attribution)
+so the dashboard never recomputes it.
+"""
+
+import numpy as np
+
+from app.core.config import ATTRIBUTION_TOP_K
+from app.services.feature_extractor import FEATURE_ORDER
+
+METHODS = {
+    "autoencoder": "reconstruction_error",
+    "ocsvm": "scaled_deviation",
+    "one_class_svm": "scaled_deviation",
+    "knn": "scaled_deviation",
+}
+
+
+def top_indices(weights: np.ndarray, k: int = ATTRIBUTION_TOP_K) -> np.ndarray:
+    """Indices of the k largest |weights|, largest first."""
+    weights = np.abs(np.asarray(weights, dtype=np.float32).ravel())
+    k = min(k, len(weights))
+    idx = np.argpartition(-weights, k - 1)[:k]
+    return idx[np.argsort(-weights[idx], kind="stable")]
+
+
+def explain(model_name: str, weights, k: int = ATTRIBUTION_TOP_K) -> dict | None:
+    """One model's attribution from its per-feature weight vector."""
+    if k <= 0:
+        return None
+    weights = np.asarray(weights, dtype=np.float32).ravel()
+    return {
+        "method": METHODS.get(model_name, "scaled_deviation"),
+        "features": {FEATURE_ORDER[i]: round(float(weights[i]), 4) for i in top_indices(weights, k)},
+    }
+
+
+def reconstruction_shares(squared_errors) -> np.ndarray:
+    squared_errors = np.asarray(squared_errors, dtype=np.float32).ravel()
+    total = float(squared_errors.sum())
+    return squared_errors / total if total > 0 else squared_errors
@@ -0,0 +1,261 @@
+"""
+drift.py
+CacheMeOutside
+
+Feature drift monitoring: live feature distributions vs. the training data.
+
+The autoencoder is trained on one snapshot. Browser updates, tracker
+changes or new bots move the 24 features without any error, and the
+threshold goes stale silently. This module compares what the service sees
+against what the model was trained on:
+
+  reference  per feature, DRIFT_BINS bins with edges at the training
+             quantiles (about equal mass per bin) and the training counts.
+             Written to drift_reference.npz by train_autoencoder.py (or
+             training/build_drift_reference.py) and published with the
+             registry version, so it always matches the live autoencoder.
+  live       a ring of DRIFT_WINDOWS time windows of DRIFT_WINDOW_S each,
+             holding (features x bins) counts. Every scored session adds one
+             count per feature. Binning is a single vectorized comparison
+             against all edges.
+
+scores() computes, in one numpy pass over all windows and features:
+  PSI  sum((p - q) * ln(p / q)) over bins; < 0.1 stable, 0.1-0.25 moderate,
+       > DRIFT_PSI_ALERT (default 0.25) significant drift
+  KS   max |CDF_live - CDF_ref| over bin edges. This is the binned two-sample
+       Kolmogorov-Smirnov statistic, compared with the 5% critical value.
+
+GET /monitoring/drift reports both, per feature and per window. A
+background check logs a warning every DRIFT_CHECK_S while any feature is
+above the alert level. The counts are per process, like /monitoring/scores
+with scope=worker.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import (
+    DRIFT_BINS,
+    DRIFT_CHECK_S,
+    DRIFT_MIN_SAMPLES,
+    DRIFT_PSI_ALERT,
+    DRIFT_PSI_WARN,
+    DRIFT_WINDOW_S,
+    DRIFT_WINDOWS,
+)
+from app.services.feature_extractor import FEATURE_ORDER, FEATURE_ORDER_HASH, check_feature_order_hash
+
+REFERENCE_FILENAME = "drift_reference.npz"
+_EPS = 1e-4     # floor for empty bins so PSI stays finite
+
+logger = logging.getLogger(__name__)
+
+
+# ── Reference (training side) ─────────────────────────────────────────────────
+def bin_indices(X: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """(N, F) bin index per value; bin b holds edges[b-1] < x <= edges[b]."""
+    X = np.asarray(X, dtype=np.float64).reshape(-1, edges.shape[0])
+    return (X[:, :, None] > edges[None, :, :]).sum(axis=2)
+
+
+def reference_edges(X: np.ndarray, bins: int = DRIFT_BINS) -> dict:
+    """Quantile bin edges from a (sample of the) training matrix, zero counts."""
+    X = np.asarray(X, dtype=np.float64)
+    edges = np.quantile(X, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T   # (F, bins - 1)
+    return {"edges": edges, "counts": np.zeros((X.shape[1], bins), dtype=np.int64)}
+
+
+def add_counts(reference: dict, X: np.ndarray):
+    """Adds a chunk of training rows to the reference counts."""
+    idx = bin_indices(X, reference["edges"])
+    features, bins = reference["counts"].shape
+    flat = (np.arange(features)[None, :] * bins + idx).ravel()
+    reference["counts"] += np.bincount(flat, minlength=features * bins).reshape(features, bins)
+
+
+def build_reference(X: np.ndarray, bins: int = DRIFT_BINS) -> dict:
+    reference = reference_edges(X, bins)
+    add_counts(reference, X)
+    return reference
+
+
+def save_reference(reference: dict, model_dir: str) -> str:
+    path = os.path.join(model_dir, REFERENCE_FILENAME)
+    np.savez(path, edges=reference["edges"], counts=reference["counts"],
+             feature_order_hash=np.array(FEATURE_ORDER_HASH))
+    return path
+
+
+def load_reference(model_dir: str) -> dict | None:
+    path = os.path.join(model_dir, REFERENCE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        check_feature_order_hash(str(data["feature_order_hash"]), path)
+        return {"edges": data["edges"], "counts": data["counts"], "path": path}
+
+
+# ── Drift statistics ──────────────────────────────────────────────────────────
+def psi_ks(live: np.ndarray, reference: np.ndarray) -> tuple:
+    """
+    live: (..., F, B) counts, reference: (F, B) counts.
+    Returns (psi, ks), each shaped (..., F).
+    """
+    p = live / np.maximum(live.sum(axis=-1, keepdims=True), 1)
+    q = reference / np.maximum(reference.sum(axis=-1, keepdims=True), 1)
+    ks = np.abs(np.cumsum(p, axis=-1) - np.cumsum(q, axis=-1)).max(axis=-1)
+    p = np.clip(p, _EPS, None)
+    q = np.clip(q, _EPS, None)
+    psi = ((p - q) * np.log(p / q)).sum(axis=-1)
+    return psi, ks
+
+
+def ks_critical(n: int, m: int, c_alpha: float = 1.358) -> float | None:
+    """Two-sample KS critical value at alpha = 0.05."""
+    if n <= 0 or m <= 0:
+        return None
+    return c_alpha * math.sqrt((n + m) / (n * m))
+
+
+# ── Live monitor ──────────────────────────────────────────────────────────────
+class DriftMonitor:
+    def __init__(self, window_s: float = DRIFT_WINDOW_S, windows: int = DRIFT_WINDOWS,
+                 min_samples: int = DRIFT_MIN_SAMPLES, check_s: float = DRIFT_CHECK_S):
+        self.window_s = window_s
+        self.windows = windows
+        self.min_samples = min_samples
+        self.check_s = check_s
+
+        self.reference = None
+        self._model_dir = None          # reference source; reloaded when the autoencoder swaps
+        self._counts = None             # (windows, F, B) int64 ring
+        self._window_ids = np.full(windows, -1, dtype=np.int64)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_reference(self, model_dir: str | None) -> bool:
+        """Loads the reference that belongs to the live autoencoder; resets live counts on change."""
+        if self.windows <= 0:
+            return False
+        if model_dir == self._model_dir:
+            return self.reference is not None
+        with self._lock:
+            if model_dir != self._model_dir:
+                try:
+                    reference = load_reference(model_dir) if model_dir else None
+                except Exception as e:
+                    logger.warning("drift reference in %s unusable: %s", model_dir, e)
+                    reference = None
+                self.reference = reference
+                self._model_dir = model_dir
+                self._window_ids[:] = -1
+                self._counts = np.zeros((self.windows, *reference["counts"].shape), dtype=np.int64) \
+                    if reference is not None else None
+        return self.reference is not None
+
+    def record(self, vector, model_dir: str | None):
+        """One scored session's raw FEATURE_ORDER vector."""
+        if not self.ensure_reference(model_dir):
+            return
+        reference = self.reference
+        idx = bin_indices(vector, reference["edges"])[0]
+        window_id = int(time.time() // self.window_s)
+        slot = window_id % self.windows
+        with self._lock:
+            if self.reference is not reference:
+                return          # swapped while binning; the vector belongs to the old model
+            if self._window_ids[slot] != window_id:
+                self._counts[slot] = 0
+                self._window_ids[slot] = window_id
+            self._counts[slot, np.arange(len(idx)), idx] += 1
+
+    def scores(self, windows: int | None = None) -> dict:
+        with self._lock:
+            if self.reference is None or self._counts is None:
+                return {"enabled": False, "reason": f"no {REFERENCE_FILENAME} for the live autoencoder"}
+            counts = self._counts.copy()
+            window_ids = self._window_ids.copy()
+            reference = self.reference
+
+        current = int(time.time() // self.window_s)
+        span = min(windows or self.windows, self.windows)
+        valid = (window_ids > current - span) & (window_ids >= 0)
+        order = np.argsort(window_ids[valid])
+        live = counts[valid][order]                       # (K, F, B), oldest first
+        ids = window_ids[valid][order]
+
+        # Per window plus the whole span as one more row, one vectorized pass
+        stacked = np.concatenate([live, live.sum(axis=0, keepdims=True)])
+        psi, ks = psi_ks(stacked, reference["counts"])
+        sessions = stacked[:, 0, :].sum(axis=1)           # every session adds one count per feature
+        ref_rows = int(reference["counts"][0].sum())
+
+        total = int(sessions[-1])
+        enough = total >= self.min_samples
+        per_feature = {
+            name: {"psi": round(float(psi[-1, i]), 4), "ks": round(float(ks[-1, i]), 4)} if enough else None
+            for i, name in enumerate(FEATURE_ORDER)
+        }
+        drifted = [
+            FEATURE_ORDER[i] for i in np.argsort(-psi[-1]) if enough and psi[-1, i] >= DRIFT_PSI_ALERT
+        ]
+        return {
+            "enabled": True,
+            "reference": {"path": reference["path"], "rows": ref_rows, "bins": reference["counts"].shape[1]},
+            "window_s": self.window_s,
+            "thresholds": {
+                "psi_warn": DRIFT_PSI_WARN,
+                "psi_alert": DRIFT_PSI_ALERT,
+                "ks_critical": ks_critical(total, ref_rows),
+                "min_samples": self.min_samples,
+            },
+            "overall": {
+                "sessions": total,
+                "max_psi": round(float(psi[-1].max()), 4) if enough else None,
+                "drifted": drifted,
+                "features": per_feature,
+            },
+            "windows": [
+                {
+                    "start": int(window_id * self.window_s),
+                    "sessions": int(sessions[k]),
+                    "max_psi": round(float(psi[k].max()), 4) if sessions[k] >= self.min_samples else None,
+                    "max_psi_feature": FEATURE_ORDER[int(psi[k].argmax())]
+                    if sessions[k] >= self.min_samples else None,
+                    "mean_psi": round(float(psi[k].mean()), 4) if sessions[k] >= self.min_samples else None,
+                }
+                for k, window_id in enumerate(ids)
+            ],
+        }
+
+    # ── Background check ──────────────────────────────────────────────────
+    def check(self):
+        report = self.scores()
+        if report.get("enabled") and report["overall"]["drifted"]:
+            logger.warning(
+                "feature drift above PSI %.2f: %s", DRIFT_PSI_ALERT, ", ".join(report["overall"]["drifted"]),
+                extra={"drift_max_psi": report["overall"]["max_psi"], "sessions": report["overall"]["sessions"]},
+            )
+
+    def start(self):
+        if self._thread is not None or self.check_s <= 0:
+            return
+
+        def loop():
+            while not self._stop.wait(self.check_s):
+                try:
+                    self.check()
+                except Exception as e:
+                    logger.warning("drift check failed: %s", e)
+
+        self._thread = threading.Thread(target=loop, name="drift-check", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
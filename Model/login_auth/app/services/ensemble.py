@@ -0,0 +1,143 @@
+"""
+ensemble.py
+CacheMeOutside
+
+Autoencoder + per-user verifier (OCSVM or KNN) scoring for registered users.
+
+Both models get the same FEATURE_ORDER vector from vector_from_payload, so
+feature extraction runs once. When the two models were fitted with the same
+scaler (same mean_ / scale_), the vector is standardized once as well and
+each model is called with scaled=True. Models with their own scalers, and the
+onnx autoencoder, whose graph does its own scaling, keep scaling themselves.
+
+The OCSVM runs on a small shared thread pool while the request thread runs
+the autoencoder. Torch and numpy release the GIL inside their kernels, so an
+ensemble request costs about as much as the slower model instead of the sum
+of both.
+
+Fusion policies (ENSEMBLE_POLICY):
+  any       anomaly if either model flags it (stricter)
+  all       anomaly only if both flag it (fewer false rejections)
+  weighted  weighted mean of normalized risks compared to ENSEMBLE_THRESHOLD
+
+Normalized risk puts both models on one scale, where 1.0 means "at this
+model's own threshold":
+  autoencoder  reconstruction error / threshold
+  ocsvm        1 - decision_function, floored at 0 (boundary = 1.0)
+  knn          mean neighbour distance / threshold
+"""
+
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.core.config import ENSEMBLE_POLICY, ENSEMBLE_THRESHOLD, ENSEMBLE_WEIGHTS, ENSEMBLE_WORKERS
+
+POLICIES = ("any", "all", "weighted")
+
+
+def parse_weights(spec: str) -> dict:
+    """'autoencoder=0.5,ocsvm=0.5' -> {"autoencoder": 0.5, "ocsvm": 0.5}"""
+    weights = {}
+    for part in spec.split(","):
+        if part.strip():
+            name, _, value = part.partition("=")
+            weights[name.strip()] = float(value)
+    return weights
+
+
+def normalized_risk(output: dict) -> float:
+    if output["model_name"] == "ocsvm":
+        return max(0.0, 1.0 - output["score"])
+    threshold = output.get("threshold")
+    return output["score"] / threshold if threshold else output["score"]
+
+
+def _same_scaler(a, b) -> bool:
+    try:
+        return np.array_equal(a.mean_, b.mean_) and np.array_equal(a.scale_, b.scale_)
+    except AttributeError:
+        return False
+
+
+class EnsembleScorer:
+    def __init__(self, policy: str = ENSEMBLE_POLICY, weights: str = ENSEMBLE_WEIGHTS,
+                 threshold: float = ENSEMBLE_THRESHOLD, workers: int = ENSEMBLE_WORKERS):
+        if policy not in POLICIES + ("off",):
+            raise ValueError(f"unknown ensemble policy {policy!r}, expected one of {POLICIES} or 'off'")
+        self.policy = policy
+        self.weights = parse_weights(weights)
+        self.threshold = threshold
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ensemble") \
+            if policy != "off" else None
+        # autoencoder -> {verifier -> shared scaler or None}. Weak keys: entries go
+        # with the models the registry drops, and a new model never inherits them.
+        self._shared_scaler = weakref.WeakKeyDictionary()
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool is not None
+
+    def _scaler_for(self, autoencoder, ocsvm):
+        by_verifier = self._shared_scaler.get(autoencoder)
+        if by_verifier is None:
+            by_verifier = self._shared_scaler.setdefault(autoencoder, weakref.WeakKeyDictionary())
+        if ocsvm not in by_verifier:
+            shared = autoencoder.backend != "onnx" and _same_scaler(autoencoder.scaler, ocsvm.scaler)
+            by_verifier[ocsvm] = autoencoder.scaler if shared else None
+        return by_verifier[ocsvm]
+
+    def fuse(self, outputs: dict) -> dict:
+        """Combine {"autoencoder": out, "ocsvm": out} into one predict()-shaped dict."""
+        flags = [out["is_anomaly"] for out in outputs.values()]
+        risks = {name: normalized_risk(out) for name, out in outputs.items()}
+
+        if self.policy == "any":
+            is_anomaly = any(flags)
+        elif self.policy == "all":
+            is_anomaly = all(flags)
+        else:
+            is_anomaly = None
+        weights = {name: self.weights.get(name, 0.0) for name in risks}
+        if sum(weights.values()) <= 0:
+            weights = dict.fromkeys(risks, 1.0)
+        score = sum(weights[name] * r for name, r in risks.items()) / sum(weights.values())
+        if is_anomaly is None:
+            is_anomaly = score > self.threshold
+
+        attribution = {name: out["attribution"] for name, out in outputs.items() if out.get("attribution")}
+        return {
+            "model_name": f"ensemble:{self.policy}",
+            "attribution": attribution or None,
+            "score": float(score),
+            "threshold": self.threshold,
+            "is_anomaly": bool(is_anomaly),
+            "model_scores": {
+                name: {
+                    "score": out["score"],
+                    "threshold": out.get("threshold"),
+                    "risk": risks[name],
+                    "is_anomaly": out["is_anomaly"],
+                }
+                for name, out in outputs.items()
+            },
+        }
+
+    def predict(self, autoencoder, ocsvm, vector, verifier_name: str = "ocsvm", explain: bool = False) -> dict:
+        scaler = self._scaler_for(autoencoder, ocsvm)
+        if scaler is not None:
+            vector = scaler.transform(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        scaled = scaler is not None
+
+        pending = self._pool.submit(ocsvm.predict, vector, scaled, explain)
+        ae_output = autoencoder.predict(vector, scaled=scaled, explain=explain)
+        ae_output["model_name"] = "autoencoder"
+        svm_output = pending.result()
+        svm_output["model_name"] = verifier_name
+
+        return self.fuse({"autoencoder": ae_output, verifier_name: svm_output})
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -17,10 +17,28 @@ Frontend sends:
   environment: { viewport_width, viewport_height, timezone_offset, device_pixel_ratio }
 }
 
-Models expect: List[float] of length FEATURE_DIM (24)
+Models expect: float32 vector of length FEATURE_DIM (24), or an
+(N, FEATURE_DIM) matrix for batches.
+
+This is the single extractor for serving and training. vector_from_payload
+reads a validated BehaviorPayload straight into a float32 array, using one
+precompiled attrgetter per feature and no intermediate dicts.
+vector_from_json validates raw JSON bytes with pydantic's native parser
+first. flatten_behavior (plain dicts from exports and training CSVs) goes
+through the same schema and the same getters, so train and serve can't
+drift apart. FEATURE_ORDER_HASH is stored with every model artifact and
+checked at load time.
 """
 
-from typing import List
+import hashlib
+import json
+import logging
+from operator import attrgetter
+from typing import Iterable, List
+
+import numpy as np
+
+from app.schemas import BehaviorPayload
 
 # The canonical feature order. Must stay in sync with training scripts.
 FEATURE_ORDER = [
@@ -56,6 +74,51 @@ FEATURE_ORDER = [
 
 FEATURE_DIM = len(FEATURE_ORDER)  # 24
 
+logger = logging.getLogger(__name__)
+
+
+def feature_order_hash(order: List[str] = FEATURE_ORDER) -> str:
+    """Short fingerprint of a feature order, stored with model artifacts."""
+    return hashlib.sha256(json.dumps(list(order)).encode()).hexdigest()[:16]
+
+
+FEATURE_ORDER_HASH = feature_order_hash()
+
+
+# One compiled getter per feature, e.g. attrgetter("mouse.total_moves");
+# fails at import if FEATURE_ORDER names a field BehaviorPayload lacks
+_GETTERS = [attrgetter(key) for key in FEATURE_ORDER]
+for _getter in _GETTERS:
+    _getter(BehaviorPayload())
+_SPLIT_ORDER = [key.split(".", 1) for key in FEATURE_ORDER]
+
+
+def vector_from_payload(payload: BehaviorPayload) -> np.ndarray:
+    """Validated payload -> float32 vector in FEATURE_ORDER (bools -> 0/1)."""
+    return np.fromiter((get(payload) for get in _GETTERS), dtype=np.float32, count=FEATURE_DIM)
+
+
+def matrix_from_payloads(payloads: Iterable[BehaviorPayload]) -> np.ndarray:
+    """(N, FEATURE_DIM) float32 matrix, one row per payload."""
+    payloads = list(payloads)
+    matrix = np.empty((len(payloads), FEATURE_DIM), dtype=np.float32)
+    for i, payload in enumerate(payloads):
+        matrix[i] = [get(payload) for get in _GETTERS]
+    return matrix
+
+
+def vector_from_json(raw: bytes | str) -> np.ndarray:
+    """Raw BehaviorPayload JSON -> float32 vector (pydantic-core parsing, no dict step)."""
+    return vector_from_payload(BehaviorPayload.model_validate_json(raw))
+
+
+def check_feature_order_hash(artifact_hash: str | None, source: str):
+    """Raises ValueError when an artifact was built with another feature order."""
+    if artifact_hash != FEATURE_ORDER_HASH:
+        raise ValueError(
+            f"{source}: feature order hash {artifact_hash} does not match serving hash {FEATURE_ORDER_HASH}"
+        )
+
 
 def flatten_behavior(behavior: dict) -> List[float]:
     """
@@ -69,26 +132,22 @@ def flatten_behavior(behavior: dict) -> List[float]:
         List of FEATURE_DIM floats in canonical order.
 
     Raises:
-        ValueError if a required feature is missing.
+        ValueError (pydantic ValidationError) if a feature has the wrong type.
+        Explicit nulls (DynamoDB NULL) are not errors; they count as missing.
     """
-    vector = []
-
-    for key in FEATURE_ORDER:
-        group, field = key.split(".", 1)
-
-        group_data = behavior.get(group, {})
-        raw = group_data.get(field)
-
-        if raw is None:
+    # null -> missing, so it takes the schema default like an absent key
+    behavior = {
+        group: {field: value for field, value in values.items() if value is not None}
+        if isinstance(values, dict) else values
+        for group, values in behavior.items() if values is not None
+    }
+    payload = BehaviorPayload.model_validate(behavior)
+
+    for group, field in _SPLIT_ORDER:
+        if field not in getattr(payload, group).model_fields_set:
             # Missing feature — default to 0.0 so a bad frontend payload
-            # doesn't crash inference. Log it so the team can catch drift.
-            print(f"[WARN] feature_extractor: missing feature '{key}', defaulting to 0.0")
-            raw = 0.0
-
-        # Convert booleans to float
-        if isinstance(raw, bool):
-            raw = 1.0 if raw else 0.0
-
-        vector.append(float(raw))
+            # doesn't crash inference. Log it so the team can catch drift
+            # (rate limited per feature by app.core.log).
+            logger.warning("missing feature '%s.%s', defaulting to 0.0", group, field)
 
-    return vector
+    return vector_from_payload(payload).tolist()
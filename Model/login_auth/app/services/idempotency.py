@@ -0,0 +1,156 @@
+"""
+idempotency.py
+CacheMeOutside
+
+Idempotency for retried /analyze submissions.
+
+LoginForm and the gateway retry /analyze on timeouts. Without this, every
+retry repeats the user lookup, creates another session, runs inference
+again and writes another set of BehavioralEvents rows.
+
+Requests are keyed on the client's Idempotency-Key header, scoped to the
+username. Without the header, the key is a hash of the username, the
+password digest and the canonical behavior JSON. A retry carries the same
+tracker snapshot, so it produces the same key. With the header, that hash is
+stored with the entry as a fingerprint: reusing a key for a different
+password or payload raises IdempotencyKeyReused (422) instead of replaying
+another request's response.
+
+  completed key within IDEMPOTENCY_TTL_S  -> cached response (same session_id)
+  key still being computed                -> wait for that computation, share its result
+  failed computation                      -> not cached; waiters get the same error,
+                                             the next retry computes again
+
+Entries live in an LRU bounded by IDEMPOTENCY_MAX_ENTRIES, so memory stays
+flat under a flood of unique requests. The cache is per process. Retries that
+land on another uvicorn worker are still computed twice, which is also what
+happened before.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.config import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_S, IDEMPOTENCY_WAIT_S
+
+
+class IdempotencyKeyReused(ValueError):
+    """An Idempotency-Key was sent again with a different request body."""
+
+
+def request_fingerprint(username: str, password: str, behavior_json: str) -> str:
+    password_digest = hashlib.sha256(password.encode()).hexdigest()
+    material = f"body\0{username}\0{password_digest}\0{behavior_json}"
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def request_key(username: str, password: str, behavior_json: str, client_key: str | None = None) -> str:
+    if client_key:
+        return hashlib.sha256(f"key\0{username}\0{client_key}".encode()).hexdigest()
+    return request_fingerprint(username, password, behavior_json)
+
+
+class _Entry:
+    __slots__ = ("done", "result", "error", "expires_at", "fingerprint")
+
+    def __init__(self, fingerprint: str | None = None):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires_at = None     # set once the result is in
+        self.fingerprint = fingerprint
+
+
+class IdempotencyCache:
+    def __init__(self, ttl_s: float = IDEMPOTENCY_TTL_S, max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 wait_s: float = IDEMPOTENCY_WAIT_S):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.wait_s = wait_s
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.computed = 0
+        self.replayed = 0      # served from a completed entry
+        self.collapsed = 0     # waited on an in-flight duplicate
+        self.rejected = 0      # key reused with a different fingerprint
+
+    def _evict(self, now: float):
+        while len(self._entries) > self.max_entries:
+            key, entry = next(iter(self._entries.items()))
+            if not entry.done.is_set():
+                break      # oldest is still in flight, never drop it
+            del self._entries[key]
+        # Expired entries sit at the front once they stop being touched
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at is None or entry.expires_at > now:
+                break
+            del self._entries[key]
+
+    def get_or_compute(self, key: str, compute, fingerprint: str | None = None) -> tuple:
+        """
+        Returns (result, replayed). compute() runs at most once per key
+        within the TTL; its exceptions propagate to every waiting caller.
+        Raises IdempotencyKeyReused if the key is cached with a different
+        fingerprint.
+        """
+        if self.ttl_s <= 0:
+            return compute(), False
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry(fingerprint)
+                self._evict(now)
+            elif entry.fingerprint != fingerprint:
+                self.rejected += 1
+                raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+            else:
+                self._entries.move_to_end(key)
+                if entry.done.is_set():
+                    self.replayed += 1
+                else:
+                    self.collapsed += 1
+
+        if not owner:
+            if not entry.done.wait(self.wait_s):
+                raise TimeoutError("duplicate request is still being processed")
+            if entry.error is not None:
+                raise entry.error
+            return dict(entry.result), True
+
+        try:
+            result = compute()
+        except BaseException as e:
+            entry.error = e
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry.done.set()
+            raise
+
+        entry.result = result
+        entry.expires_at = time.monotonic() + self.ttl_s
+        with self._lock:
+            self.computed += 1
+        entry.done.set()
+        return result, False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "ttl_s": self.ttl_s,
+                "entries": len(self._entries),
+                "in_flight": sum(not e.done.is_set() for e in self._entries.values()),
+                "computed": self.computed,
+                "replayed": self.replayed,
+                "collapsed": self.collapsed,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,156 @@
+"""
+mmap_artifacts.py
+CacheMeOutside
+
+Memory-mappable copies of the model artifacts.
+
+The pickled / torch.save artifacts are deserialized into private heap memory,
+so every uvicorn worker ends up holding its own copy of the autoencoder and of
+every cached per-user OCSVM. This module writes the same numbers as plain
+.npy arrays under `<model_dir>/mmap/` and maps them back read-only with
+np.load(mmap_mode="r"). Pages are then backed by the OS page cache and shared
+between all workers on the host.
+
+Layout:
+    saved_models/autoencoder/mmap/
+        model.<param>.npy          one file per state_dict tensor
+        scaler.mean.npy, scaler.scale.npy
+    saved_models/user/user_<id>/mmap/
+        scaler.mean.npy, scaler.scale.npy
+        ocsvm.support_vectors.npy, ocsvm.dual_coef.npy, ocsvm.intercept.npy
+        ocsvm.json                 kernel parameters
+
+Files are written to a temp name and renamed into place, so a worker that
+already mapped the old version keeps reading a consistent (old) inode.
+"""
+
+import json
+import os
+import warnings
+
+import joblib
+import numpy as np
+
+MMAP_SUBDIR = "mmap"
+
+
+# ── Writing ───────────────────────────────────────────────────────────────────
+def _save_array(out_dir: str, name: str, array) -> None:
+    path = os.path.join(out_dir, f"{name}.npy")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+def export_scaler(scaler, out_dir: str) -> None:
+    _save_array(out_dir, "scaler.mean", np.asarray(scaler.mean_, dtype=np.float64))
+    _save_array(out_dir, "scaler.scale", np.asarray(scaler.scale_, dtype=np.float64))
+
+
+def export_autoencoder(model_dir: str, weights_file: str = "best_autoencoder.pt") -> str:
+    """Write the autoencoder weights and scaler of `model_dir` as .npy arrays."""
+    import torch
+
+    out_dir = os.path.join(model_dir, MMAP_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    state_dict = torch.load(os.path.join(model_dir, weights_file), map_location="cpu")
+    for key, tensor in state_dict.items():
+        _save_array(out_dir, f"model.{key}", tensor.detach().cpu().numpy())
+
+    export_scaler(joblib.load(os.path.join(model_dir, "scaler.pkl")), out_dir)
+    return out_dir
+
+
+def export_ocsvm(model_dir: str) -> str:
+    """Write a per-user OCSVM (rbf kernel) and its scaler as .npy arrays."""
+    model = joblib.load(os.path.join(model_dir, "ocsvm.pkl"))
+    if model.kernel != "rbf":
+        raise ValueError(f"Only rbf kernels can be memory-mapped, got '{model.kernel}'")
+
+    out_dir = os.path.join(model_dir, MMAP_SUBDIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # _dual_coef_ / _intercept_ are the raw libsvm values used by
+    # decision_function (for one-class they equal the public attributes).
+    _save_array(out_dir, "ocsvm.support_vectors", np.asarray(model.support_vectors_, dtype=np.float64))
+    _save_array(out_dir, "ocsvm.dual_coef", np.asarray(model._dual_coef_, dtype=np.float64))
+    _save_array(out_dir, "ocsvm.intercept", np.asarray(model._intercept_, dtype=np.float64))
+    with open(os.path.join(out_dir, "ocsvm.json"), "w") as f:
+        json.dump({"kernel": "rbf", "gamma": float(model._gamma)}, f)
+
+    export_scaler(joblib.load(os.path.join(model_dir, "scaler.pkl")), out_dir)
+    return out_dir
+
+
+# ── Reading ───────────────────────────────────────────────────────────────────
+def has_mmap_artifacts(model_dir: str) -> bool:
+    return os.path.exists(os.path.join(model_dir, MMAP_SUBDIR, "scaler.mean.npy"))
+
+
+def load_array(model_dir: str, name: str) -> np.ndarray:
+    """Map one exported array read-only (no copy into process memory)."""
+    return np.load(os.path.join(model_dir, MMAP_SUBDIR, f"{name}.npy"), mmap_mode="r")
+
+
+def load_state_dict(model_dir: str) -> dict:
+    """
+    Build a torch state_dict whose tensors are views over the mapped files.
+    Load it with `module.load_state_dict(state, assign=True)` so the module
+    keeps the mapped tensors instead of copying them into its own storage.
+    """
+    import torch
+
+    mmap_dir = os.path.join(model_dir, MMAP_SUBDIR)
+    state = {}
+    for file_name in sorted(os.listdir(mmap_dir)):
+        if not (file_name.startswith("model.") and file_name.endswith(".npy")):
+            continue
+        key = file_name[len("model."):-len(".npy")]
+        array = np.load(os.path.join(mmap_dir, file_name), mmap_mode="r")
+        with warnings.catch_warnings():
+            # torch warns that the array is not writable; that is the point.
+            warnings.simplefilter("ignore", UserWarning)
+            state[key] = torch.from_numpy(array)
+    return state
+
+
+class MappedScaler:
+    """Drop-in for StandardScaler.transform backed by mapped mean/scale."""
+
+    def __init__(self, model_dir: str):
+        self.mean_ = load_array(model_dir, "scaler.mean")
+        self.scale_ = load_array(model_dir, "scaler.scale")
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class MappedOneClassSVM:
+    """
+    rbf One-Class SVM evaluated in numpy from mapped support vectors.
+    Matches sklearn's decision_function / predict for the exported model.
+    """
+
+    def __init__(self, model_dir: str):
+        self.support_vectors_ = load_array(model_dir, "ocsvm.support_vectors")
+        self.dual_coef_ = load_array(model_dir, "ocsvm.dual_coef")
+        self.intercept_ = load_array(model_dir, "ocsvm.intercept")
+        with open(os.path.join(model_dir, MMAP_SUBDIR, "ocsvm.json")) as f:
+            self.gamma = json.load(f)["gamma"]
+        self._sv_sq_norms = np.einsum("ij,ij->i", self.support_vectors_, self.support_vectors_)
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        sq_dists = (
+            np.einsum("ij,ij->i", X, X)[:, None]
+            - 2.0 * X @ self.support_vectors_.T
+            + self._sv_sq_norms[None, :]
+        )
+        kernel = np.exp(-self.gamma * np.maximum(sq_dists, 0.0))
+        return (kernel @ self.dual_coef_.T).ravel() + self.intercept_[0]
+
+    def predict(self, X):
+        # libsvm labels a sample as inlier only for a strictly positive value
+        return np.where(self.decision_function(X) > 0, 1, -1)
@@ -0,0 +1,445 @@
+"""
+model_registry.py
+CacheMeOutside
+
+Versioned model registry with background hot reload.
+
+Layout:
+    saved_models/registry/
+        autoencoder/<version>/            best_autoencoder.pt, scaler.pkl, threshold.npy, ...
+        user/user_<id>/<version>/         ocsvm.pkl, scaler.pkl, feature_order.pkl, ...
+
+Each version directory holds a manifest.json, written last, so a version
+without one is still being published and is ignored:
+    {
+      "kind": "autoencoder", "user_id": null, "version": "v20260101T120000Z-ab12",
+      "stage": "production" | "candidate", "created_at": <ms>,
+      "feature_order_hash": "...", "threshold": 0.239,
+      "params": {"latent_dim": 16},
+      "files": {"best_autoencoder.pt": "<sha256>", ...}
+    }
+
+ModelRegistry polls for new production versions. It verifies checksums
+and the feature-order hash, then loads and warms the new model on the
+watcher thread. Only after that does it swap the live reference, so
+requests never wait on a reload and never see a half-loaded model. The
+previous model stays in memory for instant rollback. Rolled-back versions
+are blocked so the watcher doesn't promote them again.
+
+With an empty registry the legacy saved_models/autoencoder and
+saved_models/user/user_<id> directories are served as version "legacy".
+Training never writes there: each run gets a fresh staging_dir() under
+saved_models/staging and publishes from it, so rolling back to "legacy"
+never serves the model that was just rolled back.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.core.config import (
+    AUTOENCODER_DIR,
+    MODEL_REGISTRY_DIR,
+    MODEL_STAGING_DIR,
+    REGISTRY_POLL_S,
+    USERS_MODEL_DIR,
+)
+from app.models.autoencoder import AutoencoderModel
+from app.models.ocsvm import OneClassSVMModel
+from app.services.feature_extractor import FEATURE_DIM, FEATURE_ORDER_HASH, check_feature_order_hash
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+LEGACY_VERSION = "legacy"
+ROLLED_BACK = "rolled_back"     # stage written by rollback(); never served again
+
+# Artifacts copied into a version when present in the training output dir
+AUTOENCODER_FILES = [
+    "best_autoencoder.pt", "scaler.pkl", "threshold.npy",
+    "autoencoder.onnx", "best_autoencoder_int8.pt", "threshold_int8.npy", "mmap",
+    "drift_reference.npz", "quantization_report.json",
+]
+OCSVM_FILES = ["ocsvm.pkl", "scaler.pkl", "feature_order.pkl", "mmap"]
+
+
+# ── Publishing (used by the training scripts) ─────────────────────────────────
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _kind_dir(kind: str, user_id: str | None = None, root: str = MODEL_REGISTRY_DIR) -> str:
+    if kind == "autoencoder":
+        return os.path.join(root, "autoencoder")
+    return os.path.join(root, "user", f"user_{user_id}")
+
+
+def staging_dir(kind: str, user_id: str | None = None, root: str = MODEL_STAGING_DIR) -> str:
+    """Fresh scratch directory for one training run's artifacts."""
+    base = _kind_dir(kind, user_id, root)
+    os.makedirs(base, exist_ok=True)
+    return tempfile.mkdtemp(prefix=time.strftime("%Y%m%dT%H%M%SZ-", time.gmtime()), dir=base)
+
+
+def publish(
+    kind: str,
+    src_dir: str,
+    files: list,
+    user_id: str | None = None,
+    threshold: float | None = None,
+    params: dict | None = None,
+    stage: str = "production",
+    root: str = MODEL_REGISTRY_DIR,
+) -> str:
+    """
+    Copies artifacts from `src_dir` into a new immutable version directory
+    and writes its manifest. `files` may name files or directories (e.g.
+    "mmap"); missing optional entries are skipped. Returns the version dir.
+    """
+    version = time.strftime("v%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:4]
+    version_dir = os.path.join(_kind_dir(kind, user_id, root), version)
+    os.makedirs(version_dir)
+
+    checksums = {}
+    for name in files:
+        src = os.path.join(src_dir, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(version_dir, name))
+        elif os.path.exists(src):
+            shutil.copy2(src, os.path.join(version_dir, name))
+
+    for dirpath, _, file_names in os.walk(version_dir):
+        for file_name in file_names:
+            path = os.path.join(dirpath, file_name)
+            checksums[os.path.relpath(path, version_dir)] = _sha256(path)
+
+    manifest = {
+        "kind": kind,
+        "user_id": user_id,
+        "version": version,
+        "stage": stage,
+        "created_at": int(time.time() * 1000),
+        "feature_order_hash": FEATURE_ORDER_HASH,
+        "threshold": threshold,
+        "params": params or {},
+        "files": checksums,
+    }
+    tmp_path = os.path.join(version_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(version_dir, MANIFEST))
+    return version_dir
+
+
+def set_stage(kind: str, version: str, stage: str, user_id: str | None = None,
+              root: str = MODEL_REGISTRY_DIR) -> dict:
+    """
+    Moves a version between "candidate", "production" and "rolled_back"
+    by rewriting its manifest. Running watchers promote a production version
+    on their next poll if it is newer than the live one, and replace a live
+    version that is no longer production with the newest one that is.
+    """
+    path = os.path.join(_kind_dir(kind, user_id, root), version, MANIFEST)
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown version {kind}/{user_id or '-'}/{version}")
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest["stage"] = stage
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def list_versions(kind: str, user_id: str | None = None, stage: str | None = "production",
+                  root: str = MODEL_REGISTRY_DIR) -> list:
+    """Manifests of complete versions, oldest first."""
+    base = _kind_dir(kind, user_id, root)
+    if not os.path.isdir(base):
+        return []
+
+    manifests = []
+    for version in sorted(os.listdir(base)):
+        path = os.path.join(base, version, MANIFEST)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if stage is None or manifest.get("stage") == stage:
+            manifest["path"] = os.path.dirname(path)
+            manifests.append(manifest)
+    return manifests
+
+
+def verify(manifest: dict):
+    """Raises ValueError on train/serve feature skew or corrupted files."""
+    check_feature_order_hash(manifest.get("feature_order_hash"), manifest["version"])
+    for rel_path, checksum in manifest["files"].items():
+        if _sha256(os.path.join(manifest["path"], rel_path)) != checksum:
+            raise ValueError(f"{manifest['version']}: checksum mismatch for {rel_path}")
+
+
+def load_version(manifest: dict):
+    """Loads (but does not swap in) the model of a registry version."""
+    verify(manifest)
+    if manifest["kind"] == "autoencoder":
+        model = AutoencoderModel(latent_dim=manifest["params"].get("latent_dim", 16), model_path=manifest["path"])
+    else:
+        model = OneClassSVMModel(user_id=manifest["user_id"], model_dir=manifest["path"])
+    model.load()
+    return model
+
+
+def warm_up(model):
+    """Throwaway predictions so first-request allocations happen here."""
+    if hasattr(model, "warm_up"):
+        model.warm_up()
+    else:
+        model.predict(np.zeros(FEATURE_DIM, dtype=np.float32))
+
+
+# ── Live references ───────────────────────────────────────────────────────────
+class _Slot:
+    """Live model + the one it replaced, swapped by plain reference assignment."""
+
+    __slots__ = ("model", "version", "previous", "previous_version", "loaded_at")
+
+    def __init__(self, model, version: str):
+        self.model = model
+        self.version = version
+        self.previous = None
+        self.previous_version = None
+        self.loaded_at = int(time.time() * 1000)
+
+
+class ModelRegistry:
+    def __init__(self, root: str = MODEL_REGISTRY_DIR, poll_s: float = REGISTRY_POLL_S):
+        self.root = root
+        self.poll_s = poll_s
+        self._autoencoder: _Slot | None = None
+        self._users: dict = {}
+        self._blocked: set = set()
+        self._lock = threading.Lock()      # serializes swaps / rollbacks, never held by readers
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ── Readers (hot path: plain attribute reads, no locking) ─────────────
+    @property
+    def autoencoder(self):
+        slot = self._autoencoder
+        return slot.model if slot is not None else None
+
+    def get_ocsvm(self, user_id: str):
+        """Live OCSVM for a user, loaded on first use. None if none is trained."""
+        slot = self._users.get(user_id)
+        if slot is None:
+            slot = self._load_user(user_id)
+        return slot.model if slot is not None else None
+
+    # ── Loading ───────────────────────────────────────────────────────────
+    def _production(self, kind: str, user_id: str | None = None) -> list:
+        return [
+            m for m in list_versions(kind, user_id, root=self.root)
+            if (kind, user_id, m["version"]) not in self._blocked
+        ]
+
+    def _latest(self, kind: str, user_id: str | None = None) -> dict | None:
+        versions = self._production(kind, user_id)
+        return versions[-1] if versions else None
+
+    def _withdrawn(self, kind: str, user_id: str | None, version: str) -> bool:
+        """Live version that has been rolled back (by any worker) or blocked here."""
+        if version == LEGACY_VERSION:
+            return False
+        return version not in {m["version"] for m in self._production(kind, user_id)}
+
+    def _load_legacy_autoencoder(self):
+        model = AutoencoderModel(model_path=AUTOENCODER_DIR)
+        model.load()
+        return model
+
+    def load_autoencoder(self):
+        manifest = self._latest("autoencoder")
+        if manifest is not None:
+            model = load_version(manifest)
+            version = manifest["version"]
+        else:
+            model = self._load_legacy_autoencoder()
+            version = LEGACY_VERSION
+        warm_up(model)
+        self._swap_autoencoder(model, version)
+        return model
+
+    def _load_user(self, user_id: str):
+        with self._lock:
+            slot = self._users.get(user_id)
+            if slot is not None:
+                return slot
+
+            manifest = self._latest("ocsvm", user_id)
+            if manifest is not None:
+                model = load_version(manifest)
+                version = manifest["version"]
+            else:
+                legacy_dir = os.path.join(USERS_MODEL_DIR, f"user_{user_id}")
+                if not os.path.exists(os.path.join(legacy_dir, "ocsvm.pkl")):
+                    return None
+                model = OneClassSVMModel(user_id=user_id)
+                model.load()
+                version = LEGACY_VERSION
+
+            slot = _Slot(model, version)
+            self._users[user_id] = slot
+            return slot
+
+    def _swap_autoencoder(self, model, version: str):
+        with self._lock:
+            new_slot = _Slot(model, version)
+            old_slot = self._autoencoder
+            if old_slot is not None:
+                new_slot.previous = old_slot.model
+                new_slot.previous_version = old_slot.version
+            # Single reference assignment: in-flight requests keep the model
+            # object they already fetched, new requests get the new one.
+            self._autoencoder = new_slot
+
+    def _swap_user(self, user_id: str, model, version: str):
+        with self._lock:
+            new_slot = _Slot(model, version)
+            old_slot = self._users.get(user_id)
+            if old_slot is not None:
+                new_slot.previous = old_slot.model
+                new_slot.previous_version = old_slot.version
+            self._users[user_id] = new_slot
+
+    # ── Watcher ───────────────────────────────────────────────────────────
+    def refresh(self) -> list:
+        """
+        Promote any newer production versions, and replace live versions
+        another worker rolled back. Returns what was swapped.
+        """
+        swapped = []
+
+        manifest = self._latest("autoencoder")
+        slot = self._autoencoder
+        withdrawn = slot is not None and self._withdrawn("autoencoder", None, slot.version)
+        if manifest is not None and (slot is None or manifest["version"] > slot.version
+                                     or slot.version == LEGACY_VERSION or withdrawn):
+            try:
+                model = load_version(manifest)
+                warm_up(model)
+                self._swap_autoencoder(model, manifest["version"])
+                swapped.append(("autoencoder", None, manifest["version"]))
+            except Exception as e:
+                self._blocked.add(("autoencoder", None, manifest["version"]))
+                logger.warning("rejected autoencoder %s: %s", manifest["version"], e)
+        elif manifest is None and withdrawn:
+            # Every registry version rolled back: back to the training output dir
+            try:
+                model = self._load_legacy_autoencoder()
+                warm_up(model)
+                self._swap_autoencoder(model, LEGACY_VERSION)
+                swapped.append(("autoencoder", None, LEGACY_VERSION))
+            except Exception as e:
+                logger.warning("rolled-back autoencoder %s has no replacement: %s", slot.version, e)
+
+        # Only users that have been served are kept hot; others load lazily
+        for user_id, slot in list(self._users.items()):
+            manifest = self._latest("ocsvm", user_id)
+            withdrawn = self._withdrawn("ocsvm", user_id, slot.version)
+            if manifest is None and withdrawn:
+                # Nothing newer left; drop the slot so the next request loads
+                # the legacy model (or none)
+                with self._lock:
+                    if self._users.get(user_id) is slot:
+                        del self._users[user_id]
+                continue
+            if manifest is None or (slot.version != LEGACY_VERSION and manifest["version"] <= slot.version
+                                    and not withdrawn):
+                continue
+            try:
+                model = load_version(manifest)
+                warm_up(model)
+                self._swap_user(user_id, model, manifest["version"])
+                swapped.append(("ocsvm", user_id, manifest["version"]))
+            except Exception as e:
+                self._blocked.add(("ocsvm", user_id, manifest["version"]))
+                logger.warning("rejected ocsvm %s %s: %s", user_id, manifest["version"], e)
+
+        for kind, user_id, version in swapped:
+            logger.info("promoted %s%s -> %s", kind, "/" + user_id if user_id else "", version)
+        return swapped
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.poll_s):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning("refresh failed (%s)", e)
+
+        self._thread = threading.Thread(target=run, name="model-registry-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ── Rollback / status ─────────────────────────────────────────────────
+    def rollback(self, kind: str = "autoencoder", user_id: str | None = None) -> dict:
+        """
+        Swap the previous model back in (no model load) and mark the
+        rolled-back version ROLLED_BACK in its manifest. The stage is on
+        disk, so other workers replace it on their next poll and it is not
+        selected again after a restart.
+        """
+        with self._lock:
+            slot = self._autoencoder if kind == "autoencoder" else self._users.get(user_id)
+            if slot is None or slot.previous is None:
+                raise ValueError("No previous version to roll back to")
+
+            if slot.version != LEGACY_VERSION:
+                set_stage(kind, slot.version, ROLLED_BACK, user_id=user_id if kind != "autoencoder" else None,
+                          root=self.root)
+            self._blocked.add((kind, user_id if kind != "autoencoder" else None, slot.version))
+            restored = _Slot(slot.previous, slot.previous_version)
+            if kind == "autoencoder":
+                self._autoencoder = restored
+            else:
+                self._users[user_id] = restored
+
+        return {"kind": kind, "user_id": user_id, "rolled_back": slot.version, "live": restored.version}
+
+    def status(self) -> dict:
+        def describe(slot):
+            if slot is None:
+                return None
+            return {
+                "version": slot.version,
+                "previous_version": slot.previous_version,
+                "loaded_at": slot.loaded_at,
+            }
+
+        return {
+            "autoencoder": describe(self._autoencoder),
+            "users": {user_id: describe(slot) for user_id, slot in self._users.items()},
+            "blocked": sorted(f"{k}/{u or '-'}/{v}" for k, u, v in self._blocked),
+        }
@@ -0,0 +1,162 @@
+"""
+prefilter.py
+CacheMeOutside
+
+Rule-based prefilter run before model inference.
+
+Some sessions are bots beyond doubt: a form submitted with no input at
+all, a pasted password with no pointer activity in a few seconds, or a
+whole password typed at sub-5 ms intervals. These sessions get a verdict
+from a few comparisons on the flat feature vector, with an explicit reason
+code. Only the remaining, ambiguous traffic reaches the autoencoder or OCSVM.
+
+Single signals are not enough. In training/final_dataset.csv (538 human
+sessions) no mouse movement alone fires on 31 (keyboard-only and touch
+users), paste alone on 10 (password managers), and one sub-millisecond
+interval on 9 (key rollover). Each default rule combines signals and fires
+on none of them. Those single signals are left to the models.
+Check a rule set with training/calibrate_prefilter.py before deploying it.
+
+Rules are compiled into column index / threshold arrays. A whole batch of
+sessions is then checked with one numpy comparison per condition. A rule
+fires when all of its conditions hold, and the first firing rule, in
+declared order, supplies the reason code.
+
+Rules can be replaced with a JSON file (PREFILTER_RULES_PATH) in the same
+shape as DEFAULT_RULES:
+[
+  {"code": "NO_INPUT", "all": [["mouse.total_moves", "==", 0], ...]},
+  ...
+]
+"""
+
+import json
+import operator
+import threading
+
+import numpy as np
+
+from app.core.config import (
+    PREFILTER_ENABLED,
+    PREFILTER_MIN_SESSION_MS,
+    PREFILTER_RULES_PATH,
+    PREFILTER_SCRIPTED_SESSION_MS,
+)
+from app.services.feature_extractor import FEATURE_DIM, FEATURE_ORDER
+
+DEFAULT_RULES = [
+    # Submitted without a single move, key or click
+    {"code": "NO_INPUT", "all": [["mouse.total_moves", "==", 0],
+                                 ["keyboard.total_keystrokes", "==", 0],
+                                 ["interaction.click_count", "==", 0]]},
+    # Pasted credentials, no pointer at all, done within a few seconds
+    {"code": "SCRIPTED_PASTE", "all": [["mouse.total_moves", "==", 0],
+                                       ["keyboard.paste_detected", "==", 1],
+                                       ["timing.session_duration_ms", "<", PREFILTER_SCRIPTED_SESSION_MS]]},
+    # Mean interval, not min: a single rollover pair is human, a whole password is not
+    {"code": "INHUMAN_TYPING", "all": [["keyboard.mean_interval_ms", "<", 5],
+                                       ["keyboard.total_keystrokes", ">=", 6]]},
+    {"code": "SESSION_TOO_SHORT", "all": [["timing.session_duration_ms", "<", PREFILTER_MIN_SESSION_MS],
+                                          ["mouse.total_moves", "==", 0]]},
+]
+
+_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class RulePrefilter:
+    """
+    Thread-safe rule stage. check() handles one session and check_batch()
+    a matrix of flattened sessions. Hit counts are recorded for every rule
+    that fires, not only the one that supplies the reason code.
+    """
+
+    def __init__(self, rules: list | None = None, enabled: bool = PREFILTER_ENABLED):
+        self.enabled = enabled
+        self.rules = rules if rules is not None else load_rules()
+        self.codes = [rule["code"] for rule in self.rules]
+
+        # Flatten every condition into one list; _membership[c, r] marks
+        # condition c as belonging to rule r
+        self._conditions = []
+        cond_rule = []
+        for r, rule in enumerate(self.rules):
+            for feature, op, value in rule["all"]:
+                if feature not in FEATURE_ORDER:
+                    raise ValueError(f"Prefilter rule {rule['code']}: unknown feature '{feature}'")
+                if op not in _OPS:
+                    raise ValueError(f"Prefilter rule {rule['code']}: unknown operator '{op}'")
+                self._conditions.append((FEATURE_ORDER.index(feature), _OPS[op], float(value)))
+                cond_rule.append(r)
+        self._membership = np.zeros((len(cond_rule), len(self.rules)), dtype=np.int32)
+        self._membership[np.arange(len(cond_rule)), cond_rule] = 1
+
+        self.evaluated = 0
+        self.short_circuited = 0
+        self.hits = np.zeros(len(self.rules), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _fired(self, X: np.ndarray) -> np.ndarray:
+        """(n_rows, n_rules) bool matrix: rule fired for row."""
+        cond = np.empty((len(X), len(self._conditions)), dtype=bool)
+        for c, (col, op, value) in enumerate(self._conditions):
+            cond[:, c] = op(X[:, col], value)
+        # A rule fires when none of its conditions failed
+        return ((~cond).astype(np.int32) @ self._membership) == 0
+
+    def check_batch(self, X) -> list:
+        """
+        Returns one reason code (first firing rule) or None per row of
+        the (n, FEATURE_DIM) matrix X.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, FEATURE_DIM)
+        if not self.enabled or not self.rules or len(X) == 0:
+            return [None] * len(X)
+
+        fired = self._fired(X)
+        any_fired = fired.any(axis=1)
+        first = fired.argmax(axis=1)
+
+        with self._lock:
+            self.evaluated += len(X)
+            self.short_circuited += int(any_fired.sum())
+            self.hits += fired.sum(axis=0)
+
+        return [self.codes[i] if hit else None for i, hit in zip(first, any_fired)]
+
+    def check(self, vector) -> str | None:
+        return self.check_batch([vector])[0]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "evaluated": self.evaluated,
+                "short_circuited": self.short_circuited,
+                "hits": dict(zip(self.codes, self.hits.tolist())),
+                "rules": self.rules,
+            }
+
+
+def load_rules(path: str | None = PREFILTER_RULES_PATH) -> list:
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+def prefilter_output(reason_code: str) -> dict:
+    """Model-output shaped verdict for a short-circuited session."""
+    return {
+        "model_name": "prefilter",
+        "score": 1.0,
+        "threshold": None,
+        "is_anomaly": True,
+        "reason_code": reason_code,
+    }
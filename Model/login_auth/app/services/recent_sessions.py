@@ -0,0 +1,254 @@
+"""
+recent_sessions.py
+CacheMeOutside
+
+In-process ring buffer of the most recently scored sessions.
+
+Analyst detail reads (/sessions/{id}) almost always hit the last few
+thousand sessions. Each one used to cost a DynamoDB scan. This store keeps
+those sessions in fixed-size numpy columns, preallocated once, so detail
+reads are answered from memory in microseconds. Anything it does not hold
+falls back to the storage backend.
+
+Columns, per slot:
+  session_id    16 B   uuid bytes (V16)
+  created_at     8 B   int64 ms
+  completed_at   8 B   int64 ms
+  score          4 B   float32
+  threshold      4 B   float32, NaN = none
+  is_bot         1 B   bool
+  is_owner       1 B   int8, -1 = not set
+  model          2 B   uint16 index into the interned model names
+  user           4 B   uint32 index into the interned user ids
+  event_count    1 B   uint8, BehavioralEvents rows written
+  features      96 B   float32[FEATURE_DIM]
+  attribution   34 B   2 models x (uint16 model, ATTRIBUTION_TOP_K=5 x
+                       (uint8 feature index, float16 value))
+                ----
+                179 B
+
+Memory per 100k sessions:
+  columns             ~17.9 MB   (179 B * 100k, allocated up front)
+  sessionId -> slot   ~12.5 MB   (36-char str key ~85 B + dict slot)
+  interned users      ~130 B per distinct user (compacted when it outgrows the ring)
+  total              ~30 MB + users
+Holding the same sessions as DynamoDB-shaped dicts with behaviorPayload
+takes roughly 3 KB each, or about 300 MB. snapshot() reports the live figures.
+
+The detail view rebuilds behaviorPayload from the stored feature vector.
+It has the mouse / keyboard / interaction / timing groups the dashboard
+renders. Environment is not kept. The raw BehavioralEvents rows stay in
+DynamoDB (GET /sessions/{id}/events). The detail response carries
+behaviorEventCount instead.
+
+The buffer is per process and starts empty. With several uvicorn workers,
+each one holds only the sessions it scored, and reads of other sessions fall
+back to the database. For the same reason the /sessions list is not served
+from here: no single buffer provably holds the newest sessions of all
+workers.
+"""
+
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.core.config import ATTRIBUTION_TOP_K, RECENT_SESSIONS_CAPACITY
+from app.services.attribution import METHODS
+from app.services.feature_extractor import FEATURE_DIM, FEATURE_ORDER
+
+_SPLIT_ORDER = [key.split(".", 1) for key in FEATURE_ORDER]
+_FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_ORDER)}
+_NO_MODEL = np.iinfo(np.uint16).max
+_ATTR_MODELS = 2      # ensemble: autoencoder + the user's verifier
+
+
+class RecentSessionStore:
+    def __init__(self, capacity: int = RECENT_SESSIONS_CAPACITY):
+        self.capacity = capacity
+        n = max(capacity, 0)
+        self._session_id = np.zeros(n, dtype="V16")
+        self._created_at = np.zeros(n, dtype=np.int64)
+        self._completed_at = np.zeros(n, dtype=np.int64)
+        self._score = np.zeros(n, dtype=np.float32)
+        self._threshold = np.full(n, np.nan, dtype=np.float32)
+        self._is_bot = np.zeros(n, dtype=bool)
+        self._is_owner = np.full(n, -1, dtype=np.int8)
+        self._model = np.zeros(n, dtype=np.uint16)
+        self._user = np.zeros(n, dtype=np.uint32)
+        self._event_count = np.zeros(n, dtype=np.uint8)
+        self._features = np.zeros((n, FEATURE_DIM), dtype=np.float32)
+        k = max(min(ATTRIBUTION_TOP_K, FEATURE_DIM), 0)
+        self._attr_model = np.full((n, _ATTR_MODELS), _NO_MODEL, dtype=np.uint16)
+        self._attr_feature = np.zeros((n, _ATTR_MODELS, k), dtype=np.uint8)
+        self._attr_value = np.full((n, _ATTR_MODELS, k), np.nan, dtype=np.float16)
+
+        self._index: dict = {}        # sessionId -> slot
+        self._users: list = []        # interned userIds
+        self._user_ids: dict = {}     # userId -> index in _users
+        self._models: list = []
+        self._model_ids: dict = {}
+        self._next = 0                # slot the next session goes to
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    # ── Interning ─────────────────────────────────────────────────────────
+    def _intern_model(self, name: str) -> int:
+        idx = self._model_ids.get(name)
+        if idx is None:
+            idx = self._model_ids[name] = len(self._models)
+            self._models.append(name)
+        return idx
+
+    def _intern_user(self, user_id: str) -> int:
+        idx = self._user_ids.get(user_id)
+        if idx is None:
+            if len(self._users) >= 4 * max(self.capacity, 1024):
+                self._compact_users()
+            idx = self._user_ids[user_id] = len(self._users)
+            self._users.append(user_id)
+        return idx
+
+    def _compact_users(self):
+        """Drop user ids no live slot points at and renumber the rest."""
+        live = np.unique(self._user[:self._size])
+        remap = np.zeros(len(self._users), dtype=np.uint32)
+        remap[live] = np.arange(len(live), dtype=np.uint32)
+        self._user[:self._size] = remap[self._user[:self._size]]
+        self._users = [self._users[i] for i in live]
+        self._user_ids = {user_id: i for i, user_id in enumerate(self._users)}
+
+    # ── Writes ────────────────────────────────────────────────────────────
+    def add(self, session_id: str, user_id: str, created_at: int | None, result: dict, vector,
+            event_count: int = 0, is_owner: bool | None = None) -> bool:
+        """Record a scored session (result is the /analyze response dict)."""
+        if not self.enabled:
+            return False
+        try:
+            raw_id = uuid.UUID(session_id).bytes
+        except (TypeError, ValueError):
+            return False       # only uuid session ids fit the 16-byte column
+
+        now_ms = int(time.time() * 1000)
+        threshold = result.get("threshold")
+        with self._lock:
+            slot = self._index.pop(session_id, None)
+            if slot is None:
+                slot = self._next
+                if self._size == self.capacity:
+                    # Overwrite the oldest session
+                    self._index.pop(str(uuid.UUID(bytes=self._session_id[slot].tobytes())), None)
+                else:
+                    self._size += 1
+                self._next = (slot + 1) % self.capacity
+
+            self._session_id[slot] = np.void(raw_id)
+            self._created_at[slot] = created_at or now_ms
+            self._completed_at[slot] = now_ms
+            self._score[slot] = result["risk_score"]
+            self._threshold[slot] = np.nan if threshold is None else threshold
+            self._is_bot[slot] = bool(result["is_bot"])
+            self._is_owner[slot] = -1 if is_owner is None else int(is_owner)
+            self._model[slot] = self._intern_model(result.get("model") or "mock")
+            self._user[slot] = self._intern_user(user_id)
+            self._event_count[slot] = min(event_count, 255)
+            self._features[slot] = vector
+            self._set_attribution(slot, result.get("attribution"))
+            self._index[session_id] = slot
+        return True
+
+    def _set_attribution(self, slot: int, attribution: dict | None):
+        self._attr_model[slot] = _NO_MODEL
+        self._attr_value[slot] = np.nan
+        k = self._attr_value.shape[2]
+        for j, (model, attr) in enumerate(list((attribution or {}).items())[:_ATTR_MODELS]):
+            self._attr_model[slot, j] = self._intern_model(model)
+            for i, (feature, value) in enumerate(list(attr["features"].items())[:k]):
+                self._attr_feature[slot, j, i] = _FEATURE_INDEX[feature]
+                self._attr_value[slot, j, i] = value
+
+    def _attribution(self, slot: int) -> dict | None:
+        attribution = {}
+        for j in range(_ATTR_MODELS):
+            if self._attr_model[slot, j] == _NO_MODEL:
+                continue
+            model = self._models[self._attr_model[slot, j]]
+            attribution[model] = {
+                "method": METHODS.get(model, "scaled_deviation"),
+                "features": {
+                    FEATURE_ORDER[f]: round(float(v), 4)
+                    for f, v in zip(self._attr_feature[slot, j], self._attr_value[slot, j])
+                    if not np.isnan(v)
+                },
+            }
+        return attribution or None
+
+    # ── Reads ─────────────────────────────────────────────────────────────
+    def _row(self, slot: int, session_id: str | None = None) -> dict:
+        threshold = self._threshold[slot]
+        row = {
+            "sessionId": session_id or str(uuid.UUID(bytes=self._session_id[slot].tobytes())),
+            "userId": self._users[self._user[slot]],
+            "createdAt": int(self._created_at[slot]),
+            "completedAt": int(self._completed_at[slot]),
+            "status": "completed",
+            "mlScore": float(self._score[slot]),
+            "isBot": bool(self._is_bot[slot]),
+            "model": self._models[self._model[slot]],
+        }
+        if not np.isnan(threshold):
+            row["threshold"] = float(threshold)
+        if self._is_owner[slot] >= 0:
+            row["isOwner"] = bool(self._is_owner[slot])
+        return row
+
+    def get(self, session_id: str) -> dict | None:
+        """Session detail with behaviorPayload rebuilt from the feature vector."""
+        with self._lock:
+            slot = self._index.get(session_id)
+            if slot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            session = self._row(slot, session_id)
+            features = self._features[slot].tolist()
+            session["behaviorEventCount"] = int(self._event_count[slot])
+            attribution = self._attribution(slot)
+        if attribution:
+            session["attribution"] = attribution
+
+        behavior = {"mouse": {}, "keyboard": {}, "interaction": {}, "timing": {}}
+        for (group, field), value in zip(_SPLIT_ORDER, features):
+            behavior[group][field] = bool(value) if field == "paste_detected" else value
+        session["behaviorPayload"] = behavior
+        return session
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            columns = sum(a.nbytes for a in (
+                self._session_id, self._created_at, self._completed_at, self._score, self._threshold,
+                self._is_bot, self._is_owner, self._model, self._user, self._event_count, self._features,
+                self._attr_model, self._attr_feature, self._attr_value,
+            ))
+            # Keys are shared with _users / _index, so count them once
+            index = sys.getsizeof(self._index) + sum(sys.getsizeof(k) for k in self._index)
+            users = sys.getsizeof(self._user_ids) + sys.getsizeof(self._users) + \
+                sum(sys.getsizeof(u) for u in self._users)
+            return {
+                "capacity": self.capacity,
+                "size": self._size,
+                "users": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_bytes": {"columns": columns, "index": index, "users": users,
+                                 "total": columns + index + users},
+            }
@@ -7,4 +7,7 @@ class ScoreService:
             "risk_score":  model_output["score"],
             "threshold":   model_output.get("threshold"),   # None for OCSVM
             "is_bot":      model_output["is_anomaly"],
+            "reason_code": model_output.get("reason_code"),
+            "model_scores": model_output.get("model_scores"),
+            "attribution": model_output.get("attribution"),
         }
\ No newline at end of file
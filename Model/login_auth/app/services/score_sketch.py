@@ -0,0 +1,414 @@
+"""
+score_sketch.py
+CacheMeOutside
+
+Live score monitoring with mergeable streaming quantile sketches.
+
+The autoencoder threshold is a fixed 97th percentile picked at training time.
+ScoreMonitor keeps a constant-size quantile sketch of the risk scores the
+service actually produces (per model, and per user for OCSVM) so operators
+can compare live percentiles and flag rates against the training threshold.
+
+QuantileSketch is a DDSketch: values are counted in logarithmic buckets, so
+every quantile estimate is within `relative_accuracy` of the true value,
+memory is capped at `max_bins` buckets, and two sketches with the same
+accuracy merge by adding bucket counts. That last property lets each uvicorn
+worker persist its own sketch and have them combined later. Files not
+rewritten for STALE_PERSISTS persist intervals belong to workers that are
+gone; they are dropped from the merged view and deleted.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import (
+    SCORE_SKETCH_DIR,
+    SCORE_SKETCH_MAX_USERS,
+    SCORE_SKETCH_PERSIST_S,
+)
+
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 97, 99)
+# Models whose anomalies score below the threshold (OCSVM decision_function)
+LOWER_IS_ANOMALOUS = {"ocsvm", "one_class_svm"}
+STALE_PERSISTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class QuantileSketch:
+    """
+    DDSketch-style quantile sketch handling positive, negative and zero
+    values (OCSVM decision scores are signed).
+    """
+
+    MIN_INDEXABLE = 1e-12
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.positive: dict = {}   # bucket index -> count, values > 0
+        self.negative: dict = {}   # bucket index of |v| -> count, values < 0
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # ── Updates ───────────────────────────────────────────────────────────
+    def _index(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint of bucket (gamma^(i-1), gamma^i] with relative error <= alpha
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1):
+        if value > self.MIN_INDEXABLE:
+            store = self.positive
+            key = self._index(value)
+        elif value < -self.MIN_INDEXABLE:
+            store = self.negative
+            key = self._index(-value)
+        else:
+            self.zero_count += weight
+            store = None
+
+        if store is not None:
+            store[key] = store.get(key, 0) + weight
+            if len(store) > self.max_bins:
+                self._collapse(store)
+
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values):
+        """Vectorized add for a batch of values (e.g. one validation chunk)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+
+        positive = values[values > self.MIN_INDEXABLE]
+        negative = -values[values < -self.MIN_INDEXABLE]
+        for store, magnitudes in ((self.positive, positive), (self.negative, negative)):
+            if not len(magnitudes):
+                continue
+            keys, counts = np.unique(
+                np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64),
+                return_counts=True,
+            )
+            for key, n in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + n
+            if len(store) > self.max_bins:
+                self._collapse(store)
+
+        self.zero_count += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _collapse(self, store: dict):
+        # Fold the buckets closest to zero together. Accuracy is only lost
+        # for the smallest magnitudes, which are irrelevant to thresholds.
+        keys = sorted(store)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        store[target] += sum(store.pop(k) for k in keys[:excess])
+
+    def merge(self, other: "QuantileSketch"):
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("Can only merge sketches with the same relative accuracy")
+        for own, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, value in theirs.items():
+                own[key] = own.get(key, 0) + value
+            if len(own) > self.max_bins:
+                self._collapse(own)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # ── Queries ───────────────────────────────────────────────────────────
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = 0
+
+        # Most negative first: largest |v| bucket of the negative store
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return max(-self._value(key), self.min)
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self._value(key), self.max)
+
+        return self.max
+
+    def fraction_above(self, value: float) -> float:
+        """Approximate share of recorded values strictly above `value`."""
+        if self.count == 0:
+            return 0.0
+        below = self.zero_count if value >= 0 else 0
+        for key, n in self.negative.items():
+            if -self._value(key) <= value:
+                below += n
+        for key, n in self.positive.items():
+            if self._value(key) <= value:
+                below += n
+        return 1.0 - below / self.count
+
+    def fraction_below(self, value: float) -> float:
+        """Approximate share of recorded values strictly below `value`."""
+        if self.count == 0:
+            return 0.0
+        below = self.zero_count if value > 0 else 0
+        for key, n in self.negative.items():
+            if -self._value(key) < value:
+                below += n
+        for key, n in self.positive.items():
+            if self._value(key) < value:
+                below += n
+        return below / self.count
+
+    # ── Serialization ─────────────────────────────────────────────────────
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "positive": {str(k): v for k, v in self.positive.items()},
+            "negative": {str(k): v for k, v in self.negative.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.positive = {int(k): v for k, v in data["positive"].items()}
+        sketch.negative = {int(k): v for k, v in data["negative"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+class _ScoreStats:
+    """Sketch plus the flag counter and training threshold for one key."""
+
+    __slots__ = ("sketch", "flagged", "threshold")
+
+    def __init__(self, sketch: QuantileSketch | None = None, flagged: int = 0, threshold: float | None = None):
+        self.sketch = sketch or QuantileSketch()
+        self.flagged = flagged
+        self.threshold = threshold
+
+    def record(self, score: float, is_anomaly: bool, threshold: float | None):
+        self.sketch.add(score)
+        self.flagged += int(bool(is_anomaly))
+        if threshold is not None:
+            self.threshold = float(threshold)
+
+    def merge(self, other: "_ScoreStats"):
+        self.sketch.merge(other.sketch)
+        self.flagged += other.flagged
+        if self.threshold is None:
+            self.threshold = other.threshold
+
+    def summary(self, model_name: str, percentiles=DEFAULT_PERCENTILES) -> dict:
+        sketch = self.sketch
+        summary = {
+            "count": sketch.count,
+            "flag_rate": self.flagged / sketch.count if sketch.count else 0.0,
+            "training_threshold": self.threshold,
+            "percentiles": {str(p): sketch.quantile(p / 100) for p in percentiles},
+            "mean": sketch.sum / sketch.count if sketch.count else None,
+            "min": sketch.min if sketch.count else None,
+            "max": sketch.max if sketch.count else None,
+        }
+        if self.threshold is not None:
+            # Share of scores on the anomalous side of the training threshold
+            lower = model_name in LOWER_IS_ANOMALOUS
+            summary["anomalous_side"] = "below" if lower else "above"
+            summary["share_past_threshold"] = (
+                sketch.fraction_below(self.threshold) if lower else sketch.fraction_above(self.threshold)
+            )
+        return summary
+
+    def to_dict(self) -> dict:
+        return {"sketch": self.sketch.to_dict(), "flagged": self.flagged, "threshold": self.threshold}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_ScoreStats":
+        return cls(QuantileSketch.from_dict(data["sketch"]), data["flagged"], data["threshold"])
+
+
+class ScoreMonitor:
+    """
+    Thread-safe live score monitor: one sketch per model plus one per user
+    for per-user models (OCSVM). Per-user sketches are kept for the most
+    recently active `max_users` users.
+    """
+
+    def __init__(self, persist_dir: str = SCORE_SKETCH_DIR, max_users: int = SCORE_SKETCH_MAX_USERS,
+                 interval_s: float = SCORE_SKETCH_PERSIST_S):
+        self.persist_dir = persist_dir
+        self.max_users = max_users
+        self.interval_s = interval_s
+        self.started_at = int(time.time() * 1000)
+        self._models: dict = {}
+        self._users: "OrderedDict[tuple, _ScoreStats]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, model_name: str, score: float, threshold: float | None,
+               is_anomaly: bool, user_id: str | None = None):
+        with self._lock:
+            stats = self._models.get(model_name)
+            if stats is None:
+                stats = self._models[model_name] = _ScoreStats()
+            stats.record(score, is_anomaly, threshold)
+
+            if user_id is not None:
+                key = (model_name, user_id)
+                user_stats = self._users.get(key)
+                if user_stats is None:
+                    user_stats = self._users[key] = _ScoreStats()
+                    if len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+                else:
+                    self._users.move_to_end(key)
+                user_stats.record(score, is_anomaly, threshold)
+
+    def snapshot(self, user_id: str | None = None, percentiles=DEFAULT_PERCENTILES) -> dict:
+        with self._lock:
+            return self._snapshot(self._models, self._users, user_id, percentiles)
+
+    def _snapshot(self, models: dict, users, user_id, percentiles) -> dict:
+        result = {
+            "since": self.started_at,
+            "models": {name: stats.summary(name, percentiles) for name, stats in models.items()},
+        }
+        if user_id is not None:
+            result["users"] = {
+                model_name: stats.summary(model_name, percentiles)
+                for (model_name, uid), stats in users.items()
+                if uid == user_id
+            }
+        return result
+
+    # ── Persistence ───────────────────────────────────────────────────────
+    def _path(self) -> str:
+        # One file per worker process; sketches from all workers are merged on read
+        return os.path.join(self.persist_dir, f"score_sketches_{os.getpid()}.json")
+
+    def persist(self):
+        with self._lock:
+            payload = {
+                "since": self.started_at,
+                "saved_at": int(time.time() * 1000),
+                "models": {name: stats.to_dict() for name, stats in self._models.items()},
+                "users": [
+                    {"model": model_name, "user_id": uid, **stats.to_dict()}
+                    for (model_name, uid), stats in self._users.items()
+                ],
+            }
+        os.makedirs(self.persist_dir, exist_ok=True)
+        tmp_path = self._path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self._path())
+
+    def merged_snapshot(self, user_id: str | None = None, percentiles=DEFAULT_PERCENTILES) -> dict:
+        """
+        Merge the persisted files of the live workers into one view. Reflects
+        state as of each worker's last persist. Files older than
+        STALE_PERSISTS intervals (dead workers, earlier deploys) are deleted.
+        """
+        models: dict = {}
+        users: dict = {}
+        since = self.started_at
+        stale_before = int((time.time() - STALE_PERSISTS * self.interval_s) * 1000)
+        if os.path.isdir(self.persist_dir):
+            for file_name in os.listdir(self.persist_dir):
+                if not (file_name.startswith("score_sketches_") and file_name.endswith(".json")):
+                    continue
+                path = os.path.join(self.persist_dir, file_name)
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if data.get("saved_at", 0) < stale_before and path != self._path():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                since = min(since, data.get("since", since))
+                for name, raw in data["models"].items():
+                    _merge_into(models, name, _ScoreStats.from_dict(raw))
+                for raw in data["users"]:
+                    _merge_into(users, (raw["model"], raw["user_id"]), _ScoreStats.from_dict(raw))
+
+        result = self._snapshot(models, users, user_id, percentiles)
+        result["since"] = since
+        return result
+
+    def start(self):
+        """Persist in a daemon thread every `interval_s` seconds."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.interval_s):
+                try:
+                    self.persist()
+                except OSError as e:
+                    logger.warning("persist failed (%s)", e)
+
+        self._thread = threading.Thread(target=run, name="score-sketch-persist", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.persist()
+
+
+def _merge_into(target: dict, key, stats: _ScoreStats):
+    if key in target:
+        target[key].merge(stats)
+    else:
+        target[key] = stats
@@ -0,0 +1,340 @@
+"""
+session_accumulator.py
+CacheMeOutside
+
+Server-side equivalent of behaviorTracker.js for sessions whose raw events
+are streamed to the backend in chunks instead of being summarized in the
+browser.
+
+Nothing is buffered per event: every chunk is folded into a fixed set of
+running statistics (Welford mean/variance, min/max, counters and the sums
+needed for movement entropy), so memory per session is constant no matter
+how long the session runs. The BehaviorPayload feature set can be produced
+at any point, and it matches what getBehaviorData() would report for the
+same events.
+"""
+
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from app.core.config import STREAM_MAX_SESSIONS, STREAM_SESSION_TTL_S
+
+# Same constants as behaviorTracker.js
+PAUSE_THRESHOLD_MS = 250
+IDLE_GAP_MS = 300
+
+# Slot layout of the per-session state array. Everything is a double so the
+# whole session fits in one contiguous array('d') buffer.
+(
+    START, FIRST_ACTION, LAST_ACTION, LAST_EVENT, IDLE_MS,
+    # Mouse
+    MOVES, LAST_X, LAST_Y, LAST_MOVE_T, HAS_PREV_D, PREV_DX, PREV_DY,
+    TOTAL_DISTANCE, DIRECTION_CHANGES, PAUSES,
+    SPEED_N, SPEED_MEAN, SPEED_M2, SPEED_MAX, SPEED_SUM, SPEED_XLOGX,
+    # Keyboard
+    KEYS, LAST_KEY_T, BACKSPACES,
+    IV_N, IV_MEAN, IV_M2, IV_MIN, IV_MAX,
+    # Interaction
+    CLICKS, SCROLLS, FOCUS, PASTE,
+    # Environment
+    VIEWPORT_W, VIEWPORT_H, TZ_OFFSET, DPR,
+    N_SLOTS,
+) = range(38)
+
+_UNSET = float("nan")
+
+
+def _isset(value: float) -> bool:
+    return value == value  # NaN marks "not seen yet"
+
+
+class SessionAccumulator:
+    """
+    Running feature state for one streamed session.
+
+    Uses __slots__ and a single array('d') so an accumulator costs a few
+    hundred bytes regardless of how many events it has absorbed.
+    """
+
+    __slots__ = ("_s", "touched")
+
+    def __init__(self, start_time: float | None = None):
+        s = array("d", [0.0]) * N_SLOTS
+        for slot in (START, FIRST_ACTION, LAST_ACTION, LAST_EVENT, LAST_MOVE_T,
+                     LAST_KEY_T, IV_MIN, IV_MAX, SPEED_MAX):
+            s[slot] = _UNSET
+        s[DPR] = 1.0
+        self._s = s
+        self.touched = time.monotonic()
+        if start_time is not None:
+            self._set_start(start_time)
+
+    def _set_start(self, start_time: float):
+        s = self._s
+        s[START] = start_time
+        if not _isset(s[LAST_ACTION]):
+            s[LAST_ACTION] = start_time
+
+    def set_environment(self, environment: dict):
+        s = self._s
+        s[VIEWPORT_W] = float(environment.get("viewport_width", 0) or 0)
+        s[VIEWPORT_H] = float(environment.get("viewport_height", 0) or 0)
+        s[TZ_OFFSET] = float(environment.get("timezone_offset", 0) or 0)
+        s[DPR] = float(environment.get("device_pixel_ratio", 1) or 1)
+
+    # ── Event handling ────────────────────────────────────────────────────
+    def update(self, events):
+        """
+        Fold a chunk of raw events into the running statistics.
+
+        events: iterable of objects or dicts with `type`, `t` and, depending
+                on the type, `x`/`y` or `key`. Events inside a chunk are
+                applied in timestamp order.
+        """
+        s = self._s
+        for event in sorted(events, key=_event_time):
+            get = event.get if isinstance(event, dict) else event.__getattribute__
+            kind = get("type")
+            now = float(get("t"))
+
+            if not _isset(s[START]):
+                self._set_start(now)
+            self._record_action(now)
+
+            if kind == "mousemove":
+                self._mouse_move(now, float(get("x") or 0), float(get("y") or 0))
+            elif kind == "keydown":
+                self._key_down(now, get("key"))
+            elif kind == "click":
+                s[CLICKS] += 1
+            elif kind == "scroll":
+                s[SCROLLS] += 1
+            elif kind == "focus":
+                s[FOCUS] += 1
+            elif kind == "paste":
+                s[PASTE] = 1.0
+
+        self.touched = time.monotonic()
+
+    def _record_action(self, now: float):
+        s = self._s
+        if not _isset(s[FIRST_ACTION]):
+            s[FIRST_ACTION] = now
+        if _isset(s[LAST_ACTION]):
+            gap = now - s[LAST_ACTION]
+            if gap > IDLE_GAP_MS:
+                s[IDLE_MS] += gap
+        s[LAST_ACTION] = now
+        if not _isset(s[LAST_EVENT]) or now > s[LAST_EVENT]:
+            s[LAST_EVENT] = now
+
+    def _mouse_move(self, now: float, x: float, y: float):
+        s = self._s
+
+        last_t = s[LAST_MOVE_T]
+        if _isset(last_t) and last_t and now - last_t > PAUSE_THRESHOLD_MS:
+            s[PAUSES] += 1
+
+        if s[MOVES] > 0:
+            dx = x - s[LAST_X]
+            dy = y - s[LAST_Y]
+            dt = now - last_t
+            dist = math.sqrt(dx * dx + dy * dy)
+            s[TOTAL_DISTANCE] += dist
+
+            if dt > 0:
+                self._add_speed(dist / dt)
+
+            if s[HAS_PREV_D] and (dx * s[PREV_DX] < 0 or dy * s[PREV_DY] < 0):
+                s[DIRECTION_CHANGES] += 1
+
+            s[PREV_DX] = dx
+            s[PREV_DY] = dy
+            s[HAS_PREV_D] = 1.0
+
+        s[MOVES] += 1
+        s[LAST_X] = x
+        s[LAST_Y] = y
+        s[LAST_MOVE_T] = now
+
+    def _add_speed(self, speed: float):
+        s = self._s
+        # Welford update
+        s[SPEED_N] += 1
+        delta = speed - s[SPEED_MEAN]
+        s[SPEED_MEAN] += delta / s[SPEED_N]
+        s[SPEED_M2] += delta * (speed - s[SPEED_MEAN])
+        if not _isset(s[SPEED_MAX]) or speed > s[SPEED_MAX]:
+            s[SPEED_MAX] = speed
+        # Entropy of the speed distribution can be rebuilt from the running
+        # sums: H = log2(S) - sum(v * log2 v) / S
+        s[SPEED_SUM] += speed
+        if speed > 0:
+            s[SPEED_XLOGX] += speed * math.log2(speed)
+
+    def _key_down(self, now: float, key: str | None):
+        s = self._s
+        if s[KEYS] > 0:
+            interval = now - s[LAST_KEY_T]
+            s[IV_N] += 1
+            delta = interval - s[IV_MEAN]
+            s[IV_MEAN] += delta / s[IV_N]
+            s[IV_M2] += delta * (interval - s[IV_MEAN])
+            if not _isset(s[IV_MIN]) or interval < s[IV_MIN]:
+                s[IV_MIN] = interval
+            if not _isset(s[IV_MAX]) or interval > s[IV_MAX]:
+                s[IV_MAX] = interval
+        s[KEYS] += 1
+        s[LAST_KEY_T] = now
+        if key == "Backspace":
+            s[BACKSPACES] += 1
+
+    # ── Feature output ────────────────────────────────────────────────────
+    def features(self, end_time: float | None = None) -> dict:
+        """
+        Build the nested BehaviorPayload dict from the current state.
+
+        end_time: session end in the same clock as the events. Defaults to
+                  the latest event seen, since the submit time is unknown
+                  until the session is finalized.
+        """
+        s = self._s
+        start = s[START] if _isset(s[START]) else 0.0
+        if end_time is None:
+            end_time = s[LAST_EVENT] if _isset(s[LAST_EVENT]) else start
+        duration = end_time - start if _isset(s[START]) else 0.0
+
+        speed_n = s[SPEED_N]
+        speed_std = math.sqrt(s[SPEED_M2] / speed_n) if speed_n >= 2 else 0.0
+        entropy = 0.0
+        if s[SPEED_SUM] > 0:
+            entropy = math.log2(s[SPEED_SUM]) - s[SPEED_XLOGX] / s[SPEED_SUM]
+
+        iv_n = s[IV_N]
+        interval_std = math.sqrt(s[IV_M2] / iv_n) if iv_n >= 2 else 0.0
+
+        moves = s[MOVES]
+        keys = s[KEYS]
+        viewport_w = s[VIEWPORT_W]
+        first_action = s[FIRST_ACTION]
+
+        return {
+            "mouse": {
+                "total_moves": moves,
+                "total_distance": s[TOTAL_DISTANCE],
+                "normalized_distance": (
+                    s[TOTAL_DISTANCE] / viewport_w if viewport_w > 0 else s[TOTAL_DISTANCE]
+                ),
+                "mean_speed": s[SPEED_MEAN] if speed_n else 0.0,
+                "speed_std": speed_std,
+                "max_speed": s[SPEED_MAX] if speed_n else 0.0,
+                "direction_changes": s[DIRECTION_CHANGES],
+                "pause_count": s[PAUSES],
+                "movement_entropy": entropy,
+            },
+            "keyboard": {
+                "total_keystrokes": keys,
+                "mean_interval_ms": s[IV_MEAN] if iv_n else 0.0,
+                "interval_std_ms": interval_std,
+                "min_interval_ms": s[IV_MIN] if iv_n else 0.0,
+                "max_interval_ms": s[IV_MAX] if iv_n else 0.0,
+                "backspace_ratio": s[BACKSPACES] / keys if keys > 0 else 0.0,
+                "paste_detected": bool(s[PASTE]),
+            },
+            "interaction": {
+                "click_count": s[CLICKS],
+                "scroll_count": s[SCROLLS],
+                "focus_changes": s[FOCUS],
+                "mouse_keyboard_ratio": moves / keys if keys > 0 else moves,
+                "interaction_rate": (
+                    (s[CLICKS] + s[SCROLLS] + s[FOCUS]) / duration if duration > 0 else 0.0
+                ),
+            },
+            "timing": {
+                "session_duration_ms": duration,
+                "time_to_first_action_ms": (
+                    first_action - start if _isset(first_action) and start else 0.0
+                ),
+                "idle_time_ratio": s[IDLE_MS] / duration if duration > 0 else 0.0,
+            },
+            "environment": {
+                "viewport_width": viewport_w,
+                "viewport_height": s[VIEWPORT_H],
+                "timezone_offset": s[TZ_OFFSET],
+                "device_pixel_ratio": s[DPR],
+            },
+        }
+
+
+def _event_time(event) -> float:
+    return float(event["t"] if isinstance(event, dict) else event.t)
+
+
+class SessionAccumulatorStore:
+    """
+    Thread-safe map of stream id -> SessionAccumulator with TTL eviction.
+
+    Sessions that stop sending events (closed tab, abandoned login) are
+    dropped once they have been idle for `ttl_s`, and the store never holds
+    more than `max_sessions` accumulators (oldest idle first).
+    """
+
+    def __init__(self, ttl_s: float = STREAM_SESSION_TTL_S, max_sessions: int = STREAM_MAX_SESSIONS):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionAccumulator]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def update(self, stream_id: str, events, start_time: float | None = None,
+               environment: dict | None = None) -> SessionAccumulator:
+        with self._lock:
+            self._evict_expired()
+
+            acc = self._sessions.get(stream_id)
+            if acc is None:
+                acc = SessionAccumulator(start_time)
+                self._sessions[stream_id] = acc
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(stream_id)
+
+            if environment:
+                acc.set_environment(environment)
+            acc.update(events)
+            return acc
+
+    def features(self, stream_id: str, end_time: float | None = None) -> dict | None:
+        """None for unknown streams and for ones idle longer than ttl_s."""
+        with self._lock:
+            self._evict_expired()
+            acc = self._sessions.get(stream_id)
+            return acc.features(end_time) if acc is not None else None
+
+    def pop(self, stream_id: str) -> SessionAccumulator | None:
+        with self._lock:
+            self._evict_expired()
+            return self._sessions.pop(stream_id, None)
+
+    def evict_expired(self) -> int:
+        with self._lock:
+            return self._evict_expired()
+
+    def _evict_expired(self) -> int:
+        # Entries are kept in least-recently-updated order, so expired ones
+        # are always at the front.
+        cutoff = time.monotonic() - self.ttl_s
+        evicted = 0
+        while self._sessions:
+            stream_id, acc = next(iter(self._sessions.items()))
+            if acc.touched >= cutoff:
+                break
+            del self._sessions[stream_id]
+            evicted += 1
+        return evicted
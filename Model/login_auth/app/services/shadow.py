@@ -0,0 +1,237 @@
+"""
+shadow.py
+CacheMeOutside
+
+Shadow scoring of candidate models on live traffic.
+
+Training scripts can publish a version with stage "candidate". It is never
+served. ShadowScorer loads the newest candidate per model, the autoencoder
+and each user's OCSVM, and sends it a sample of the feature vectors that
+production scored.
+
+The request thread only does a put_nowait onto a bounded queue; a small
+pool of daemon workers runs the candidate models. The /analyze response
+and its latency are unaffected, and when the workers fall behind, samples
+are dropped and counted.
+
+For each candidate version the workers keep:
+  - decision agreement with production, split into flips to anomaly and
+    flips to normal,
+  - mean absolute score difference (only when both are the same model kind),
+  - a quantile sketch of candidate scores and the candidate flag rate,
+  - a bounded log of the most recent disagreements.
+
+GET /monitoring/shadow reports all of it. POST /models/promote moves a
+candidate to production, where the registry picks it up.
+"""
+
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from app.core.config import (
+    REGISTRY_POLL_S,
+    SHADOW_LOG_SIZE,
+    SHADOW_QUEUE_SIZE,
+    SHADOW_SAMPLE_RATE,
+    SHADOW_WORKERS,
+)
+from app.services.model_registry import list_versions, load_version, warm_up
+from app.services.score_sketch import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+
+class _CandidateStats:
+    __slots__ = ("scored", "agree", "to_anomaly", "to_normal", "abs_delta_sum", "delta_n", "flagged", "sketch")
+
+    def __init__(self):
+        self.scored = 0
+        self.agree = 0
+        self.to_anomaly = 0     # production normal, candidate anomaly
+        self.to_normal = 0      # production anomaly, candidate normal
+        self.abs_delta_sum = 0.0
+        self.delta_n = 0
+        self.flagged = 0
+        self.sketch = QuantileSketch()
+
+    def summary(self) -> dict:
+        n = self.scored
+        return {
+            "scored": n,
+            "agreement": self.agree / n if n else None,
+            "flips_to_anomaly": self.to_anomaly,
+            "flips_to_normal": self.to_normal,
+            "mean_abs_score_delta": self.abs_delta_sum / self.delta_n if self.delta_n else None,
+            "candidate_flag_rate": self.flagged / n if n else None,
+            "score_p50": self.sketch.quantile(0.50),
+            "score_p97": self.sketch.quantile(0.97),
+            "score_p99": self.sketch.quantile(0.99),
+        }
+
+
+class ShadowScorer:
+    def __init__(self, sample_rate: float = SHADOW_SAMPLE_RATE, workers: int = SHADOW_WORKERS,
+                 queue_size: int = SHADOW_QUEUE_SIZE, log_size: int = SHADOW_LOG_SIZE,
+                 poll_s: float = REGISTRY_POLL_S):
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.poll_s = poll_s
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # (kind, user_id) -> (version, model) or None when there is no candidate
+        self._candidates: dict = {}
+        self._stats: dict = {}                 # (kind, user_id, version) -> _CandidateStats
+        self._disagreements = deque(maxlen=log_size)
+        self._blocked: set = set()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()    # one candidate load at a time
+        self._stop = threading.Event()
+        self._threads: list = []
+
+        self.submitted = 0
+        self.dropped = 0
+
+    # ── Request side ──────────────────────────────────────────────────────
+    def submit(self, kind: str, user_id: str | None, vector, live_output: dict):
+        """Called after production scoring. Never blocks."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((kind, user_id, vector, live_output, time.time()))
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    # ── Candidates ────────────────────────────────────────────────────────
+    def _versions(self, kind: str, user_id: str | None) -> list:
+        """Candidate manifests, oldest first, without the ones that failed to load."""
+        return [
+            m for m in list_versions(kind, user_id if kind != "autoencoder" else None, stage="candidate")
+            if (kind, user_id, m["version"]) not in self._blocked
+        ]
+
+    def _load_candidate(self, kind: str, user_id: str | None):
+        versions = self._versions(kind, user_id)
+        if not versions:
+            return None
+        manifest = versions[-1]
+        try:
+            model = load_version(manifest)
+            warm_up(model)
+        except Exception as e:
+            self._blocked.add((kind, user_id, manifest["version"]))
+            logger.warning("rejected shadow candidate %s/%s %s: %s", kind, user_id or "-", manifest["version"], e)
+            return None
+        logger.info("shadowing %s%s candidate %s", kind, "/" + user_id if user_id else "", manifest["version"])
+        return manifest["version"], model
+
+    def _candidate(self, kind: str, user_id: str | None):
+        key = (kind, user_id if kind != "autoencoder" else None)
+        if key not in self._candidates:
+            with self._load_lock:
+                if key not in self._candidates:
+                    self._candidates[key] = self._load_candidate(*key)
+        return self._candidates[key]
+
+    def refresh(self):
+        """Reload candidates whose newest version changed (watcher thread)."""
+        for key, current in list(self._candidates.items()):
+            # Same blocked filter as _load_candidate, or a rejected newest
+            # candidate would trigger a reload on every poll
+            versions = self._versions(*key)
+            newest = versions[-1]["version"] if versions else None
+            if newest != (current[0] if current else None):
+                with self._load_lock:
+                    self._candidates[key] = self._load_candidate(*key)
+
+    # ── Workers ───────────────────────────────────────────────────────────
+    def _score(self, kind, user_id, vector, live_output, submitted_at):
+        candidate = self._candidate(kind, user_id)
+        if candidate is None:
+            return
+        version, model = candidate
+        output = model.predict(vector)
+
+        live_anomaly = bool(live_output["is_anomaly"])
+        cand_anomaly = bool(output["is_anomaly"])
+        key = (kind, user_id if kind != "autoencoder" else None, version)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _CandidateStats()
+            stats.scored += 1
+            stats.flagged += cand_anomaly
+            stats.sketch.add(output["score"])
+            if live_output.get("model_name") == kind:
+                stats.abs_delta_sum += abs(output["score"] - live_output["score"])
+                stats.delta_n += 1
+            if live_anomaly == cand_anomaly:
+                stats.agree += 1
+                return
+            if cand_anomaly:
+                stats.to_anomaly += 1
+            else:
+                stats.to_normal += 1
+            self._disagreements.append({
+                "ts": int(submitted_at * 1000),
+                "kind": kind,
+                "user_id": user_id,
+                "candidate_version": version,
+                "live_model": live_output.get("model_name"),
+                "live_score": live_output["score"],
+                "live_is_anomaly": live_anomaly,
+                "candidate_score": output["score"],
+                "candidate_is_anomaly": cand_anomaly,
+                "candidate_threshold": output.get("threshold"),
+            })
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self._score(*item)
+            except Exception as e:
+                logger.warning("shadow scoring failed: %s", e)
+
+    def start(self):
+        if self._threads or self.sample_rate <= 0:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"shadow-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        def poll():
+            while not self._stop.wait(self.poll_s):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning("shadow refresh failed (%s)", e)
+
+        thread = threading.Thread(target=poll, name="shadow-watcher", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self, limit: int = 50) -> dict:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "queued": self._queue.qsize(),
+                "candidates": [
+                    {"kind": kind, "user_id": user_id, "version": version, **stats.summary()}
+                    for (kind, user_id, version), stats in self._stats.items()
+                ],
+                "recent_disagreements": list(self._disagreements)[-limit:],
+            }
@@ -0,0 +1,108 @@
+"""
+bench_autoencoder_backends.py
+CacheMeOutside
+
+Torch (eager) vs onnxruntime CPU backends of AutoencoderModel:
+  1. parity   - max abs / relative score difference on final_dataset.csv
+  2. latency  - single-request predict() p50 / p99
+  3. throughput - predict_batch() rows/sec at several batch sizes
+
+Usage (from Model/login_auth, after training/train_autoencoder.py):
+    python benchmarks/bench_autoencoder_backends.py --threads 1
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "training"))
+
+from app.models.autoencoder import AutoencoderModel
+from preprocess_data import preprocess_csv
+
+
+def load_rows(csv_path: str) -> np.ndarray:
+    return preprocess_csv(csv_path).to_numpy(dtype=np.float32)
+
+
+def latency(fn, rows, iterations: int) -> dict:
+    # Warm up so one-time allocation is not counted
+    for row in rows[:20]:
+        fn(row)
+
+    timings = []
+    for i in range(iterations):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def throughput(model, rows, batch_size: int, seconds: float = 2.0) -> float:
+    batch = rows[np.arange(batch_size) % len(rows)]
+    model.predict_batch(batch)
+
+    done = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        model.predict_batch(batch)
+        done += batch_size
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "training", "final_dataset.csv"))
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1, help="torch threads (onnx uses ORT_INTRA_OP_THREADS)")
+    parser.add_argument("--tolerance", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rows = load_rows(args.data)
+
+    torch_model = AutoencoderModel(backend="torch")
+    torch_model.load()
+    onnx_model = AutoencoderModel(backend="onnx")
+    onnx_model.load()
+
+    # --- Parity ---
+    torch_scores = np.array([r["score"] for r in torch_model.predict_batch(rows)])
+    onnx_scores = np.array([r["score"] for r in onnx_model.predict_batch(rows)])
+    abs_diff = np.abs(torch_scores - onnx_scores)
+    rel_diff = abs_diff / np.maximum(np.abs(torch_scores), 1e-12)
+    decisions_match = np.mean((torch_scores > torch_model.threshold) == (onnx_scores > onnx_model.threshold))
+
+    print(f"\n--- PARITY ({len(rows)} sessions) ---")
+    print(f"Max abs diff:      {abs_diff.max():.3e}")
+    print(f"Max rel diff:      {rel_diff.max():.3e}")
+    print(f"Decision agreement: {decisions_match:.4%}")
+    print("PASS" if rel_diff.max() <= args.tolerance else f"FAIL (tolerance {args.tolerance})")
+
+    # --- Single-request latency ---
+    print("\n--- SINGLE REQUEST LATENCY ---")
+    for name, model in (("torch", torch_model), ("onnx", onnx_model)):
+        stats = latency(model.predict, rows, args.iterations)
+        print(f"{name:<6} p50 {stats['p50_ms']:.3f} ms | p99 {stats['p99_ms']:.3f} ms")
+
+    # --- Batched throughput ---
+    print("\n--- BATCH THROUGHPUT (rows/sec) ---")
+    print(f"{'batch':>6}{'torch':>14}{'onnx':>14}{'speedup':>10}")
+    for batch_size in (1, 8, 32, 128, 512):
+        t = throughput(torch_model, rows, batch_size)
+        o = throughput(onnx_model, rows, batch_size)
+        print(f"{batch_size:>6}{t:>14,.0f}{o:>14,.0f}{o / t:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+bench_autoencoder_warmup.py
+CacheMeOutside
+
+Cold vs. warm single-request latency of AutoencoderModel in eager, traced
+and scripted (frozen, optimize_for_inference) modes.
+
+Every (mode, warm-up) pair runs in a fresh interpreter, so "first request"
+really is the first forward pass in the process:
+  load_ms      AutoencoderModel.load(), including TorchScript compilation
+  warmup_ms    warm_up() at AUTOENCODER_WARMUP_BATCHES (0 when skipped)
+  first_ms     the first predict() after that
+  p50 / p99    steady state over --iterations further requests
+
+Usage (from Model/login_auth, after training/train_autoencoder.py):
+    python benchmarks/bench_autoencoder_warmup.py --threads 1
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+MODES = ["eager", "trace", "script"]
+
+
+def child(mode: str, warm: bool, iterations: int):
+    import numpy as np
+
+    from app.models.autoencoder import AutoencoderModel
+    from app.services.feature_extractor import FEATURE_DIM
+
+    rng = np.random.default_rng(0)
+    rows = rng.normal(size=(256, FEATURE_DIM)).astype(np.float32)
+
+    start = time.perf_counter()
+    model = AutoencoderModel(backend="torch")
+    model.load(jit=mode)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    warmup_ms = model.warm_up() * 1000 if warm else 0.0
+
+    start = time.perf_counter()
+    model.predict(rows[0])
+    first_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        model.predict(rows[i % len(rows)])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        "mode": model.jit,
+        "load_ms": load_ms,
+        "warmup_ms": warmup_ms,
+        "first_ms": first_ms,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1, help="TORCH_NUM_THREADS for every run")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "WARM"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1] == "warm", args.iterations)
+        return
+
+    env = {**os.environ, "TORCH_NUM_THREADS": str(args.threads), "LOG_LEVEL": "WARNING"}
+    print(f"{'mode':<8} {'warm-up':<8} {'load':>9} {'warm-up':>9} {'first':>9} {'p50':>8} {'p99':>8}   (ms)")
+    for mode in MODES:
+        for warm in ("cold", "warm"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, warm,
+                 "--iterations", str(args.iterations)],
+                cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            label = r["mode"] if r["mode"] == mode else f"{mode}->{r['mode']}"
+            print(f"{label:<8} {warm:<8} {r['load_ms']:9.1f} {r['warmup_ms']:9.1f} {r['first_ms']:9.3f} "
+                  f"{r['p50_ms']:8.3f} {r['p99_ms']:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+bench_ensemble.py
+CacheMeOutside
+
+Single-request latency of the registered-user paths:
+  autoencoder   AutoencoderModel.predict
+  ocsvm         OneClassSVMModel.predict
+  sequential    both, one after the other (the cost without the pool)
+  ensemble      EnsembleScorer.predict (OCSVM on the pool, AE inline)
+
+The ensemble should land near max(autoencoder, ocsvm), not their sum.
+
+Usage (from Model/login_auth, after training both models):
+    python benchmarks/bench_ensemble.py --user nolanpark --policy weighted
+"""
+
+import argparse
+import os
+import sys
+
+import torch
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "benchmarks"))
+
+from app.models.autoencoder import AutoencoderModel
+from app.models.ocsvm import OneClassSVMModel
+from app.services.ensemble import EnsembleScorer
+from bench_autoencoder_backends import latency, load_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "training", "final_dataset.csv"))
+    parser.add_argument("--user", default="nolanpark")
+    parser.add_argument("--policy", default="weighted", choices=["any", "all", "weighted"])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=1, help="torch threads")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    rows = load_rows(args.data)
+
+    autoencoder = AutoencoderModel()
+    autoencoder.load()
+    ocsvm = OneClassSVMModel(user_id=args.user)
+    ocsvm.load()
+    ensemble = EnsembleScorer(policy=args.policy)
+
+    def sequential(row):
+        autoencoder.predict(row)
+        ocsvm.predict(row)
+
+    results = {
+        "autoencoder": latency(autoencoder.predict, rows, args.iterations),
+        "ocsvm": latency(ocsvm.predict, rows, args.iterations),
+        "sequential": latency(sequential, rows, args.iterations),
+        f"ensemble:{args.policy}": latency(lambda row: ensemble.predict(autoencoder, ocsvm, row), rows,
+                                           args.iterations),
+    }
+    ensemble.stop()
+
+    print(f"\nShared scaling step: {ensemble._scaler_for(autoencoder, ocsvm) is not None}")
+    print("\n--- SINGLE-REQUEST LATENCY (ms) ---")
+    for name, r in results.items():
+        print(f"{name:<20} p50 {r['p50_ms']:7.3f}   p99 {r['p99_ms']:7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+bench_feature_extraction.py
+CacheMeOutside
+
+Microbenchmark of the request-side feature path, per session:
+  legacy        model_dump() -> merged `parsed` dict -> per-column get/split
+                (the /analyze path before vector_from_payload)
+  payload       vector_from_payload(BehaviorPayload)
+  dict          flatten_behavior(dict)       (training / export path)
+  json+payload  vector_from_json(bytes)      (validation included)
+  json.loads    json.loads + model_validate + vector_from_payload
+  matrix        matrix_from_payloads, per row, at batch size --batch
+
+Also checks that every path yields the same vector.
+
+Usage (from Model/login_auth):
+    python benchmarks/bench_feature_extraction.py --iterations 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "training"))
+
+from app.schemas import BehaviorPayload
+from app.services.feature_extractor import (
+    FEATURE_ORDER,
+    FEATURE_ORDER_HASH,
+    flatten_behavior,
+    matrix_from_payloads,
+    vector_from_json,
+    vector_from_payload,
+)
+from preprocess_data import preprocess_csv
+
+
+def legacy_vector(payload: BehaviorPayload) -> list:
+    behavior_dict = payload.model_dump()
+    parsed = {}
+    for group in ["interaction", "keyboard", "mouse", "timing"]:
+        group_data = behavior_dict.get(group, {})
+        if isinstance(group_data, dict):
+            parsed.update(group_data)
+    return [
+        float(parsed.get(col, 0.0) or parsed.get(col.split(".")[-1], 0.0))
+        for col in FEATURE_ORDER
+    ]
+
+
+def load_payloads(csv_path: str, limit: int) -> list:
+    rows = preprocess_csv(csv_path).to_dict(orient="records")[:limit]
+    behaviors = []
+    for row in rows:
+        behavior = {"mouse": {}, "keyboard": {}, "interaction": {}, "timing": {}}
+        for key, value in row.items():
+            group, field = key.split(".", 1)
+            behavior[group][field] = bool(value) if field == "paste_detected" else float(value)
+        behaviors.append(behavior)
+    return behaviors
+
+
+def per_call_us(fn, inputs, iterations: int) -> float:
+    n = len(inputs)
+    counter = iter(range(iterations))
+
+    def call():
+        fn(inputs[next(counter) % n])
+
+    return timeit.timeit(call, number=iterations) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "training", "final_dataset.csv"))
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    behaviors = load_payloads(args.data, limit=1000)
+    payloads = [BehaviorPayload.model_validate(b) for b in behaviors]
+    raw = [json.dumps(b).encode() for b in behaviors]
+
+    # Parity: every path must produce the same FEATURE_ORDER vector
+    expected = np.array([legacy_vector(p) for p in payloads], dtype=np.float32)
+    for name, got in (
+        ("payload", np.stack([vector_from_payload(p) for p in payloads])),
+        ("dict", np.array([flatten_behavior(b) for b in behaviors], dtype=np.float32)),
+        ("json", np.stack([vector_from_json(r) for r in raw])),
+        ("matrix", matrix_from_payloads(payloads)),
+    ):
+        if not np.array_equal(expected, got):
+            raise SystemExit(f"{name}: vectors differ from the legacy path")
+    print(f"Parity OK on {len(payloads)} sessions (feature order {FEATURE_ORDER_HASH})")
+
+    results = {
+        "legacy": per_call_us(legacy_vector, payloads, args.iterations),
+        "payload": per_call_us(vector_from_payload, payloads, args.iterations),
+        "dict": per_call_us(flatten_behavior, behaviors, args.iterations),
+        "json+payload": per_call_us(vector_from_json, raw, args.iterations),
+        "json.loads": per_call_us(
+            lambda r: vector_from_payload(BehaviorPayload.model_validate(json.loads(r))), raw, args.iterations
+        ),
+    }
+    batches = [payloads[i:i + args.batch] for i in range(0, len(payloads) - args.batch + 1, args.batch)] \
+        or [payloads]
+    batch_rows = len(batches[0])
+    results[f"matrix (/row, batch {batch_rows})"] = (
+        per_call_us(matrix_from_payloads, batches, max(args.iterations // batch_rows, 10)) / batch_rows
+    )
+
+    print("\n--- PER-SESSION FEATURE EXTRACTION (us) ---")
+    for name, us in results.items():
+        print(f"{name:<28} {us:8.2f}  ({results['legacy'] / us:4.1f}x vs legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+bench_worker_memory.py
+CacheMeOutside
+
+Compares host memory for N uvicorn-like worker processes that each load the
+autoencoder and every per-user OCSVM, once from the pickled artifacts and
+once from the memory-mapped ones (USE_MMAP_ARTIFACTS).
+
+All workers of a run stay alive while memory is sampled, so shared pages are
+split between them. PSS (proportional set size) is the number to compare:
+the sum of PSS across workers is the real memory the host pays.
+
+Linux only (reads /proc/self/smaps_rollup).
+
+Usage (from Model/login_auth, after training/export_mmap_artifacts.py):
+    python benchmarks/bench_worker_memory.py --workers 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_SRC = r"""
+import json, os, sys
+sys.path.insert(0, {base_dir!r})
+
+from app.core.config import USERS_MODEL_DIR
+from app.models.autoencoder import AutoencoderModel
+from app.models.ocsvm import OneClassSVMModel
+from app.services.feature_extractor import FEATURE_DIM
+
+
+def smaps():
+    out = {{}}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1])
+    return out
+
+
+before = smaps()
+
+autoencoder = AutoencoderModel()
+autoencoder.load()
+autoencoder.predict([0.0] * FEATURE_DIM)
+
+users = []
+for name in sorted(os.listdir(USERS_MODEL_DIR)):
+    if name.startswith("user_"):
+        model = OneClassSVMModel(user_id=name[len("user_"):])
+        model.load()
+        model.predict([0.0] * FEATURE_DIM)
+        users.append(model)
+
+print("ready", flush=True)
+sys.stdin.readline()          # wait until every worker has loaded
+after = smaps()
+print(json.dumps({{"before": before, "after": after, "users": len(users)}}), flush=True)
+sys.stdin.readline()          # stay alive until the parent is done sampling
+"""
+
+
+def run(mode: str, workers: int) -> dict:
+    env = dict(os.environ, USE_MMAP_ARTIFACTS="true" if mode == "mmap" else "false")
+    src = WORKER_SRC.format(base_dir=BASE_DIR)
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-c", src],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env,
+        )
+        for _ in range(workers)
+    ]
+
+    for p in procs:
+        line = p.stdout.readline().strip()
+        if line != "ready":
+            raise RuntimeError(f"worker failed to start ({mode}): {line!r}")
+
+    samples = []
+    for p in procs:
+        p.stdin.write("measure\n")
+        p.stdin.flush()
+    for p in procs:
+        samples.append(json.loads(p.stdout.readline()))
+    for p in procs:
+        p.stdin.write("exit\n")
+        p.stdin.flush()
+        p.wait()
+
+    def total(key, phase="after"):
+        return sum(s[phase].get(key, 0) for s in samples)
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "users": samples[0]["users"],
+        "pss_total_mb": total("Pss") / 1024,
+        "rss_total_mb": total("Rss") / 1024,
+        "pss_model_delta_mb": (total("Pss") - total("Pss", "before")) / 1024,
+        "anon_total_mb": total("Anonymous") / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    results = [run("pickle", args.workers), run("mmap", args.workers)]
+
+    print(f"\n--- WORKER MEMORY ({args.workers} workers, {results[0]['users']} user models) ---")
+    print(f"{'mode':<8}{'PSS total':>12}{'RSS total':>12}{'anon':>12}{'model PSS':>12}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['pss_total_mb']:>10.1f}MB{r['rss_total_mb']:>10.1f}MB"
+              f"{r['anon_total_mb']:>10.1f}MB{r['pss_model_delta_mb']:>10.1f}MB")
+
+    saved = results[0]["pss_total_mb"] - results[1]["pss_total_mb"]
+    print(f"\nHost memory saved by mmap artifacts: {saved:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
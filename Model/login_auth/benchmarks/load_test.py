@@ -0,0 +1,354 @@
+"""
+load_test.py
+CacheMeOutside
+
+Closed-loop load tester for POST /analyze with synthetic traffic.
+
+Traffic model
+  Human sessions are sampled from a Gaussian copula fitted on
+  final_dataset.csv. Each feature keeps its empirical marginal
+  distribution, and the rank correlation between features is preserved.
+  Bot sessions start from a human sample and apply one of the archetypes
+  in BOT_ARCHETYPES: no mouse, pasted credentials, scripted typing, or an
+  instant submit.
+
+  A fraction of requests (--registered) reuse accounts created through
+  /register with their real password, so the per-user paths (profile,
+  OCSVM) are exercised. The rest log in as never-seen usernames.
+
+Driver
+  --concurrency asyncio workers each send a request, wait for the response,
+  and send the next one. --rate caps the total arrival rate with a shared
+  schedule; without it the workers run flat out. Every --interval seconds
+  the driver prints throughput, latency p50/p95/p99, error and degraded
+  rates, and prefilter hits. The full series can be saved with --out.
+
+Fully local run, against the in-memory storage backend:
+    python benchmarks/load_test.py --spawn --duration 60 --concurrency 32 --rate 200
+
+Against a running server:
+    python benchmarks/load_test.py --url http://localhost:8000 --duration 60
+
+Needs httpx (pip install httpx).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(BASE_DIR))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "training"))
+
+from app.services.feature_extractor import FEATURE_ORDER
+from preprocess_data import preprocess_csv
+
+# Features that are counts in behaviorTracker.js
+COUNT_FEATURES = {
+    "mouse.total_moves", "mouse.direction_changes", "mouse.pause_count",
+    "keyboard.total_keystrokes", "interaction.click_count",
+    "interaction.scroll_count", "interaction.focus_changes",
+}
+
+BOT_ARCHETYPES = ("no_mouse", "paste", "scripted_typing", "instant_submit")
+
+
+# ── Traffic model ─────────────────────────────────────────────────────────────
+class SessionSampler:
+    """Gaussian copula over FEATURE_ORDER fitted on an exported dataset."""
+
+    def __init__(self, feature_matrix: np.ndarray, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        X = np.asarray(feature_matrix, dtype=np.float64)
+        n = len(X)
+        # Empirical marginals (sorted columns) for the inverse CDF
+        self.sorted = np.sort(X, axis=0)
+        # Normal scores of the ranks -> correlation of the copula
+        ranks = X.argsort(axis=0).argsort(axis=0)
+        z = _norm_ppf((ranks + 0.5) / n)
+        corr = np.nan_to_num(np.corrcoef(z, rowvar=False))   # constant columns -> 0
+        np.fill_diagonal(corr, 1.0)
+        # Clip to positive definite before factoring (near-duplicate features)
+        eigvals, eigvecs = np.linalg.eigh(corr)
+        corr = (eigvecs * np.maximum(eigvals, 1e-6)) @ eigvecs.T
+        self.chol = np.linalg.cholesky(corr)
+
+    def humans(self, n: int) -> np.ndarray:
+        z = self.rng.standard_normal((n, self.chol.shape[0])) @ self.chol.T
+        u = _norm_cdf(z)
+        idx = np.minimum((u * len(self.sorted)).astype(int), len(self.sorted) - 1)
+        X = np.take_along_axis(self.sorted, idx, axis=0)
+        for i, name in enumerate(FEATURE_ORDER):
+            if name in COUNT_FEATURES:
+                X[:, i] = np.round(X[:, i])
+        return X
+
+    def bot(self) -> tuple[np.ndarray, str]:
+        x = self.humans(1)[0]
+        kind = BOT_ARCHETYPES[self.rng.integers(len(BOT_ARCHETYPES))]
+        col = {name: i for i, name in enumerate(FEATURE_ORDER)}
+        if kind == "no_mouse":
+            for name in FEATURE_ORDER:
+                if name.startswith("mouse."):
+                    x[col[name]] = 0
+            x[col["interaction.mouse_keyboard_ratio"]] = 0
+        elif kind == "paste":
+            x[col["keyboard.paste_detected"]] = 1
+            x[col["keyboard.total_keystrokes"]] = self.rng.integers(0, 3)
+        elif kind == "scripted_typing":
+            interval = self.rng.uniform(0.1, 15)
+            x[col["keyboard.mean_interval_ms"]] = interval
+            x[col["keyboard.min_interval_ms"]] = interval * 0.5
+            x[col["keyboard.max_interval_ms"]] = interval * 1.5
+            x[col["keyboard.interval_std_ms"]] = interval * 0.05
+            x[col["keyboard.backspace_ratio"]] = 0
+        else:  # instant_submit
+            x[col["timing.session_duration_ms"]] = self.rng.uniform(50, 400)
+            x[col["timing.time_to_first_action_ms"]] = self.rng.uniform(0, 20)
+            x[col["timing.idle_time_ratio"]] = 0
+        return x, kind
+
+
+def _norm_cdf(z):
+    from math import erf, sqrt
+    return 0.5 * (1 + np.vectorize(erf)(z / sqrt(2)))
+
+
+def _norm_ppf(p):
+    # Acklam's rational approximation; plenty for a traffic model
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+         3.754408661907416e+00]
+    p = np.asarray(p, dtype=np.float64)
+    out = np.empty_like(p)
+    low, high = p < 0.02425, p > 1 - 0.02425
+    mid = ~(low | high)
+
+    q = np.sqrt(-2 * np.log(p[low]))
+    out[low] = (((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    q = np.sqrt(-2 * np.log(1 - p[high]))
+    out[high] = -(((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5]) / ((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+    q = p[mid] - 0.5
+    r = q * q
+    out[mid] = (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q / (((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1)
+    return out
+
+
+def to_behavior(vector, rng: np.random.Generator) -> dict:
+    behavior = {"mouse": {}, "keyboard": {}, "interaction": {}, "timing": {}}
+    for name, value in zip(FEATURE_ORDER, vector):
+        group, field = name.split(".", 1)
+        value = max(float(value), 0.0)
+        behavior[group][field] = value >= 0.5 if field == "paste_detected" else value
+    behavior["environment"] = {
+        "viewport_width": float(rng.choice([1280, 1366, 1440, 1536, 1920])),
+        "viewport_height": float(rng.choice([650, 720, 800, 900, 1080])),
+        "timezone_offset": float(rng.choice([-60, 0, 240, 300, 480])),
+        "device_pixel_ratio": float(rng.choice([1, 1.25, 1.5, 2])),
+    }
+    return behavior
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+class Window:
+    def __init__(self):
+        self.latencies_ms = []
+        self.statuses = Counter()
+        self.degraded = 0
+        self.prefiltered = 0
+        self.flagged = Counter()   # (traffic kind, is_bot) -> count
+
+    def record(self, kind: str, latency_ms: float, status: int, body: dict | None):
+        self.latencies_ms.append(latency_ms)
+        self.statuses[status] += 1
+        if body:
+            self.degraded += bool(body.get("degraded"))
+            self.prefiltered += body.get("reason_code") is not None
+            self.flagged[(kind, bool(body.get("is_bot")))] += 1
+
+    def summary(self, elapsed_s: float) -> dict:
+        n = len(self.latencies_ms)
+        lat = np.array(self.latencies_ms) if n else np.zeros(1)
+        errors = sum(c for s, c in self.statuses.items() if s >= 400 or s == 0)
+        return {
+            "requests": n,
+            "rps": n / elapsed_s if elapsed_s else 0.0,
+            "p50_ms": float(np.percentile(lat, 50)),
+            "p95_ms": float(np.percentile(lat, 95)),
+            "p99_ms": float(np.percentile(lat, 99)),
+            "error_rate": errors / n if n else 0.0,
+            "degraded_rate": self.degraded / n if n else 0.0,
+            "prefilter_rate": self.prefiltered / n if n else 0.0,
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "flag_rate": {
+                kind: self.flagged[(kind, True)] / max(self.flagged[(kind, True)] + self.flagged[(kind, False)], 1)
+                for kind in ("human", "bot")
+            },
+        }
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+async def register_users(client: httpx.AsyncClient, count: int, run_id: str) -> list:
+    users = []
+    for i in range(count):
+        username, password = f"load-{run_id}-{i}", f"pw-{run_id}-{i}"
+        r = await client.post("/register", json={"username": username, "password": password})
+        if r.status_code == 200:
+            users.append((username, password))
+    if count and not users:
+        print("[WARN] no users could be registered; all traffic will be new users")
+    return users
+
+
+async def run(args, sampler: SessionSampler):
+    rng = np.random.default_rng(args.seed)
+    run_id = f"{int(time.time())}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        users = await register_users(client, args.users, run_id)
+
+        window, series, total = Window(), [], Window()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        next_slot = [start]
+
+        async def next_request_time():
+            if not args.rate:
+                return
+            slot = next_slot[0]
+            next_slot[0] = slot + 1.0 / args.rate
+            delay = slot - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        async def worker(worker_id: int):
+            counter = 0
+            while time.perf_counter() < deadline:
+                await next_request_time()
+                if time.perf_counter() >= deadline:
+                    return
+                counter += 1
+                if rng.random() < args.bots:
+                    vector, _ = sampler.bot()
+                    kind = "bot"
+                else:
+                    vector, kind = sampler.humans(1)[0], "human"
+                if users and rng.random() < args.registered:
+                    username, password = users[rng.integers(len(users))]
+                else:
+                    username, password = f"new-{run_id}-{worker_id}-{counter}", "guess"
+                payload = {"username": username, "password": password, "behavior": to_behavior(vector, rng)}
+
+                sent = time.perf_counter()
+                try:
+                    r = await client.post("/analyze", json=payload)
+                    status, body = r.status_code, (r.json() if r.status_code == 200 else None)
+                except httpx.HTTPError:
+                    status, body = 0, None
+                latency_ms = (time.perf_counter() - sent) * 1000
+                window.record(kind, latency_ms, status, body)
+                total.record(kind, latency_ms, status, body)
+
+        async def reporter():
+            nonlocal window
+            last = start
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(args.interval)
+                now = time.perf_counter()
+                current, window = window, Window()
+                summary = current.summary(now - last)
+                summary["t"] = round(now - start, 1)
+                series.append(summary)
+                last = now
+                print(f"t={summary['t']:>6}s  {summary['rps']:8.1f} req/s  "
+                      f"p50 {summary['p50_ms']:7.1f}  p95 {summary['p95_ms']:7.1f}  p99 {summary['p99_ms']:7.1f} ms  "
+                      f"err {summary['error_rate']:.2%}  degraded {summary['degraded_rate']:.2%}  "
+                      f"prefilter {summary['prefilter_rate']:.2%}")
+
+        await asyncio.gather(reporter(), *(worker(i) for i in range(args.concurrency)))
+        overall = total.summary(time.perf_counter() - start)
+
+        monitoring = {}
+        for path in ("/monitoring/admission", "/monitoring/prefilter"):
+            try:
+                monitoring[path] = (await client.get(path)).json()
+            except (httpx.HTTPError, ValueError):
+                pass
+
+    print("\n--- OVERALL ---")
+    print(json.dumps(overall, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "overall": overall, "series": series, "server": monitoring}, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """uvicorn with the in-memory storage backend; no AWS needed."""
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": "memory",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        # main.py imports Data.* from the repo root
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env,
+    )
+    for _ in range(120):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("Server did not become healthy")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--spawn", action="store_true", help="start a local server with STORAGE_BACKEND=memory")
+    parser.add_argument("--port", type=int, default=8765, help="port for --spawn")
+    parser.add_argument("--data", default=os.path.join(BASE_DIR, "training", "final_dataset.csv"))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=None, help="target requests/s (default: closed loop, no cap)")
+    parser.add_argument("--bots", type=float, default=0.2, help="fraction of bot sessions")
+    parser.add_argument("--registered", type=float, default=0.3, help="fraction of logins by registered users")
+    parser.add_argument("--users", type=int, default=50, help="registered accounts to create")
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write series + summary JSON here")
+    args = parser.parse_args()
+
+    sampler = SessionSampler(preprocess_csv(args.data).to_numpy(), seed=args.seed)
+
+    server = None
+    if args.spawn:
+        server = spawn_server(args.port)
+        args.url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(run(args, sampler))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+import numpy as np
+
+from app.core.config import AUTOENCODER_DIR, DRIFT_BINS
+from app.services.drift import build_reference, save_reference
+from preprocess_data import preprocess_csv
+
+
+def build(data: str = "final_dataset.csv", model_dir: str = AUTOENCODER_DIR, bins: int = DRIFT_BINS):
+    """
+    Writes drift_reference.npz for an autoencoder trained before the drift
+    monitor existed. Use the same CSV the model was trained on; publish (or
+    copy into the registry version) afterwards so the server picks it up.
+    """
+    X = preprocess_csv(data).to_numpy(dtype=np.float32)
+    print(f"Drift reference ({X.shape[0]} rows, {bins} bins) -> "
+          f"{save_reference(build_reference(X, bins), model_dir)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="final_dataset.csv")
+    parser.add_argument("--model-dir", default=AUTOENCODER_DIR)
+    parser.add_argument("--bins", type=int, default=DRIFT_BINS)
+    args = parser.parse_args()
+    build(args.data, args.model_dir, args.bins)
@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+import numpy as np
+
+from app.services.prefilter import RulePrefilter, load_rules
+from preprocess_data import preprocess_csv
+
+
+def calibrate(data: str = "final_dataset.csv", rules_path: str | None = None, max_rate: float = 0.0) -> bool:
+    """
+    Runs the prefilter rules over human sessions and prints how many each
+    rule would short-circuit as bots. Every hit on this data is a false
+    positive that never reaches a model. Returns False when the share of
+    rejected sessions is above max_rate.
+    """
+    X = preprocess_csv(data).to_numpy(dtype=np.float64)
+    prefilter = RulePrefilter(rules=load_rules(rules_path), enabled=True)
+    codes = prefilter.check_batch(X)
+    snapshot = prefilter.snapshot()
+
+    print(f"{len(X)} human sessions from {data}")
+    for code, hits in snapshot["hits"].items():
+        print(f"  {code:<24} {hits:6d}  {hits / max(len(X), 1):7.2%}")
+    rejected = sum(code is not None for code in codes)
+    rate = rejected / max(len(X), 1)
+    print(f"  {'rejected (any rule)':<24} {rejected:6d}  {rate:7.2%}")
+    return rate <= max_rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="final_dataset.csv")
+    parser.add_argument("--rules", default=None, help="rules JSON (default: DEFAULT_RULES)")
+    parser.add_argument("--max-rate", type=float, default=0.0, help="allowed share of rejected human sessions")
+    args = parser.parse_args()
+    sys.exit(0 if calibrate(args.data, args.rules, args.max_rate) else 1)
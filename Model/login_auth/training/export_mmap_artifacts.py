@@ -0,0 +1,34 @@
+import os
+import sys
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+from app.core.config import AUTOENCODER_DIR, USERS_MODEL_DIR
+from app.services.mmap_artifacts import export_autoencoder, export_ocsvm
+
+
+def export_all():
+    """
+    Writes memory-mappable copies of the autoencoder and every per-user OCSVM.
+    Run after training; serve them with USE_MMAP_ARTIFACTS=true.
+    """
+    print(f"Autoencoder -> {export_autoencoder(AUTOENCODER_DIR)}")
+
+    if not os.path.isdir(USERS_MODEL_DIR):
+        return
+
+    for user_dir in sorted(os.listdir(USERS_MODEL_DIR)):
+        model_dir = os.path.join(USERS_MODEL_DIR, user_dir)
+        if not os.path.exists(os.path.join(model_dir, "ocsvm.pkl")):
+            continue
+        try:
+            print(f"{user_dir} -> {export_ocsvm(model_dir)}")
+        except ValueError as e:
+            print(f"[WARN] Skipping {user_dir}: {e}")
+
+
+if __name__ == "__main__":
+    export_all()
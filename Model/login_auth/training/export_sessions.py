@@ -0,0 +1,279 @@
+"""
+Exports completed Sessions into a partitioned Parquet dataset for training.
+
+Replaces the manual console export behind final_dataset.csv / 2fa_data.csv:
+
+- Parallel segmented scan: `--segments` workers each scan one segment of
+  the table, following LastEvaluatedKey to the end.
+- Only the attributes training needs are projected; date range, status and
+  user filters are applied server-side.
+- behaviorPayload is flattened to FEATURE_ORDER columns (float32) next to
+  the session metadata, and written as zstd-compressed Parquet partitioned
+  by day:  <out>/date=YYYY-MM-DD/seg<SS>-part<NNNNN>.parquet
+- Progress is checkpointed per segment (<out>/_checkpoint.json) after each
+  file is written, so an interrupted export resumes from the last flushed
+  page. Part file names are deterministic, so a page replayed after a crash
+  overwrites its own file instead of duplicating rows.
+
+Point it at DynamoDB Local (or any stand-in) with --endpoint-url or
+DYNAMODB_ENDPOINT_URL.
+
+Usage (from Model/login_auth/training):
+    python export_sessions.py --out datasets/sessions --from 2026-01-01 --to 2026-02-01 --segments 8
+    python export_sessions.py --out datasets/user_x --user <userId>
+
+Needs pyarrow (pip install pyarrow).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+import numpy as np
+
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+from app.services.feature_extractor import FEATURE_ORDER, FEATURE_ORDER_HASH, flatten_behavior
+from preprocess_data import parse_dynamodb_json
+
+CHECKPOINT = "_checkpoint.json"
+
+# Projected attributes; status (and possibly model / threshold) are DynamoDB
+# reserved words, so those go through placeholders
+PROJECTION = "sessionId, userId, createdAt, completedAt, isBot, mlScore, #m, #s, #t, behaviorPayload"
+NAMES = {"#m": "model", "#s": "status", "#t": "threshold"}
+
+META_COLUMNS = ["sessionId", "userId", "createdAt", "completedAt", "isBot", "mlScore", "model", "threshold"]
+
+
+def _to_millis(date_str: str) -> int:
+    dt = datetime.fromisoformat(date_str)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def build_scan_kwargs(table: str, start_ms: int | None, end_ms: int | None,
+                      users: list | None, page_size: int) -> dict:
+    filters = ["#s = :completed"]
+    values = {":completed": {"S": "completed"}}
+    if start_ms is not None:
+        filters.append("createdAt >= :start")
+        values[":start"] = {"N": str(start_ms)}
+    if end_ms is not None:
+        filters.append("createdAt < :end")
+        values[":end"] = {"N": str(end_ms)}
+    if users:
+        keys = [f":u{i}" for i in range(len(users))]
+        filters.append(f"userId IN ({', '.join(keys)})")
+        values.update({k: {"S": u} for k, u in zip(keys, users)})
+
+    return {
+        "TableName": table,
+        "ProjectionExpression": PROJECTION,
+        "ExpressionAttributeNames": NAMES,
+        "FilterExpression": " AND ".join(filters),
+        "ExpressionAttributeValues": values,
+        "Limit": page_size,
+    }
+
+
+def flatten_item(item: dict) -> dict | None:
+    """Raw DynamoDB item -> flat row (metadata + FEATURE_ORDER floats)."""
+    row = parse_dynamodb_json(item)
+    behavior = row.get("behaviorPayload")
+    if not isinstance(behavior, dict):
+        return None
+    flat = {col: row.get(col) for col in META_COLUMNS}
+    flat["createdAt"] = int(flat["createdAt"] or 0)
+    flat.update(zip(FEATURE_ORDER, flatten_behavior(behavior)))
+    return flat
+
+
+class Checkpoint:
+    """Per-segment resume state, rewritten atomically after every flush."""
+
+    def __init__(self, out_dir: str, fingerprint: str, total_segments: int):
+        self.path = os.path.join(out_dir, CHECKPOINT)
+        self._lock = threading.Lock()
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("fingerprint") != fingerprint:
+                raise SystemExit(
+                    f"{self.path} belongs to a different export (table/filters/segments changed). "
+                    "Use a new --out directory or delete the checkpoint."
+                )
+        self.state = state or {
+            "fingerprint": fingerprint,
+            "feature_order_hash": FEATURE_ORDER_HASH,
+            "segments": {str(s): {"last_key": None, "part": 0, "rows": 0, "done": False}
+                         for s in range(total_segments)},
+        }
+
+    def segment(self, segment: int) -> dict:
+        with self._lock:
+            return dict(self.state["segments"][str(segment)])
+
+    def advance(self, segment: int, last_key, rows: int):
+        with self._lock:
+            seg = self.state["segments"][str(segment)]
+            seg["last_key"] = last_key
+            seg["part"] += 1
+            seg["rows"] += rows
+            seg["done"] = last_key is None
+            self._write()
+
+    def _write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def write_partitions(rows: list, out_dir: str, segment: int, part: int, compression: str):
+    """Writes one Parquet file per day present in `rows`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    by_day: dict = {}
+    for row in rows:
+        day = datetime.fromtimestamp(row["createdAt"] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+        by_day.setdefault(day, []).append(row)
+
+    for day, day_rows in by_day.items():
+        columns = {
+            "sessionId": pa.array([r["sessionId"] for r in day_rows], pa.string()),
+            "userId": pa.array([r["userId"] for r in day_rows], pa.string()),
+            "createdAt": pa.array([r["createdAt"] for r in day_rows], pa.int64()),
+            "completedAt": pa.array([r["completedAt"] for r in day_rows], pa.float64()),
+            "isBot": pa.array([r["isBot"] for r in day_rows], pa.bool_()),
+            "mlScore": pa.array([r["mlScore"] for r in day_rows], pa.float64()),
+            "model": pa.array([r["model"] for r in day_rows], pa.string()),
+            "threshold": pa.array([r["threshold"] for r in day_rows], pa.float64()),
+        }
+        features = np.array([[r[col] for col in FEATURE_ORDER] for r in day_rows], dtype=np.float32)
+        for i, col in enumerate(FEATURE_ORDER):
+            columns[col] = pa.array(features[:, i])
+
+        table = pa.table(columns).replace_schema_metadata({"feature_order_hash": FEATURE_ORDER_HASH})
+        day_dir = os.path.join(out_dir, f"date={day}")
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f"seg{segment:02d}-part{part:05d}.parquet")
+        pq.write_table(table, path + ".tmp", compression=compression)
+        os.replace(path + ".tmp", path)
+
+
+def export_segment(client, scan_kwargs: dict, segment: int, total_segments: int,
+                   checkpoint: Checkpoint, out_dir: str, rows_per_file: int, compression: str) -> int:
+    state = checkpoint.segment(segment)
+    if state["done"]:
+        return 0
+
+    last_key = state["last_key"]
+    part = state["part"]
+    buffer = []
+    exported = 0
+
+    while True:
+        kwargs = {**scan_kwargs, "Segment": segment, "TotalSegments": total_segments}
+        if last_key:
+            kwargs["ExclusiveStartKey"] = last_key
+        response = client.scan(**kwargs)
+
+        for item in response.get("Items", []):
+            try:
+                row = flatten_item(item)
+            except (TypeError, ValueError) as e:
+                print(f"[WARN] segment {segment}: skipping malformed item: {e}")
+                continue
+            if row is not None:
+                buffer.append(row)
+
+        last_key = response.get("LastEvaluatedKey")
+        if len(buffer) >= rows_per_file or last_key is None:
+            if buffer:
+                write_partitions(buffer, out_dir, segment, part, compression)
+            checkpoint.advance(segment, last_key, len(buffer))
+            exported += len(buffer)
+            part += 1
+            buffer = []
+            print(f"segment {segment}: {exported} rows exported")
+        if last_key is None:
+            return exported
+
+
+def export_sessions(out_dir: str, table: str = "Sessions", start: str | None = None, end: str | None = None,
+                    users: list | None = None, segments: int = 4, page_size: int = 1000,
+                    rows_per_file: int = 50_000, compression: str = "zstd",
+                    endpoint_url: str | None = None, region: str = "us-east-1") -> int:
+    os.makedirs(out_dir, exist_ok=True)
+    start_ms = _to_millis(start) if start else None
+    end_ms = _to_millis(end) if end else None
+    scan_kwargs = build_scan_kwargs(table, start_ms, end_ms, users, page_size)
+
+    fingerprint = hashlib.sha1(json.dumps(
+        {"scan": {k: v for k, v in scan_kwargs.items() if k != "Limit"}, "segments": segments},
+        sort_keys=True,
+    ).encode()).hexdigest()[:16]
+    checkpoint = Checkpoint(out_dir, fingerprint, segments)
+
+    # Low-level client: raw attribute-value JSON (same shape as the console
+    # export preprocess_data already parses), and safe to share across threads
+    client = boto3.client("dynamodb", region_name=region, endpoint_url=endpoint_url)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        futures = [
+            pool.submit(export_segment, client, scan_kwargs, s, segments,
+                        checkpoint, out_dir, rows_per_file, compression)
+            for s in range(segments)
+        ]
+        total = sum(f.result() for f in futures)
+
+    all_rows = sum(seg["rows"] for seg in checkpoint.state["segments"].values())
+    print(f"\nExported {total} rows this run ({all_rows} total) to {out_dir} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="dataset directory (also holds the checkpoint)")
+    parser.add_argument("--table", default="Sessions")
+    parser.add_argument("--from", dest="start", help="ISO date/time, inclusive (createdAt, UTC if naive)")
+    parser.add_argument("--to", dest="end", help="ISO date/time, exclusive")
+    parser.add_argument("--user", action="append", dest="users", help="userId filter, repeatable")
+    parser.add_argument("--segments", type=int, default=4, help="parallel scan segments / threads")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--rows-per-file", type=int, default=50_000)
+    parser.add_argument("--compression", default="zstd")
+    parser.add_argument("--endpoint-url", default=os.getenv("DYNAMODB_ENDPOINT_URL"))
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-east-1"))
+    args = parser.parse_args()
+
+    export_sessions(
+        out_dir=args.out,
+        table=args.table,
+        start=args.start,
+        end=args.end,
+        users=args.users,
+        segments=args.segments,
+        page_size=args.page_size,
+        rows_per_file=args.rows_per_file,
+        compression=args.compression,
+        endpoint_url=args.endpoint_url,
+        region=args.region,
+    )
@@ -20,6 +20,13 @@ def parse_dynamodb_json(d):
     if "BOOL" in d:
         return bool(d["BOOL"])
 
+    # String / null (raw items from a low-level scan)
+    if "S" in d:
+        return d["S"]
+
+    if "NULL" in d:
+        return None
+
     # Map
     if "M" in d:
         return {k: parse_dynamodb_json(v) for k, v in d["M"].items()}
@@ -132,6 +139,29 @@ def preprocess_csv(file_path):
     return feature_df
 
 
+def preprocess_parquet(path, min_duration_ms: float = 2000):
+    """
+    Feature DataFrame from a dataset written by export_sessions.py (a single
+    file or a partitioned directory). Applies the same duration filter and
+    cleaning as preprocess_csv.
+    """
+    feature_df = pd.read_parquet(path, columns=FEATURE_ORDER)
+    feature_df = feature_df[feature_df["timing.session_duration_ms"] >= min_duration_ms]
+    return clean_dataframe(feature_df.reset_index(drop=True))
+
+
+def iter_feature_chunks(file_path, chunksize: int = 100_000):
+    """
+    Streaming version of preprocess_csv: reads the CSV `chunksize` rows at a
+    time and yields cleaned float32 feature arrays in FEATURE_ORDER, so the
+    full export never has to fit in memory.
+    """
+    for df in pd.read_csv(file_path, chunksize=chunksize):
+        feature_df = clean_dataframe(build_feature_dataframe(df))
+        if not feature_df.empty:
+            yield feature_df.to_numpy(dtype=np.float32)
+
+
 if __name__ == "__main__":
     # Change filename if needed
     feature_df = preprocess_csv("behavioral_events.csv")
@@ -0,0 +1,189 @@
+import io
+import json
+import os
+import shutil
+import sys
+import time
+
+import joblib
+import numpy as np
+import torch
+from sklearn.model_selection import train_test_split
+
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+from app.core.config import AUTOENCODER_DIR
+from app.models.autoencoder import (
+    AutoencoderModel,
+    INT8_THRESHOLD_FILENAME,
+    INT8_WEIGHTS_FILENAME,
+    quantize_dynamic_int8,
+)
+from app.services.model_registry import AUTOENCODER_FILES, MANIFEST, list_versions, publish, staging_dir
+from preprocess_data import preprocess_csv
+
+
+def reconstruction_errors(model, X: np.ndarray) -> np.ndarray:
+    with torch.no_grad():
+        x = torch.tensor(X, dtype=torch.float32)
+        recon = model(x)
+        return torch.mean((recon - x) ** 2, dim=1).numpy()
+
+
+def ks_statistic(a: np.ndarray, b: np.ndarray) -> float:
+    """Two-sample Kolmogorov-Smirnov statistic (max CDF distance)."""
+    grid = np.sort(np.concatenate([a, b]))
+    cdf_a = np.searchsorted(np.sort(a), grid, side="right") / len(a)
+    cdf_b = np.searchsorted(np.sort(b), grid, side="right") / len(b)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+
+def latency_ms(model, X: np.ndarray, iterations: int = 2000) -> dict:
+    rows = [torch.tensor(X[i:i + 1], dtype=torch.float32) for i in range(min(len(X), 256))]
+    with torch.no_grad():
+        for row in rows[:20]:
+            model(row)
+
+        timings = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            model(rows[i % len(rows)])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        batch = torch.tensor(X, dtype=torch.float32)
+        start = time.perf_counter()
+        model(batch)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "single_p50_ms": float(np.percentile(timings, 50)),
+        "single_p99_ms": float(np.percentile(timings, 99)),
+        "full_batch_ms": batch_ms,
+        "full_batch_rows": int(len(X)),
+    }
+
+
+def serialized_size_bytes(model) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def quantize(data_path: str = "final_dataset.csv"):
+    """
+    Builds the dynamic INT8 autoencoder next to best_autoencoder.pt and
+    compares it against the float model on the training dataset:
+    error distributions, recomputed 97th percentile threshold, anomaly
+    decisions, latency and memory.
+
+    Starts from a staging copy of the latest production registry version
+    (the legacy saved_models/autoencoder when the registry is empty) and
+    publishes it as a new version with these added:
+      best_autoencoder_int8.pt
+      threshold_int8.npy
+      quantization_report.json
+    """
+    torch.set_num_threads(1)
+
+    production = list_versions("autoencoder")
+    source_dir = production[-1]["path"] if production else AUTOENCODER_DIR
+    latent_dim = production[-1]["params"].get("latent_dim", 16) if production else 16
+    model_dir = staging_dir("autoencoder")
+    shutil.copytree(source_dir, model_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(MANIFEST))
+    print(f"Quantizing {source_dir}")
+
+    float_wrapper = AutoencoderModel(latent_dim=latent_dim, model_path=model_dir)
+    float_wrapper.device = torch.device("cpu")
+    float_wrapper.model.cpu()
+    # Eager on purpose: quantize_dynamic needs the nn.Module, not a frozen ScriptModule
+    float_wrapper.load(use_mmap=False, variant="float", jit="eager")
+    float_model = float_wrapper.model
+
+    # quantize_dynamic copies, float_model stays untouched for comparison
+    int8_model = quantize_dynamic_int8(float_model).eval()
+    torch.save(int8_model.state_dict(), os.path.join(model_dir, INT8_WEIGHTS_FILENAME))
+
+    # Same features, scaler and validation split as train_autoencoder.py
+    feature_df = preprocess_csv(data_path)
+    scaler = joblib.load(os.path.join(model_dir, "scaler.pkl"))
+    X_scaled = scaler.transform(feature_df.values)
+    _, X_val = train_test_split(X_scaled, test_size=0.2, random_state=42)
+
+    float_val = reconstruction_errors(float_model, X_val)
+    int8_val = reconstruction_errors(int8_model, X_val)
+
+    float_threshold = float(np.percentile(float_val, 97))
+    int8_threshold = float(np.percentile(int8_val, 97))
+    np.save(os.path.join(model_dir, INT8_THRESHOLD_FILENAME), int8_threshold)
+
+    # Decisions on the full dataset, each model with its own threshold
+    float_all = reconstruction_errors(float_model, X_scaled)
+    int8_all = reconstruction_errors(int8_model, X_scaled)
+    float_flags = float_all > float_threshold
+    int8_flags = int8_all > int8_threshold
+
+    percentiles = [50, 75, 90, 95, 97, 99]
+    report = {
+        "rows": int(len(X_scaled)),
+        "threshold": {
+            "float": float_threshold,
+            "int8": int8_threshold,
+            "saved_float": float(np.load(os.path.join(model_dir, "threshold.npy"))),
+        },
+        "errors": {
+            "float_percentiles": dict(zip(map(str, percentiles), np.percentile(float_all, percentiles).tolist())),
+            "int8_percentiles": dict(zip(map(str, percentiles), np.percentile(int8_all, percentiles).tolist())),
+            "mean_abs_diff": float(np.mean(np.abs(float_all - int8_all))),
+            "max_abs_diff": float(np.max(np.abs(float_all - int8_all))),
+            "ks_statistic": ks_statistic(float_all, int8_all),
+        },
+        "decisions": {
+            "agreement": float(np.mean(float_flags == int8_flags)),
+            "float_flag_rate": float(np.mean(float_flags)),
+            "int8_flag_rate": float(np.mean(int8_flags)),
+            "flipped_to_anomaly": int(np.sum(~float_flags & int8_flags)),
+            "flipped_to_normal": int(np.sum(float_flags & ~int8_flags)),
+        },
+        "latency": {
+            "float": latency_ms(float_model, X_scaled),
+            "int8": latency_ms(int8_model, X_scaled),
+        },
+        "memory": {
+            "float_state_dict_bytes": serialized_size_bytes(float_model),
+            "int8_state_dict_bytes": serialized_size_bytes(int8_model),
+        },
+    }
+
+    with open(os.path.join(model_dir, "quantization_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n--- INT8 vs FLOAT ---")
+    print(f"Rows: {report['rows']}")
+    print(f"Threshold (97th pct, val): float {float_threshold:.6f} | int8 {int8_threshold:.6f}")
+    print(f"Error KS statistic: {report['errors']['ks_statistic']:.4f} | "
+          f"mean abs diff {report['errors']['mean_abs_diff']:.2e}")
+    print(f"Decision agreement: {report['decisions']['agreement']:.4%} "
+          f"(flag rate float {report['decisions']['float_flag_rate']:.2%}, "
+          f"int8 {report['decisions']['int8_flag_rate']:.2%})")
+    for name in ("float", "int8"):
+        lat = report["latency"][name]
+        print(f"{name:<6} single p50 {lat['single_p50_ms']:.3f} ms | p99 {lat['single_p99_ms']:.3f} ms | "
+              f"batch of {lat['full_batch_rows']} {lat['full_batch_ms']:.2f} ms")
+    print(f"State dict size: float {report['memory']['float_state_dict_bytes'] / 1024:.1f} KB | "
+          f"int8 {report['memory']['int8_state_dict_bytes'] / 1024:.1f} KB")
+    # New registry version carrying the int8 artifacts next to the float ones
+    version_dir = publish("autoencoder", model_dir, AUTOENCODER_FILES,
+                          threshold=report["threshold"]["saved_float"],
+                          params={"latent_dim": float_wrapper.latent_dim})
+    print(f"Registry version: {version_dir}")
+    shutil.rmtree(model_dir, ignore_errors=True)
+
+    print("\nQuantized model, threshold and report saved. Serve with AUTOENCODER_VARIANT=int8.")
+
+
+if __name__ == "__main__":
+    quantize()
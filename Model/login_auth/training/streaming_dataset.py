@@ -0,0 +1,119 @@
+"""
+Out-of-core data pipeline for train_autoencoder.train_streaming.
+
+Features live in a flat float32 file on disk (FEATURE_ORDER columns, one
+row per session) plus a small JSON sidecar with the shape. Everything else
+reads it through np.memmap in fixed-size chunks, so RAM use depends on the
+chunk size, not on the number of sessions.
+"""
+
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from app.services.feature_extractor import FEATURE_ORDER
+from preprocess_data import iter_feature_chunks
+
+# Knuth multiplicative hash: spreads row indices so the validation split is
+# not periodic in the file order
+_HASH_MULT = np.uint64(2654435761)
+_HASH_MOD = np.uint64(2 ** 32)
+
+
+def build_feature_file(csv_path: str, out_path: str, chunksize: int = 100_000) -> int:
+    """
+    Converts a Sessions export CSV into `out_path` (raw float32 rows) and
+    `out_path.json` (shape + feature order). Returns the number of rows.
+    """
+    rows = 0
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in iter_feature_chunks(csv_path, chunksize=chunksize):
+            f.write(np.ascontiguousarray(chunk).tobytes())
+            rows += len(chunk)
+    os.replace(tmp_path, out_path)
+
+    with open(out_path + ".json", "w") as f:
+        json.dump({"rows": rows, "cols": len(FEATURE_ORDER), "feature_order": FEATURE_ORDER}, f)
+    return rows
+
+
+def open_feature_file(path: str) -> np.memmap:
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    if meta["feature_order"] != FEATURE_ORDER:
+        raise ValueError(f"{path} was built with a different FEATURE_ORDER")
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(meta["rows"], meta["cols"]))
+
+
+def validation_mask(start: int, stop: int, val_fraction: float) -> np.ndarray:
+    """Deterministic per-row split: True for rows in the validation set."""
+    idx = np.arange(start, stop, dtype=np.uint64)
+    bucket = (idx * _HASH_MULT) % _HASH_MOD
+    return bucket < np.uint64(int(val_fraction * 2 ** 32))
+
+
+def iter_chunks(X: np.ndarray, chunk_rows: int, split: str, val_fraction: float):
+    """Yields (start, rows) for one side of the split, one chunk at a time."""
+    for start in range(0, len(X), chunk_rows):
+        stop = min(start + chunk_rows, len(X))
+        mask = validation_mask(start, stop, val_fraction)
+        if split == "train":
+            mask = ~mask
+        rows = np.asarray(X[start:stop])[mask]
+        if len(rows):
+            yield start, rows
+
+
+class MemmapBatchDataset(IterableDataset):
+    """
+    Yields scaled float32 mini-batches from a memory-mapped feature file.
+
+    Chunks are visited in a fresh random order every epoch and shuffled
+    internally, which approximates a full shuffle without loading the data.
+    With DataLoader(num_workers=N) each worker reads a disjoint set of
+    chunks, and prefetch_factor keeps batches queued ahead of the model.
+    """
+
+    def __init__(self, path: str, mean, scale, batch_size: int = 256,
+                 chunk_rows: int = 65_536, split: str = "train",
+                 val_fraction: float = 0.2, shuffle: bool = True, seed: int = 42):
+        self.path = path
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.split = split
+        self.val_fraction = val_fraction
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        # Open per worker: memmaps are cheap and don't pickle their pages
+        X = open_feature_file(self.path)
+        starts = np.arange(0, len(X), self.chunk_rows)
+
+        rng = np.random.default_rng(self.seed + self.epoch)
+        if self.shuffle:
+            rng.shuffle(starts)
+
+        worker = get_worker_info()
+        if worker is not None:
+            starts = starts[worker.id::worker.num_workers]
+            rng = np.random.default_rng([self.seed, self.epoch, worker.id])
+
+        for start in starts:
+            stop = min(start + self.chunk_rows, len(X))
+            mask = validation_mask(start, stop, self.val_fraction)
+            if self.split == "train":
+                mask = ~mask
+            rows = (np.asarray(X[start:stop])[mask] - self.mean) / self.scale
+            if self.shuffle:
+                rng.shuffle(rows)
+
+            for i in range(0, len(rows), self.batch_size):
+                yield torch.from_numpy(np.ascontiguousarray(rows[i:i + self.batch_size]))
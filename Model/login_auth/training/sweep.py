@@ -0,0 +1,314 @@
+"""
+Parallel hyperparameter sweep for the autoencoder and per-user OCSVM.
+
+Features are parsed once from the CSV and written to features.npy in the
+sweep directory, with the CSV's path, size and mtime in features_source.json.
+A different or modified --data is re-parsed. Every worker process maps that file read-only, so nothing
+is re-parsed or copied per config. Configs run on a process pool with a
+fixed thread budget per worker (torch + BLAS), and each finished config is
+appended to results.jsonl. Re-running the same sweep skips configs already
+in that file, so an interrupted sweep resumes where it stopped.
+
+Search space file (JSON):
+{
+  "model": "autoencoder",                # or "ocsvm"
+  "search": "grid",                      # or "random" (+ "samples": N)
+  "params": {
+    "latent_dim": [8, 16, 32],           # list -> choices
+    "learning_rate": {"log_uniform": [1e-4, 1e-2]},
+    "batch_size": [32, 64]
+  }
+}
+
+Usage (from Model/login_auth/training):
+    python sweep.py --space ae_space.json --data final_dataset.csv --workers 4 --threads 2
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+from sklearn.model_selection import train_test_split
+from threadpoolctl import threadpool_limits
+
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+from preprocess_data import preprocess_csv
+
+DEFAULT_SPACES = {
+    "autoencoder": {
+        "search": "grid",
+        "params": {"latent_dim": [8, 16, 32], "learning_rate": [1e-3, 3e-4], "batch_size": [32]},
+    },
+    "ocsvm": {
+        "search": "grid",
+        "params": {"nu": [0.01, 0.05, 0.1], "gamma": ["scale", 0.02, 0.04, 0.08]},
+    },
+}
+
+# Synthetic anomalies: scaled validation rows plus gaussian noise, as in
+# train_autoencoder.py's anomaly test
+NOISE_STD = 0.5
+
+_X = None   # features mapped in each worker by _init_worker
+
+
+# ── Search space ──────────────────────────────────────────────────────────────
+def _sample(spec, rng: random.Random):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    if "log_uniform" in spec:
+        low, high = spec["log_uniform"]
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    if "uniform" in spec:
+        return rng.uniform(*spec["uniform"])
+    if "int" in spec:
+        return rng.randint(*spec["int"])
+    raise ValueError(f"Unknown parameter spec: {spec}")
+
+
+def expand_space(space: dict, seed: int = 0) -> list:
+    params = space["params"]
+    if space.get("search", "grid") == "grid":
+        for name, spec in params.items():
+            if not isinstance(spec, list):
+                raise ValueError(f"Grid search needs a list of values for '{name}'")
+        names = list(params)
+        return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+    rng = random.Random(seed)
+    return [
+        {name: _sample(spec, rng) for name, spec in params.items()}
+        for _ in range(space.get("samples", 20))
+    ]
+
+
+def config_id(model: str, params: dict, data_hash: str) -> str:
+    key = json.dumps({"model": model, "params": params, "data": data_hash}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+# ── Workers ───────────────────────────────────────────────────────────────────
+def _init_worker(features_path: str, threads: int):
+    global _X
+    torch.set_num_threads(threads)
+    threadpool_limits(threads)
+    _X = np.load(features_path, mmap_mode="r")
+
+
+def _latency_ms(fn, rows: np.ndarray, iterations: int = 200) -> float:
+    timings = []
+    for i in range(iterations):
+        row = rows[i % len(rows)][None, :]
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(timings, 50))
+
+
+def _run_autoencoder(params: dict, epochs: int) -> dict:
+    from sklearn.preprocessing import StandardScaler
+    from train_autoencoder import fit_autoencoder
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(_X).astype(np.float32)
+    X_train, X_val = train_test_split(X_scaled, test_size=0.2, random_state=42)
+
+    start = time.perf_counter()
+    wrapper, best_val_loss = fit_autoencoder(
+        X_train, X_val,
+        epochs=params.get("epochs", epochs),
+        batch_size=int(params.get("batch_size", 32)),
+        learning_rate=float(params.get("learning_rate", 1e-3)),
+        latent_dim=int(params.get("latent_dim", 16)),
+        verbose=False,
+    )
+    train_time = time.perf_counter() - start
+
+    model, device = wrapper.model, wrapper.device
+
+    def errors(X):
+        with torch.no_grad():
+            x = torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32)).to(device)
+            return torch.mean((model(x) - x) ** 2, dim=1).cpu().numpy()
+
+    val_errors = errors(X_val)
+    threshold = float(np.percentile(val_errors, 97))
+    fake = X_val + np.random.default_rng(0).normal(0, NOISE_STD, X_val.shape)
+    fake_errors = errors(fake)
+
+    return {
+        "val_loss": best_val_loss,
+        "threshold": threshold,
+        "val_flag_rate": float(np.mean(val_errors > threshold)),
+        "synthetic_detection_rate": float(np.mean(fake_errors > threshold)),
+        "error_separation": float(np.mean(fake_errors) / max(np.mean(val_errors), 1e-12)),
+        "train_time_s": train_time,
+        "latency_p50_ms": _latency_ms(errors, X_val),
+    }
+
+
+def _run_ocsvm(params: dict, epochs: int) -> dict:
+    from train_ocsvm import fit_ocsvm
+
+    X_train, X_val = train_test_split(np.asarray(_X), test_size=0.2, random_state=42)
+
+    gamma = params.get("gamma", "scale")
+    start = time.perf_counter()
+    scaler, model = fit_ocsvm(X_train, nu=float(params.get("nu", 0.05)),
+                              kernel=params.get("kernel", "rbf"), gamma=gamma)
+    train_time = time.perf_counter() - start
+
+    val_scaled = scaler.transform(X_val)
+    fake = val_scaled + np.random.default_rng(0).normal(0, NOISE_STD, val_scaled.shape)
+
+    return {
+        # Owner sessions accepted / synthetic impostors rejected
+        "holdout_accept_rate": float(np.mean(model.predict(val_scaled) == 1)),
+        "synthetic_reject_rate": float(np.mean(model.predict(fake) == -1)),
+        "n_support": int(len(model.support_)),
+        "train_time_s": train_time,
+        "latency_p50_ms": _latency_ms(model.decision_function, val_scaled),
+    }
+
+
+def _run_config(model_name: str, params: dict, epochs: int) -> dict:
+    start = time.perf_counter()
+    if model_name == "autoencoder":
+        metrics = _run_autoencoder(params, epochs)
+    else:
+        metrics = _run_ocsvm(params, epochs)
+    metrics["wall_time_s"] = time.perf_counter() - start
+    metrics["pid"] = os.getpid()
+    return metrics
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+def source_fingerprint(data_path: str) -> dict:
+    stat = os.stat(data_path)
+    return {"path": os.path.abspath(data_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_done(results_path: str) -> set:
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    done.add(json.loads(line)["config_id"])
+    return done
+
+
+def sweep(space: dict, data_path: str, out_dir: str, workers: int, threads: int, epochs: int = 50):
+    model_name = space["model"]
+    os.makedirs(out_dir, exist_ok=True)
+    features_path = os.path.join(out_dir, "features.npy")
+    source_path = os.path.join(out_dir, "features_source.json")
+    results_path = os.path.join(out_dir, "results.jsonl")
+
+    # Parse once; resumed sweeps reuse the saved features if they came from the same CSV
+    source = source_fingerprint(data_path)
+    cached = None
+    if os.path.exists(features_path) and os.path.exists(source_path):
+        with open(source_path) as f:
+            cached = json.load(f)
+    if cached != source:
+        if cached is not None:
+            print(f"{features_path} was built from {cached['path']}; re-parsing {data_path}")
+        X = preprocess_csv(data_path).to_numpy(dtype=np.float32)
+        np.save(features_path, X)
+        with open(source_path, "w") as f:
+            json.dump(source, f)
+    X = np.load(features_path, mmap_mode="r")
+    data_hash = hashlib.sha1(np.ascontiguousarray(X).tobytes()).hexdigest()[:16]
+    print(f"Features: {X.shape} (hash {data_hash})")
+
+    configs = expand_space(space, seed=space.get("seed", 0))
+    done = load_done(results_path)
+    pending = [(config_id(model_name, p, data_hash), p) for p in configs]
+    pending = [(cid, p) for cid, p in pending if cid not in done]
+    print(f"{len(configs)} configs, {len(configs) - len(pending)} cached, {len(pending)} to run "
+          f"on {workers} workers x {threads} threads")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(features_path, threads)) as pool, \
+            open(results_path, "a") as results:
+        futures = {pool.submit(_run_config, model_name, params, epochs): (cid, params)
+                   for cid, params in pending}
+        for future in as_completed(futures):
+            cid, params = futures[future]
+            try:
+                metrics = future.result()
+            except Exception as e:
+                print(f"[WARN] config {params} failed: {e}")
+                continue
+            record = {"config_id": cid, "model": model_name, "data_hash": data_hash, "params": params,
+                      "metrics": metrics}
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+            print(f"done {params} -> {json.dumps({k: round(v, 5) for k, v in metrics.items() if isinstance(v, float)})}")
+
+    report(results_path, model_name, data_hash)
+
+
+def report(results_path: str, model_name: str, data_hash: str | None = None, top: int = 10):
+    records = []
+    with open(results_path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                # Only results on the same features; records without a hash predate it
+                if record["model"] == model_name and (data_hash is None or record.get("data_hash") == data_hash):
+                    records.append(record)
+
+    if model_name == "autoencoder":
+        key = lambda r: -r["metrics"]["synthetic_detection_rate"]
+    else:
+        # Balance owner acceptance against impostor rejection
+        key = lambda r: -(r["metrics"]["holdout_accept_rate"] + r["metrics"]["synthetic_reject_rate"])
+
+    print(f"\n--- TOP {top} {model_name.upper()} CONFIGS ---")
+    for record in sorted(records, key=key)[:top]:
+        metrics = {k: round(v, 4) if isinstance(v, float) else v for k, v in record["metrics"].items()}
+        print(record["params"], metrics)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["autoencoder", "ocsvm"], default="autoencoder",
+                        help="used with the default space when --space is not given")
+    parser.add_argument("--space", help="JSON search space file")
+    parser.add_argument("--data", default="final_dataset.csv")
+    parser.add_argument("--out", default=None, help="sweep directory (default sweeps/<model>)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="torch / BLAS threads per worker")
+    parser.add_argument("--epochs", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    else:
+        space = {"model": args.model, **DEFAULT_SPACES[args.model]}
+
+    sweep(
+        space,
+        data_path=args.data,
+        out_dir=args.out or os.path.join("sweeps", space["model"]),
+        workers=args.workers,
+        threads=args.threads,
+        epochs=args.epochs,
+    )
@@ -3,7 +3,7 @@ import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 from torch.utils.data import DataLoader, TensorDataset
-from app.models.autoencoder import AutoencoderModel
+from app.models.autoencoder import AutoencoderModel, ONNX_FILENAME, ScaledReconstructionError
 import os
 from preprocess_data import preprocess_csv
 from sklearn.model_selection import train_test_split
@@ -16,42 +16,71 @@ sys.path.append(
         os.path.dirname(os.path.abspath(__file__))
     )
 )
-from app.core.config import AUTOENCODER_DIR
+from app.services.drift import add_counts, build_reference, reference_edges, save_reference
+from app.services.mmap_artifacts import export_autoencoder
+from app.services.model_registry import AUTOENCODER_FILES, publish, staging_dir
+from app.services.score_sketch import QuantileSketch
+from streaming_dataset import MemmapBatchDataset, build_feature_file, iter_chunks, open_feature_file
 
 # Imports for normalization
 from sklearn.preprocessing import StandardScaler
 import joblib
+import argparse
+import copy
+import shutil
 
-def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001):
-    """
-    Trains autoencoder model on normal data (human)
-    X_train: data preprocessed by preprocess_data.py
-    """
-    feature_df = preprocess_csv("final_dataset.csv")
-    print("\nDATASET DETAILS")
-    print(feature_df.shape)
-    print(feature_df.columns.tolist())
-    print(feature_df.head())
-
-    X= feature_df.values
-    input_dim = X.shape[1]
+# Validation share for streaming mode (train() uses train_test_split(test_size=0.2))
+VAL_FRACTION = 0.2
 
-    # Confirm save directory
-    os.makedirs(AUTOENCODER_DIR, exist_ok=True)
 
-    # Fit standard scalar for human data
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    joblib.dump(scaler, os.path.join(AUTOENCODER_DIR, "scaler.pkl"))
+def export_onnx(model: nn.Module, scaler, input_dim: int, model_dir: str) -> str:
+    """
+    Exports the trained nn.Sequential with the StandardScaler folded in.
+    Graph: features (N, input_dim) raw float32 -> score (N,) reconstruction error
+    Served by AutoencoderModel(backend="onnx").
+    """
+    wrapper = ScaledReconstructionError(model, scaler.mean_, scaler.scale_).cpu().eval()
+    example = torch.zeros(1, input_dim, dtype=torch.float32)
+    out_path = os.path.join(model_dir, ONNX_FILENAME)
+
+    torch.onnx.export(
+        wrapper,
+        (example,),
+        out_path,
+        input_names=["features"],
+        output_names=["score"],
+        dynamic_axes={"features": {0: "batch"}, "score": {0: "batch"}},
+        opset_version=17,
+        dynamo=False,
+    )
+    return out_path
+
+
+def fit_autoencoder(
+    X_train: np.ndarray,
+    X_val: np.ndarray,
+    epochs: int = 50,
+    batch_size: int = 32,
+    learning_rate: float = 0.001,
+    latent_dim: int = 16,
+    patience: int = 5,
+    checkpoint_path: str | None = None,
+    verbose: bool = True,
+):
+    """
+    Training loop with early stopping on already scaled float32 arrays.
+    Returns (model_wrapper, best_val_loss) with the best weights loaded.
 
-    # Train/test split
-    X_train, X_val = train_test_split(X_scaled, test_size=0.2, random_state=42)
-    train_dataset = TensorDataset(torch.tensor(X_train, dtype=torch.float32))
+    checkpoint_path: save the best weights there on every improvement
+                     (None keeps them in memory, used by the sweep runner)
+    """
+    # from_numpy shares memory with the split arrays instead of copying
+    train_dataset = TensorDataset(torch.from_numpy(X_train))
     train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_tensor = torch.tensor(X_val, dtype=torch.float32)
+    val_tensor = torch.from_numpy(X_val)
 
     # Initialize model
-    model_wrapper = AutoencoderModel(input_dim=input_dim)
+    model_wrapper = AutoencoderModel(input_dim=X_train.shape[1], latent_dim=latent_dim)
     model = model_wrapper.model # actual nn.Sequential model
     device = model_wrapper.device
     model.to(device)
@@ -64,12 +93,8 @@ def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001):
     # Reconstruction loss
     criterion = nn.MSELoss()
 
-    # Prepare dataset
-    # Wrap in TensorDataset
-    dataset = TensorDataset(torch.tensor(X_scaled, dtype=torch.float32))
-
     best_val_loss = float("inf")
-    patience = 5
+    best_state = None
     patience_counter = 0
     for epoch in range(epochs):
         model.train()
@@ -94,25 +119,77 @@ def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001):
             val_recon = model(val_tensor)
             val_loss = criterion(val_recon, val_tensor).item()
 
-        print(f"Epoch [{epoch + 1}/{epochs}] "
-              f"Train Loss: {avg_train_loss:.6f} | Val Loss: {val_loss:.6f}")
+        if verbose:
+            print(f"Epoch [{epoch + 1}/{epochs}] "
+                  f"Train Loss: {avg_train_loss:.6f} | Val Loss: {val_loss:.6f}")
 
         # --- Early stopping logic ---
         if val_loss < best_val_loss:
             best_val_loss = val_loss
             patience_counter = 0
-            torch.save(model.state_dict(), os.path.join(AUTOENCODER_DIR, "best_autoencoder.pt"))
+            if checkpoint_path:
+                torch.save(model.state_dict(), checkpoint_path)
+            else:
+                best_state = copy.deepcopy(model.state_dict())
         else:
             patience_counter += 1
 
         if patience_counter >= patience:
-            print("Early stopping triggered.")
+            if verbose:
+                print("Early stopping triggered.")
             break
 
     # --- Load best model ---
-    model.load_state_dict(torch.load(os.path.join(AUTOENCODER_DIR, "best_autoencoder.pt")))
+    # NaN / inf validation loss never compares lower, so nothing was kept
+    if best_val_loss == float("inf"):
+        raise ValueError("validation loss never improved (NaN or inf); no weights to keep")
+    if checkpoint_path:
+        best_state = torch.load(checkpoint_path)
+    model.load_state_dict(best_state)
     model.eval()
 
+    return model_wrapper, best_val_loss
+
+
+def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001, stage: str = "production"):
+    """
+    Trains autoencoder model on normal data (human)
+    X_train: data preprocessed by preprocess_data.py
+    """
+    feature_df = preprocess_csv("final_dataset.csv")
+    print("\nDATASET DETAILS")
+    print(feature_df.shape)
+    print(feature_df.columns.tolist())
+    print(feature_df.head())
+
+    X = feature_df.to_numpy(dtype=np.float32)
+    input_dim = X.shape[1]
+    del feature_df
+
+    # Confirm save directory
+    model_dir = staging_dir("autoencoder")
+
+    # Fit standard scalar for human data
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X).astype(np.float32, copy=False)
+    joblib.dump(scaler, os.path.join(model_dir, "scaler.pkl"))
+
+    # Raw feature histograms for /monitoring/drift
+    save_reference(build_reference(X), model_dir)
+    del X
+
+    # Train/test split
+    X_train, X_val = train_test_split(X_scaled, test_size=0.2, random_state=42)
+    del X_scaled
+    model_wrapper, best_val_loss = fit_autoencoder(
+        X_train, X_val,
+        epochs=epochs, batch_size=batch_size, learning_rate=learning_rate,
+        checkpoint_path=os.path.join(model_dir, "best_autoencoder.pt"),
+    )
+    model = model_wrapper.model
+    device = model_wrapper.device
+    val_tensor = torch.from_numpy(X_val).to(device)
+
     # --- Compute reconstruction errors on validation set ---
     with torch.no_grad():
         val_recon = model(val_tensor)
@@ -128,7 +205,7 @@ def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001):
 
     # --- Threshold (more stable now) ---
     threshold = np.percentile(val_errors, 97)
-    np.save(os.path.join(AUTOENCODER_DIR, "threshold.npy"), threshold)
+    np.save(os.path.join(model_dir, "threshold.npy"), threshold)
 
     print(f"\nSelected threshold (97th percentile): {threshold}")
 
@@ -154,9 +231,218 @@ def train(epochs: int = 50, batch_size: int = 32, learning_rate: float = 0.001):
     print("Fake anomaly mean error:", np.mean(fake_errors))
 
     # --- Save final model ---
-    torch.save(model.state_dict(), os.path.join(AUTOENCODER_DIR, "autoencoder.pt"))
+    torch.save(model.state_dict(), os.path.join(model_dir, "autoencoder.pt"))
+
+    # Memory-mappable copy shared across uvicorn workers
+    export_autoencoder(model_dir)
+
+    # --- ONNX export (onnxruntime CPU backend) ---
+    print(f"ONNX model exported to: {export_onnx(model, scaler, input_dim, model_dir)}")
+
+    # --- Publish an immutable version; running servers hot-reload it ---
+    version_dir = publish("autoencoder", model_dir, AUTOENCODER_FILES,
+                          threshold=float(threshold), params={"latent_dim": model_wrapper.latent_dim},
+                          stage=stage)
+    print(f"Registry version: {version_dir}")
+    shutil.rmtree(model_dir, ignore_errors=True)
 
     print("\nTraining completed. Model, scaler, and threshold saved.")
 
+
+def _chunk_errors(model, X, chunk_rows: int, mean, scale, device, noise_std: float = 0.0):
+    """Per-row reconstruction errors of the validation split, one chunk at a time."""
+    rng = np.random.default_rng(0)
+    with torch.no_grad():
+        for _, rows in iter_chunks(X, chunk_rows, "val", VAL_FRACTION):
+            scaled = (rows - mean) / scale
+            if noise_std:
+                scaled = scaled + rng.normal(0, noise_std, scaled.shape).astype(np.float32)
+            x = torch.from_numpy(np.ascontiguousarray(scaled, dtype=np.float32)).to(device)
+            yield torch.mean((model(x) - x) ** 2, dim=1).cpu().numpy()
+
+
+def train_streaming(
+    feature_path: str,
+    epochs: int = 50,
+    batch_size: int = 256,
+    learning_rate: float = 0.001,
+    chunk_rows: int = 65_536,
+    num_workers: int | None = None,
+    prefetch_factor: int = 4,
+    stage: str = "production",
+):
+    """
+    Out-of-core variant of train() for datasets that don't fit in memory.
+
+    feature_path: a Sessions export CSV (converted once to a float32 feature
+                  file next to it) or an existing feature file built by
+                  streaming_dataset.build_feature_file.
+
+    RAM stays bounded by chunk_rows: the scaler is fit with partial_fit
+    passes, mini-batches stream from a memory-mapped file through DataLoader
+    workers, and validation loss / threshold are computed chunk by chunk
+    (the 97th percentile comes from a quantile sketch, not a sorted array).
+    """
+    if feature_path.endswith(".csv"):
+        csv_path = feature_path
+        feature_path = os.path.splitext(csv_path)[0] + ".f32"
+        rows = build_feature_file(csv_path, feature_path)
+        print(f"Built feature file {feature_path} ({rows} rows)")
+
+    X = open_feature_file(feature_path)
+    input_dim = X.shape[1]
+    print("\nDATASET DETAILS")
+    print(X.shape)
+
+    model_dir = staging_dir("autoencoder")
+
+    # Use every core: DataLoader workers read / scale, the rest run the model
+    cpu_count = os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = min(4, max(0, cpu_count // 4))
+    torch.set_num_threads(max(1, cpu_count - num_workers))
+
+    # --- Scaler and drift reference: partial passes over the whole file (same data as train()) ---
+    # Drift bin edges come from the first chunk's quantiles; counts cover every row.
+    scaler = StandardScaler()
+    reference = reference_edges(np.asarray(X[:chunk_rows]))
+    for start in range(0, len(X), chunk_rows):
+        chunk = np.asarray(X[start:start + chunk_rows])
+        scaler.partial_fit(chunk)
+        add_counts(reference, chunk)
+    joblib.dump(scaler, os.path.join(model_dir, "scaler.pkl"))
+    save_reference(reference, model_dir)
+    mean = scaler.mean_.astype(np.float32)
+    scale = scaler.scale_.astype(np.float32)
+
+    train_dataset = MemmapBatchDataset(
+        feature_path, mean, scale,
+        batch_size=batch_size, chunk_rows=chunk_rows,
+        split="train", val_fraction=VAL_FRACTION,
+    )
+    loader_kwargs = {"batch_size": None, "num_workers": num_workers}
+    if num_workers > 0:
+        loader_kwargs["prefetch_factor"] = prefetch_factor
+
+    model_wrapper = AutoencoderModel(input_dim=input_dim)
+    model = model_wrapper.model
+    device = model_wrapper.device
+    model.to(device)
+
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    criterion = nn.MSELoss()
+
+    best_val_loss = float("inf")
+    patience = 5
+    patience_counter = 0
+    for epoch in range(epochs):
+        model.train()
+        # Workers are re-created every epoch and pick up the new shuffle seed
+        train_dataset.epoch = epoch
+        total_loss = 0.0
+        n_batches = 0
+
+        for x in DataLoader(train_dataset, **loader_kwargs):
+            x = x.to(device)
+
+            optimizer.zero_grad()
+            reconstruction = model(x)
+            loss = criterion(reconstruction, x)
+            loss.backward()
+            optimizer.step()
+
+            total_loss += loss.item()
+            n_batches += 1
+
+        avg_train_loss = total_loss / max(n_batches, 1)
+
+        # --- Validation (chunked mean over all elements, same as MSELoss) ---
+        model.eval()
+        sq_sum = 0.0
+        n_rows = 0
+        for errors in _chunk_errors(model, X, chunk_rows, mean, scale, device):
+            sq_sum += float(errors.sum())
+            n_rows += len(errors)
+        val_loss = sq_sum / max(n_rows, 1)
+
+        print(f"Epoch [{epoch + 1}/{epochs}] "
+              f"Train Loss: {avg_train_loss:.6f} | Val Loss: {val_loss:.6f}")
+
+        if val_loss < best_val_loss:
+            best_val_loss = val_loss
+            patience_counter = 0
+            torch.save(model.state_dict(), os.path.join(model_dir, "best_autoencoder.pt"))
+        else:
+            patience_counter += 1
+
+        if patience_counter >= patience:
+            print("Early stopping triggered.")
+            break
+
+    model.load_state_dict(torch.load(os.path.join(model_dir, "best_autoencoder.pt")))
+    model.eval()
+
+    # --- Threshold from a streaming quantile sketch of validation errors ---
+    sketch = QuantileSketch(relative_accuracy=0.001, max_bins=8192)
+    for errors in _chunk_errors(model, X, chunk_rows, mean, scale, device):
+        sketch.add_many(errors)
+
+    print("\n--- RECONSTRUCTION ERROR STATS (VALIDATION) ---")
+    print("Count:", sketch.count)
+    print("Mean:", sketch.sum / max(sketch.count, 1))
+    print("Min:", sketch.min)
+    print("Max:", sketch.max)
+    print("Percentiles:", [sketch.quantile(p / 100) for p in (50, 75, 90, 95, 97, 99)])
+
+    threshold = np.float64(sketch.quantile(0.97))
+    np.save(os.path.join(model_dir, "threshold.npy"), threshold)
+    print(f"\nSelected threshold (97th percentile): {threshold}")
+
+    # --- Synthetic anomaly test (chunked) ---
+    fake_sum = 0.0
+    fake_rows = 0
+    for errors in _chunk_errors(model, X, chunk_rows, mean, scale, device, noise_std=0.5):
+        fake_sum += float(errors.sum())
+        fake_rows += len(errors)
+
+    print("\n--- ANOMALY TEST ---")
+    print("Normal mean error:", sketch.sum / max(sketch.count, 1))
+    print("Fake anomaly mean error:", fake_sum / max(fake_rows, 1))
+
+    torch.save(model.state_dict(), os.path.join(model_dir, "autoencoder.pt"))
+    export_autoencoder(model_dir)
+    print(f"ONNX model exported to: {export_onnx(model, scaler, input_dim, model_dir)}")
+
+    version_dir = publish("autoencoder", model_dir, AUTOENCODER_FILES,
+                          threshold=float(threshold), params={"latent_dim": model_wrapper.latent_dim},
+                          stage=stage)
+    print(f"Registry version: {version_dir}")
+    shutil.rmtree(model_dir, ignore_errors=True)
+
+    print("\nStreaming training completed. Model, scaler, and threshold saved.")
+
+
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the autoencoder on human sessions")
+    parser.add_argument("--streaming", action="store_true",
+                        help="out-of-core training from a CSV export or feature file")
+    parser.add_argument("--data", default="final_dataset.csv")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=65_536)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stage", choices=["production", "candidate"], default="production",
+                        help="publish as a shadow-scored candidate instead of serving it")
+    args = parser.parse_args()
+
+    if args.streaming:
+        train_streaming(
+            args.data,
+            epochs=args.epochs,
+            batch_size=args.batch_size or 256,
+            chunk_rows=args.chunk_rows,
+            num_workers=args.workers,
+            stage=args.stage,
+        )
+    else:
+        train(epochs=args.epochs, batch_size=args.batch_size or 32, stage=args.stage)
\ No newline at end of file
@@ -0,0 +1,64 @@
+import argparse
+import numpy as np
+import os
+import joblib
+from sklearn.preprocessing import StandardScaler
+
+import sys
+# Allow training script to access app/
+sys.path.append(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+from app.core.config import KNN_K, USERS_MODEL_DIR
+from app.models.knn import KNNModel
+from preprocess_data import preprocess_csv
+from app.services.feature_extractor import FEATURE_ORDER
+
+
+def train(file_path: str, user_id: str, k: int = KNN_K, percentile: float = 97.0):
+    """
+    Builds the nearest-neighbour verifier for a specific registered user.
+
+    X_train: historical session features vector for one user
+    k: neighbours averaged per score
+    percentile: of the training rows' own k-NN distances, used as threshold
+
+    Serving appends accepted sessions to the index (USER_VERIFIER=knn), so
+    this only needs to run again to reset the index or refit the scaler.
+    """
+
+    # Saved to saved_models/user/user_<id>/knn
+    feature_df = preprocess_csv(file_path)
+    print("\nDATASET DETAILS")
+    print(feature_df.shape)
+
+    if len(feature_df) <= k:
+        raise ValueError(f"Need more than k={k} sessions, got {len(feature_df)}.")
+
+    X = feature_df.values.astype(np.float32)
+
+    model = KNNModel(user_id=user_id, model_dir=os.path.join(USERS_MODEL_DIR, f"user_{user_id}", "knn"), k=k)
+    loo = model.fit(X, StandardScaler().fit(X), percentile=percentile)
+
+    print("Training distance percentiles:", np.percentile(loo, [50, 75, 90, 95, 97, 99]).round(4).tolist())
+    print(f"Selected threshold ({percentile:g}th percentile): {model.threshold}")
+
+    model.save()
+    joblib.dump(model.scaler, os.path.join(model.model_dir, "scaler.pkl"))
+    joblib.dump(FEATURE_ORDER, os.path.join(model.model_dir, "feature_order.pkl"))
+
+    print("\nTraining completed.")
+    print(f"Index of {len(model)} sessions saved to: {model.model_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a per-user KNN verifier")
+    parser.add_argument("--data", default="2fa_data.csv")
+    parser.add_argument("--user-id", default="nolanpark")
+    parser.add_argument("--k", type=int, default=KNN_K)
+    parser.add_argument("--percentile", type=float, default=97.0)
+    args = parser.parse_args()
+
+    train(args.data, args.user_id, k=args.k, percentile=args.percentile)
@@ -1,6 +1,8 @@
+import argparse
 import numpy as np
 import os
 import joblib
+import shutil
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import OneClassSVM
 
@@ -11,21 +13,44 @@ sys.path.append(
         os.path.dirname(os.path.abspath(__file__))
     )
 )
-from app.core.config import USERS_MODEL_DIR
 from preprocess_data import preprocess_csv
 from app.services.feature_extractor import FEATURE_ORDER
+from app.services.mmap_artifacts import export_ocsvm
+from app.services.model_registry import OCSVM_FILES, publish, staging_dir
 
-def train(file_path: str, user_id: str, nu: float = 0.05, kernel: str = "rbf", gamma: str = "scale"):
+def fit_ocsvm(X: np.ndarray, nu: float = 0.05, kernel: str = "rbf", gamma="scale"):
+    """
+    Scales X and fits the One-Class SVM. Returns (scaler, model).
+    Shared by train() and the hyperparameter sweep runner.
+    """
+    # Scale data
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+
+    # Train OCSVM
+    model = OneClassSVM(
+        nu=nu,
+        kernel=kernel,
+        gamma=gamma
+    )
+
+    model.fit(X_scaled)
+    return scaler, model
+
+
+def train(file_path: str, user_id: str, nu: float = 0.05, kernel: str = "rbf", gamma: str | float = "scale",
+          stage: str = "production"):
     """
     Trains One-Class SVM for a specific registered user.
 
     X_train: historical session features vector for one user
     nu: upper bound on fraction of anomalies
     kernel: 'rbf' for non-linear boundary since biometric data is rarely linear
-    gamma: kernel coefficient for rbf kernel
+    gamma: kernel coefficient for rbf kernel ("scale", "auto" or a float)
+    stage: "candidate" publishes a version that is not served until promoted
     """
 
-    # Models are saved to saved_models/users/user_<id>
+    # Artifacts are staged, then published to saved_models/registry/user/user_<id>
     feature_df = preprocess_csv(file_path)
     print("\nDATASET DETAILS")
     print(feature_df.shape)
@@ -36,37 +61,44 @@ def train(file_path: str, user_id: str, nu: float = 0.05, kernel: str = "rbf", g
 
     X = feature_df.values
 
-    # Save to directory
-    user_dir = os.path.join(USERS_MODEL_DIR, f"user_{user_id}")
-    os.makedirs(user_dir, exist_ok=True)
+    # Save to a staging directory, never to the legacy saved_models/user/user_<id>
+    user_dir = staging_dir("ocsvm", user_id)
 
-    # Scale data
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    gamma = 1 / X_scaled.shape[1]
+    scaler, model = fit_ocsvm(X, nu=nu, kernel=kernel, gamma=gamma)
 
     joblib.dump(scaler, os.path.join(user_dir, "scaler.pkl"))
 
     # Save feature order
     joblib.dump(FEATURE_ORDER, os.path.join(user_dir, "feature_order.pkl"))
 
-    # Train OCSVM
-    model = OneClassSVM(
-        nu=nu,
-        kernel=kernel,
-        gamma=gamma
-    )
+    joblib.dump(model, os.path.join(user_dir, "ocsvm.pkl"))
 
-    model.fit(X_scaled)
+    # Memory-mappable copy shared across uvicorn workers (rbf only; other
+    # kernels are served from ocsvm.pkl)
+    if kernel == "rbf":
+        export_ocsvm(user_dir)
+    else:
+        print(f"[WARN] Skipping mmap export: only rbf kernels can be memory-mapped, got '{kernel}'")
 
-    joblib.dump(model, os.path.join(user_dir, "ocsvm.pkl"))
+    # Publish an immutable version; running servers hot-reload it
+    version_dir = publish("ocsvm", user_dir, OCSVM_FILES, user_id=user_id,
+                          params={"nu": nu, "kernel": kernel, "gamma": gamma}, stage=stage)
+    shutil.rmtree(user_dir, ignore_errors=True)
 
     print("\nTraining completed.")
-    print(f"Model saved to: {user_dir}")
+    print(f"Registry version: {version_dir}")
 
 
 if __name__ == "__main__":
-    train(
-        file_path="2fa_data.csv",
-        user_id="nolanpark"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train a per-user One-Class SVM")
+    parser.add_argument("--data", default="2fa_data.csv")
+    parser.add_argument("--user-id", default="nolanpark")
+    parser.add_argument("--nu", type=float, default=0.05)
+    parser.add_argument("--kernel", default="rbf")
+    parser.add_argument("--gamma", default="scale", help='"scale", "auto" or a float')
+    parser.add_argument("--stage", choices=["production", "candidate"], default="production",
+                        help="publish as a candidate instead of serving it")
+    args = parser.parse_args()
+
+    gamma = args.gamma if args.gamma in ("scale", "auto") else float(args.gamma)
+    train(args.data, args.user_id, nu=args.nu, kernel=args.kernel, gamma=gamma, stage=args.stage)